@@ -57,15 +57,84 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'indigital.middleware.CompressaoMiddleware',
+    'indigital.middleware.MinificarHTMLMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'indigital.middleware.LimiteRequisicoesMiddleware',
+    'indigital.middleware.PerfilamentoMiddleware',
+    'indigital.middleware.ConsultasRepetidasMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "allauth.account.middleware.AccountMiddleware",
 ]
 
+# Prefixos de path que não passam pela compressão (gzip/brotli) ou pela
+# minificação de HTML feitas em indigital.middleware
+COMPRESSAO_PATHS_IGNORADOS = []
+MINIFICAR_HTML_PATHS_IGNORADOS = ["/admin/"]
+
+# Limite de requisições por usuário (ou IP, sem login) em cada rota
+# (indigital.middleware.LimiteRequisicoesMiddleware): nome da rota -> (capacidade do
+# balde, fichas repostas por segundo). Os baldes ficam no cache, que precisa ser
+# compartilhado entre os workers (REDIS_URL); sem isso, fora do ambiente local, o
+# middleware se desliga.
+LIMITE_REQUISICOES = {
+    "horarios": (30, 1),
+    "horarios_aba": (30, 1),
+    "reservar_laboratorio": (10, 0.2),
+    "entrar_fila_espera": (10, 0.2),
+    "reservar_carrinho": (5, 0.1),
+}
+# Cabeçalho (chave do request.META) com o IP do cliente, definido pelo nginx
+# (proxy_set_header X-Real-IP $remote_addr): atrás do socket unix o REMOTE_ADDR vem vazio
+CABECALHO_IP_CLIENTE = os.getenv("CABECALHO_IP_CLIENTE", "HTTP_X_REAL_IP")
+
+# Workers do gunicorn (entrypoint.sh usa o mesmo WEB_WORKERS)
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "3"))
+# Sala de espera: requisições simultâneas permitidas nas rotas de reserva. Essas views
+# são síncronas: com workers uvicorn (ASGI, o padrão) cada worker roda as views síncronas
+# em uma única thread, uma por vez, e continua aceitando conexões; acima de uma por
+# worker elas só fazem fila dentro do worker, atrás das outras páginas. O padrão deixa
+# uma thread livre para o resto do site. 0 desativa.
+SALA_ESPERA_MAXIMO = int(os.getenv("SALA_ESPERA_MAXIMO", max(1, WEB_WORKERS - 1)))
+SALA_ESPERA_ROTAS = ["horarios", "horarios_aba", "reservar_laboratorio", "entrar_fila_espera", "reservar_carrinho"]
+# Tempo máximo que uma vaga fica ocupada (o mesmo --timeout do gunicorn)
+SALA_ESPERA_TIMEOUT = 60
+
+# Perfis de requisições gerados sob demanda por superusuários (indigital.middleware.PerfilamentoMiddleware).
+# Só os PERFILAMENTO_MAXIMO mais recentes são mantidos.
+if BUILD_ENV == "local":
+    PERFILAMENTO_DIR = BASE_DIR / "perfis"
+else:
+    PERFILAMENTO_DIR = os.getenv("PERFILAMENTO_DIR", "/tmp/indigital-perfis")
+PERFILAMENTO_MAXIMO = 100
+
+# Detector de N+1 (indigital.middleware.ConsultasRepetidasMiddleware): SELECTs com a mesma
+# forma repetidos mais de CONSULTAS_REPETIDAS_LIMITE vezes em uma requisição são registrados
+# no log ("log") ou geram erro ("erro", ligado pelo executor de testes). None desliga.
+CONSULTAS_REPETIDAS_MODO = "log" if DEBUG else None
+CONSULTAS_REPETIDAS_LIMITE = 5
+# Nomes de rotas que não passam pela verificação
+CONSULTAS_REPETIDAS_IGNORADAS = []
+
+# Aprovação automática das reservas pendentes (indigital.aprovacao_automatica), na
+# solicitação e pelo comando aprovar_reservas. Desligada por padrão: a aprovação pelos
+# administradores continua sendo o fluxo normal até que APROVACAO_AUTOMATICA=True.
+# Aprova por ordem de solicitação enquanto houver vagas. Ficam pendentes, para os
+# administradores, as reservas de usuários com fração de faltas acima de
+# APROVACAO_AUTOMATICA_MAXIMO_FALTAS (depois de APROVACAO_AUTOMATICA_MINIMO_FREQUENCIAS
+# frequências registradas) ou que já têm APROVACAO_AUTOMATICA_COTA_SEMANAL reservas
+# aprovadas na semana do horário. 0 desliga a cota.
+APROVACAO_AUTOMATICA = os.getenv("APROVACAO_AUTOMATICA", "False").lower() == "true"
+APROVACAO_AUTOMATICA_MAXIMO_FALTAS = float(os.getenv("APROVACAO_AUTOMATICA_MAXIMO_FALTAS", "0.3"))
+APROVACAO_AUTOMATICA_MINIMO_FREQUENCIAS = int(os.getenv("APROVACAO_AUTOMATICA_MINIMO_FREQUENCIAS", "3"))
+APROVACAO_AUTOMATICA_COTA_SEMANAL = int(os.getenv("APROVACAO_AUTOMATICA_COTA_SEMANAL", "5"))
+
+TEST_RUNNER = "indigital.executor_testes.ExecutorTestes"
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -109,6 +178,26 @@ else:
         }
     }
 
+# Cache (fragmentos de template, etc.)
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+if BUILD_ENV != "local" and os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            },
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -135,6 +224,7 @@ if BUILD_ENV == "production":
     EMAIL_USE_TLS = True
     EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER")
     EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
+    DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", EMAIL_HOST_USER)
 else:
     EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
@@ -216,6 +306,22 @@ else:
     STATIC_ROOT = os.getenv("STATIC_ROOT")
     MEDIA_ROOT = os.getenv("MEDIA_ROOT")
 
+# Fora do ambiente local, o collectstatic gera nomes com hash (cache de longo prazo)
+# e cópias .gz/.br de cada arquivo, servidas diretamente pelo nginx
+if BUILD_ENV == "local":
+    STATICFILES_BACKEND = "django.contrib.staticfiles.storage.StaticFilesStorage"
+else:
+    STATICFILES_BACKEND = "indigital.storage.ManifestComprimidoStorage"
+
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": STATICFILES_BACKEND,
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
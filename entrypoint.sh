@@ -12,17 +12,34 @@ echo "PostgreSQL is ready!"
 echo "Running database migrations..."
 python manage.py migrate --noinput
 
+# Verificação de integridade: contadores de vagas dos horários abertos contra as reservas
+# aprovadas (só informa; a correção é "python manage.py reconciliar_vagas")
+echo "Checking seat counters..."
+python manage.py reconciliar_vagas --verificar --abertas || echo "Seat counter drift found, see above."
+
 echo "Collecting static files..."
 python manage.py collectstatic --noinput
 
 echo "Setting socket directory permissions..."
 chmod 770 /run/sockets
 
-echo "Starting Gunicorn..."
+# ASGI (workers uvicorn) by default, so async views do not hold a worker while
+# waiting on the database. SERVER_MODE=wsgi goes back to the sync workers, e.g. to
+# compare both with "python manage.py medir_concorrencia".
+if [ "${SERVER_MODE:-asgi}" = "wsgi" ]; then
+	WORKER_CLASS="sync"
+	APPLICATION="config.wsgi:application"
+else
+	WORKER_CLASS="uvicorn_worker.UvicornWorker"
+	APPLICATION="config.asgi:application"
+fi
+
+echo "Starting Gunicorn ($WORKER_CLASS)..."
 exec gunicorn --bind unix:/run/sockets/indigital.sock \
-	--workers 3 \
+	--workers "${WEB_WORKERS:-3}" \
+	--worker-class "$WORKER_CLASS" \
 	--timeout 60 \
     --umask 007 \
 	--access-logfile - \
 	--error-logfile - \
-	config.wsgi:application
+	"$APPLICATION"
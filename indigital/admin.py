@@ -1,6 +1,8 @@
 from django.contrib import admin
-from .models import Laboratorio, Reserva, Disponibilidade
+from .models import Laboratorio, Reserva, Disponibilidade, Notificacao, UtilizacaoDiaria
 
 admin.site.register(Reserva)
 admin.site.register(Laboratorio)
-admin.site.register(Disponibilidade)
\ No newline at end of file
+admin.site.register(Disponibilidade)
+admin.site.register(Notificacao)
+admin.site.register(UtilizacaoDiaria)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class IndigitalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'indigital'
+
+    def ready(self):
+        import indigital.signals
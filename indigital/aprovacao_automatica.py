@@ -0,0 +1,145 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from .models import Disponibilidade, EstatisticaUsuario, EventoReserva, Reserva
+from .notificacoes import notificar_reservas
+
+
+def inicio_semana(data):
+    """Segunda-feira da semana da data (a mesma semana de TruncWeek)."""
+    return data - timedelta(days=data.weekday())
+
+
+def faltas_demais(estatistica):
+    """Se a fração de faltas do usuário passa do limite, com frequências suficientes para avaliar."""
+    if estatistica is None:
+        return False
+    registradas = estatistica.presentes + estatistica.faltas
+    if not registradas or registradas < settings.APROVACAO_AUTOMATICA_MINIMO_FREQUENCIAS:
+        return False
+    return estatistica.faltas / registradas > settings.APROVACAO_AUTOMATICA_MAXIMO_FALTAS
+
+
+def aprovadas_por_semana(usuario_ids, semanas):
+    """Reservas aprovadas de cada (usuário, segunda-feira da semana), em uma consulta."""
+    return Counter({
+        (item['usuario_id'], item['semana']): item['total']
+        for item in Reserva.objects.filter(
+            usuario_id__in=usuario_ids,
+            status_aprovacao='A',
+            disponibilidade__data__gte=min(semanas),
+            disponibilidade__data__lt=max(semanas) + timedelta(days=7),
+        ).annotate(semana=TruncWeek('disponibilidade__data'))
+        .values('usuario_id', 'semana').annotate(total=Count('id')).order_by()
+    })
+
+
+def aprovar_pendentes(disponibilidade_ids=None, agora=None):
+    """
+    Aplica as regras de aprovação automática às reservas pendentes de horários que
+    ainda não começaram (todas, ou só as dos horários informados), em uma transação.
+
+    As reservas são avaliadas por ordem de solicitação e aprovadas enquanto o horário
+    tiver vagas, exceto as de usuários com faltas demais ou com a cota semanal já
+    atingida, que continuam pendentes com o motivo em motivo_pendencia. Vagas,
+    contadores de faltas e aprovadas por semana são lidos com uma consulta cada, e as
+    mudanças são gravadas em lote (bulk_update das reservas e das vagas, notificações
+    com bulk_create). Reservas travadas por outra transação ficam para a próxima vez.
+
+    Retorna um dicionário com a lista de reservas aprovadas e um Counter das que
+    continuam pendentes, por motivo.
+    """
+    resultado = {'aprovadas': [], 'pendentes': Counter()}
+    if not settings.APROVACAO_AUTOMATICA:
+        return resultado
+
+    agora = agora or timezone.now()
+    cota = settings.APROVACAO_AUTOMATICA_COTA_SEMANAL
+    with transaction.atomic():
+        pendentes = Reserva.objects.filter(
+            status_aprovacao='P', disponibilidade__encerrada=False, disponibilidade__inicio_em__gt=agora
+        )
+        if disponibilidade_ids is not None:
+            pendentes = pendentes.filter(disponibilidade_id__in=disponibilidade_ids)
+        pendentes = list(
+            pendentes.select_for_update(skip_locked=True, of=('self',))
+            .select_related('usuario', 'disponibilidade__laboratorio')
+            .order_by('data_solicitacao', 'id')
+        )
+        if not pendentes:
+            return resultado
+
+        # As pendentes acima ficam travadas até o commit: aprovações e rejeições manuais
+        # (fila_espera.travar_pendente) esperam esta transação e depois já não as encontram
+        # pendentes. As vagas são lidas com a linha do horário travada, para o decremento
+        # condicional das aprovações manuais de outras reservas não se perder no bulk_update
+        vagas = dict(
+            Disponibilidade.objects.select_for_update()
+            .filter(id__in={reserva.disponibilidade_id for reserva in pendentes})
+            .values_list('id', 'vagas')
+        )
+        usuario_ids = {reserva.usuario_id for reserva in pendentes}
+        estatisticas = {e.usuario_id: e for e in EstatisticaUsuario.objects.filter(usuario_id__in=usuario_ids)}
+        aprovadas_semana = Counter()
+        if cota:
+            aprovadas_semana = aprovadas_por_semana(
+                usuario_ids, {inicio_semana(reserva.disponibilidade.data) for reserva in pendentes}
+            )
+
+        aprovadas = []
+        alteradas = []
+        disponibilidades = {}
+        for reserva in pendentes:
+            # Reservas do mesmo horário compartilham o objeto, para gravar as vagas uma vez
+            disponibilidade = disponibilidades.setdefault(reserva.disponibilidade_id, reserva.disponibilidade)
+            reserva.disponibilidade = disponibilidade
+            semana = (reserva.usuario_id, inicio_semana(disponibilidade.data))
+            if faltas_demais(estatisticas.get(reserva.usuario_id)):
+                motivo = 'faltas'
+            elif cota and aprovadas_semana[semana] >= cota:
+                motivo = 'cota_semanal'
+            elif vagas.get(disponibilidade.id, 0) <= 0:
+                motivo = 'sem_vagas'
+            else:
+                motivo = ''
+
+            if motivo:
+                resultado['pendentes'][motivo] += 1
+                if reserva.motivo_pendencia != motivo:
+                    reserva.motivo_pendencia = motivo
+                    alteradas.append(reserva)
+                continue
+
+            vagas[disponibilidade.id] -= 1
+            aprovadas_semana[semana] += 1
+            reserva.status_aprovacao = 'A'
+            reserva.motivo_pendencia = ''
+            reserva.atualizado_em = agora
+            aprovadas.append(reserva)
+
+        if alteradas:
+            Reserva.objects.bulk_update(alteradas, ['motivo_pendencia'])
+        if aprovadas:
+            Reserva.objects.bulk_update(aprovadas, ['status_aprovacao', 'motivo_pendencia', 'atualizado_em'])
+            ocupadas = list({reserva.disponibilidade_id: reserva.disponibilidade for reserva in aprovadas}.values())
+            for disponibilidade in ocupadas:
+                disponibilidade.vagas = vagas[disponibilidade.id]
+                disponibilidade.atualizado_em = agora
+            Disponibilidade.objects.bulk_update(ocupadas, ['vagas', 'atualizado_em'])
+
+            # bulk_update não passa por Reserva.save(): de pendente para aprovada
+            for usuario_id, total in Counter(reserva.usuario_id for reserva in aprovadas).items():
+                EstatisticaUsuario.ajustar(usuario_id, {'aprovadas': total, 'pendentes': -total})
+            EventoReserva.registrar([EventoReserva.da_reserva(reserva, EventoReserva.APROVADA) for reserva in aprovadas])
+            notificar_reservas(aprovadas, 'aprovada')
+            for reserva in aprovadas:
+                reserva._estado_original = (reserva.status_aprovacao, reserva.status_frequencia)
+
+    resultado['aprovadas'] = aprovadas
+    return resultado
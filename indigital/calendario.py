@@ -0,0 +1,127 @@
+import hashlib
+from datetime import UTC, timedelta
+
+from django.core import signing
+from django.db.models import Count, Max, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from usuarios.models import User
+
+
+# Eventos que terminaram há mais tempo que isso ficam fora dos feeds
+JANELA_PASSADO = timedelta(days=30)
+# Tempo que o aplicativo de calendário pode reutilizar o feed sem perguntar de novo
+MAX_AGE = 300
+
+SALT_TOKEN = 'indigital.calendario'
+
+
+def token_calendario(usuario):
+    """Token secreto (assinado) que identifica o usuário nas URLs dos feeds."""
+    return signing.Signer(salt=SALT_TOKEN).sign(str(usuario.pk))
+
+
+def usuario_do_token(token):
+    """Retorna o usuário dono do token, ou None se o token for inválido."""
+    try:
+        pk = signing.Signer(salt=SALT_TOKEN).unsign(token)
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=pk, is_active=True).first()
+
+
+def formatar_data(valor):
+    return valor.astimezone(UTC).strftime('%Y%m%dT%H%M%SZ')
+
+
+def escapar(texto):
+    return (
+        str(texto).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def dobrar(linha):
+    """Quebra a linha em 75 octetos, como pede a RFC 5545."""
+    dados = linha.encode('utf-8')
+    if len(dados) <= 75:
+        return linha + '\r\n'
+    partes = []
+    while dados:
+        limite = 75 if not partes else 74
+        # Não corta no meio de um caractere multibyte
+        while limite < len(dados) and (dados[limite] & 0xC0) == 0x80:
+            limite -= 1
+        partes.append(dados[:limite].decode('utf-8'))
+        dados = dados[limite:]
+    return '\r\n '.join(partes) + '\r\n'
+
+
+def evento(uid, disponibilidade, resumo, descricao=''):
+    linhas = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f'DTSTAMP:{formatar_data(disponibilidade.atualizado_em)}',
+        f'DTSTART:{formatar_data(disponibilidade.inicio_em)}',
+        f'DTEND:{formatar_data(disponibilidade.fim_em)}',
+        f'SUMMARY:{escapar(resumo)}',
+        f'LOCATION:{escapar("Laboratório " + disponibilidade.laboratorio.num_laboratorio)}',
+    ]
+    if descricao:
+        linhas.append(f'DESCRIPTION:{escapar(descricao)}')
+    linhas.append('END:VEVENT')
+    return ''.join(dobrar(linha) for linha in linhas)
+
+
+def gerar_calendario(nome, eventos):
+    yield dobrar('BEGIN:VCALENDAR')
+    yield dobrar('VERSION:2.0')
+    yield dobrar('PRODID:-//InDigital//Reservas de laboratorio//PT-BR')
+    yield dobrar('CALSCALE:GREGORIAN')
+    yield dobrar(f'X-WR-CALNAME:{escapar(nome)}')
+    yield dobrar('X-WR-TIMEZONE:America/Recife')
+    yield from eventos
+    yield dobrar('END:VCALENDAR')
+
+
+def responder_calendario(request, nome, queryset, campo_disponibilidade, formatar_evento):
+    """
+    Responde com o feed .ics dos registros do queryset, com ETag e Last-Modified.
+
+    A versão do feed vem de um único aggregate sobre o mesmo intervalo indexado de
+    inicio_em: se nada mudou desde a última consulta do aplicativo, a resposta é um
+    304 sem gerar o calendário. Caso contrário, os eventos são gerados em streaming.
+    """
+    prefixo = f'{campo_disponibilidade}__' if campo_disponibilidade else ''
+    queryset = queryset.filter(**{f'{prefixo}inicio_em__gte': timezone.now() - JANELA_PASSADO})
+
+    versao = queryset.aggregate(
+        total=Count('id'),
+        soma=Sum('id'),
+        atualizado=Max(f'{prefixo}atualizado_em'),
+    )
+    etag = quote_etag(hashlib.md5(
+        f"{versao['total']}:{versao['soma']}:{versao['atualizado']}".encode()
+    ).hexdigest())
+    # Em segundos inteiros, como no cabeçalho: senão o If-Modified-Since nunca bate
+    ultima_modificacao = int(versao['atualizado'].timestamp()) if versao['atualizado'] else None
+
+    resposta = get_conditional_response(request, etag=etag, last_modified=ultima_modificacao)
+    if resposta is None:
+        eventos = (
+            formatar_evento(registro)
+            for registro in queryset.order_by(f'{prefixo}inicio_em').iterator(chunk_size=500)
+        )
+        resposta = StreamingHttpResponse(
+            gerar_calendario(nome, eventos), content_type='text/calendar; charset=utf-8'
+        )
+        resposta['Content-Disposition'] = 'inline; filename="calendario.ics"'
+
+    resposta['ETag'] = etag
+    if ultima_modificacao:
+        resposta['Last-Modified'] = http_date(ultima_modificacao)
+    patch_cache_control(resposta, private=True, max_age=MAX_AGE)
+    return resposta
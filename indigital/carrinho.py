@@ -0,0 +1,146 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .aprovacao_automatica import aprovar_pendentes
+from .models import Disponibilidade, EstatisticaUsuario, EventoReserva, FilaEspera, Reserva
+
+
+# Horários aceitos em uma única solicitação do carrinho
+MAXIMO_ITENS = 20
+
+
+def descrever(disponibilidade):
+    return (
+        f"Laboratório {disponibilidade.laboratorio.num_laboratorio} - "
+        f"{disponibilidade.data:%d/%m/%Y} "
+        f"{disponibilidade.horario_inicio:%H:%M} às {disponibilidade.horario_fim:%H:%M}"
+    )
+
+
+def sobrepoe(a, b):
+    return a.inicio_em < b.fim_em and b.inicio_em < a.fim_em
+
+
+def reservar_varios(usuario, disponibilidade_ids):
+    """
+    Solicita de uma vez as reservas dos horários do carrinho.
+
+    Horários com vaga viram reservas pendentes e os esgotados viram entradas na fila
+    de espera, como em reservar_laboratorio; as pendentes passam em seguida pelas
+    regras de aprovação automática. As regras de Reserva.clean() (reserva
+    repetida ou sobreposta a outra pendente/aprovada) são verificadas com uma única
+    consulta para todos os horários; sobreposições entre os próprios itens do carrinho
+    são resolvidas em memória, mantendo o que começa primeiro. Reservas e filas são
+    criadas com bulk_create.
+
+    Retorna um resultado por id recebido, na mesma ordem: dicionários com
+    disponibilidade_id, descricao, resultado ('reservada', 'fila' ou 'erro') e mensagem.
+    """
+    resultados = {}
+    ids = list(dict.fromkeys(disponibilidade_ids))
+
+    disponibilidades = {
+        d.id: d for d in Disponibilidade.objects.select_related('laboratorio').filter(id__in=ids)
+    }
+    agora = timezone.now()
+    validas = []
+    for disponibilidade_id in ids:
+        disponibilidade = disponibilidades.get(disponibilidade_id)
+        if disponibilidade is None:
+            resultados[disponibilidade_id] = ('erro', 'Horário não encontrado.')
+        elif disponibilidade.encerrada or disponibilidade.inicio_em <= agora:
+            resultados[disponibilidade_id] = ('erro', 'Não é possível reservar: este horário já passou.')
+        else:
+            validas.append(disponibilidade)
+
+    existentes = []
+    em_fila = set()
+    if validas:
+        # Reservas ativas do usuário que se sobrepõem a qualquer item do carrinho
+        sobreposicao = Q()
+        for disponibilidade in validas:
+            sobreposicao |= Q(disponibilidade__inicio_em__lt=disponibilidade.fim_em, disponibilidade__fim_em__gt=disponibilidade.inicio_em)
+        existentes = list(
+            Reserva.objects.filter(sobreposicao, usuario=usuario, status_aprovacao__in=['P', 'A'])
+            .select_related('disponibilidade')
+        )
+        em_fila = set(
+            FilaEspera.objects.filter(usuario=usuario, disponibilidade_id__in=[d.id for d in validas])
+            .values_list('disponibilidade_id', flat=True)
+        )
+
+    novas_reservas = []
+    novas_filas = []
+    # Ordem de início: entre dois itens sobrepostos fica o que começa antes
+    for disponibilidade in sorted(validas, key=lambda d: (d.inicio_em, d.id)):
+        mesma = next((r for r in existentes if r.disponibilidade_id == disponibilidade.id), None)
+        if mesma:
+            status_texto = "pendente" if mesma.status_aprovacao == 'P' else "aprovada"
+            resultados[disponibilidade.id] = ('erro', f"Você já possui uma reserva {status_texto} para este horário.")
+        elif disponibilidade.vagas <= 0:
+            if disponibilidade.id in em_fila:
+                resultados[disponibilidade.id] = ('erro', "Você já está na fila de espera para este horário.")
+            else:
+                novas_filas.append(FilaEspera(usuario=usuario, disponibilidade=disponibilidade))
+                resultados[disponibilidade.id] = ('fila', "Sem vagas disponíveis, você foi adicionado à fila de espera para este horário.")
+        else:
+            conflito = next((r for r in existentes if sobrepoe(r.disponibilidade, disponibilidade)), None)
+            if conflito:
+                status_texto = "pendente" if conflito.status_aprovacao == 'P' else "aprovada"
+                resultados[disponibilidade.id] = ('erro', f"Você já possui uma reserva {status_texto} que se sobrepõe a este horário na mesma data.")
+            elif any(sobrepoe(r.disponibilidade, disponibilidade) for r in novas_reservas):
+                resultados[disponibilidade.id] = ('erro', "Este horário se sobrepõe a outro horário selecionado no carrinho.")
+            else:
+                novas_reservas.append(Reserva(usuario=usuario, disponibilidade=disponibilidade, status_aprovacao='P'))
+                resultados[disponibilidade.id] = ('reservada', "Solicitação de reserva enviada! Aguarde a aprovação do administrador.")
+
+    if novas_reservas or novas_filas:
+        with transaction.atomic():
+            Reserva.objects.bulk_create(novas_reservas)
+            if novas_filas:
+                # Uma entrada criada em paralelo (unique_together) não derruba o lote
+                FilaEspera.objects.bulk_create(novas_filas, ignore_conflicts=True)
+                # ignore_conflicts não diz quais linhas entraram: são as que têm o momento
+                # de solicitação gravado neste lote (a criada em paralelo tem outro)
+                gravadas = dict(
+                    FilaEspera.objects.filter(
+                        usuario=usuario, disponibilidade_id__in=[fila.disponibilidade_id for fila in novas_filas]
+                    ).values_list('disponibilidade_id', 'data_solicitacao')
+                )
+                repetidas = [fila for fila in novas_filas if gravadas.get(fila.disponibilidade_id) != fila.data_solicitacao]
+                for fila in repetidas:
+                    resultados[fila.disponibilidade_id] = ('erro', "Você já está na fila de espera para este horário.")
+                novas_filas = [fila for fila in novas_filas if fila not in repetidas]
+            # Os eventos só das linhas gravadas: bulk_create não passa por save()
+            EventoReserva.registrar(
+                [EventoReserva.da_reserva(reserva, EventoReserva.CRIADA) for reserva in novas_reservas]
+                + [EventoReserva.da_fila(fila) for fila in novas_filas]
+            )
+            # bulk_create não passa por Reserva.save(), então os contadores são ajustados aqui
+            if novas_reservas:
+                deltas = {
+                    campo: valor * len(novas_reservas)
+                    for campo, valor in EstatisticaUsuario.contagens('P', '', False).items()
+                }
+                EstatisticaUsuario.ajustar(usuario.id, deltas)
+
+    if novas_reservas:
+        # Em transação separada: se falhar, as reservas continuam pendentes para o comando aprovar_reservas
+        aprovadas = {
+            reserva.id
+            for reserva in aprovar_pendentes([reserva.disponibilidade_id for reserva in novas_reservas])['aprovadas']
+        }
+        for reserva in novas_reservas:
+            if reserva.id in aprovadas:
+                resultados[reserva.disponibilidade_id] = ('reservada', "Reserva aprovada! Compareça ao laboratório no horário reservado.")
+
+    return [
+        {
+            'disponibilidade_id': disponibilidade_id,
+            'descricao': descrever(disponibilidades[disponibilidade_id]) if disponibilidade_id in disponibilidades else '',
+            'resultado': resultados[disponibilidade_id][0],
+            'mensagem': resultados[disponibilidade_id][1],
+        }
+        for disponibilidade_id in ids
+    ]
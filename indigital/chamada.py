@@ -0,0 +1,153 @@
+import hashlib
+import json
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import EstatisticaUsuario, EventoReserva, Reserva
+
+
+# Marcações aceitas em uma única sincronização
+MAXIMO_MARCACOES = 500
+FREQUENCIAS = ('P', 'F', 'N')
+
+
+def pode_ver_todas(usuario):
+    return usuario.is_superuser or usuario.perfil == 'administrador'
+
+
+def reservas_da_chamada(usuario):
+    """Reservas aprovadas dos horários do monitor (todas, para administradores)."""
+    reservas = Reserva.objects.filter(status_aprovacao='A')
+    if not pode_ver_todas(usuario):
+        reservas = reservas.filter(disponibilidade__monitor=usuario)
+    return reservas
+
+
+def lista_do_dia(usuario, dia):
+    """
+    Lista de chamada do dia em formato compacto, para o service worker guardar offline.
+
+    A versão é o hash do conteúdo: muda sempre que um horário, uma reserva ou uma
+    frequência da lista muda, e serve de ETag para a revalidação.
+    """
+    horarios = {}
+    reservas = (
+        reservas_da_chamada(usuario)
+        .filter(disponibilidade__data=dia)
+        .select_related('usuario', 'disponibilidade__laboratorio')
+        .order_by('disponibilidade__inicio_em', 'disponibilidade_id', 'usuario__first_name', 'usuario__username', 'id')
+    )
+    for reserva in reservas:
+        disponibilidade = reserva.disponibilidade
+        horario = horarios.setdefault(disponibilidade.id, {
+            'id': disponibilidade.id,
+            'laboratorio': disponibilidade.laboratorio.num_laboratorio,
+            'inicio': f'{disponibilidade.horario_inicio:%H:%M}',
+            'fim': f'{disponibilidade.horario_fim:%H:%M}',
+            'reservas': [],
+        })
+        horario['reservas'].append({
+            'id': reserva.id,
+            'aluno': reserva.usuario.get_full_name() or reserva.usuario.username or reserva.usuario.email,
+            'frequencia': reserva.status_frequencia,
+            'registrada_em': reserva.frequencia_registrada_em.isoformat() if reserva.frequencia_registrada_em else None,
+        })
+
+    lista = {'data': dia.isoformat(), 'horarios': list(horarios.values())}
+    conteudo = json.dumps(lista, sort_keys=True, separators=(',', ':'))
+    lista['versao'] = hashlib.sha256(conteudo.encode()).hexdigest()[:16]
+    return lista
+
+
+def ler_momento(valor, agora):
+    """Momento da marcação enviado pelo aparelho; relógios adiantados valem como agora."""
+    momento = parse_datetime(valor) if isinstance(valor, str) else None
+    if momento is None or timezone.is_naive(momento):
+        return None
+    return min(momento, agora)
+
+
+def sincronizar(usuario, marcacoes):
+    """
+    Aplica em lote as frequências marcadas offline.
+
+    Cada marcação tem reserva, frequencia ('P', 'F' ou 'N') e registrada_em (ISO 8601
+    com fuso). Conflitos são resolvidos pela marcação mais recente de cada reserva: a
+    do lote só é gravada se for posterior à que já está no banco (feita por outro
+    aparelho ou por registrar_frequencias). Reenviar o mesmo lote não muda nada, e
+    marcações de dias anteriores ainda na fila do aparelho continuam aceitas.
+
+    Retorna um resultado por reserva: dicionários com reserva, resultado ('aplicada',
+    'ignorada' ou 'erro'), mensagem e a frequência que ficou valendo.
+    """
+    agora = timezone.now()
+    resultados = {}
+    # Mais recente por reserva dentro do próprio lote
+    mais_recentes = {}
+    for marcacao in marcacoes:
+        reserva_id = marcacao.get('reserva') if isinstance(marcacao, dict) else None
+        if not isinstance(reserva_id, int):
+            continue
+        momento = ler_momento(marcacao.get('registrada_em'), agora)
+        if marcacao.get('frequencia') not in FREQUENCIAS or momento is None:
+            resultados[reserva_id] = {'resultado': 'erro', 'mensagem': 'Marcação inválida.'}
+            continue
+        atual = mais_recentes.get(reserva_id)
+        if atual is None or momento >= atual[1]:
+            mais_recentes[reserva_id] = (marcacao['frequencia'], momento)
+            resultados.pop(reserva_id, None)
+
+    alteradas = []
+    deltas = defaultdict(lambda: defaultdict(int))
+    with transaction.atomic():
+        reservas = {
+            reserva.id: reserva
+            for reserva in reservas_da_chamada(usuario)
+            .select_for_update(of=('self',))
+            .select_related('disponibilidade')
+            .filter(id__in=mais_recentes)
+        }
+        for reserva_id, (frequencia, momento) in mais_recentes.items():
+            reserva = reservas.get(reserva_id)
+            if reserva is None:
+                resultados[reserva_id] = {
+                    'resultado': 'erro',
+                    'mensagem': 'Reserva não encontrada entre as reservas aprovadas dos seus horários.',
+                }
+                continue
+            if reserva.frequencia_registrada_em and reserva.frequencia_registrada_em >= momento:
+                resultados[reserva_id] = {'resultado': 'ignorada', 'mensagem': 'Já existe uma marcação mais recente.'}
+                continue
+            encerrada = reserva.disponibilidade.encerrada
+            for campo, valor in EstatisticaUsuario.contagens('A', reserva.status_frequencia, encerrada).items():
+                deltas[reserva.usuario_id][campo] -= valor
+            for campo, valor in EstatisticaUsuario.contagens('A', frequencia, encerrada).items():
+                deltas[reserva.usuario_id][campo] += valor
+            reserva.status_frequencia = frequencia
+            reserva.frequencia_registrada_em = momento
+            # bulk_update não aplica o auto_now
+            reserva.atualizado_em = agora
+            alteradas.append(reserva)
+            resultados[reserva_id] = {'resultado': 'aplicada', 'mensagem': 'Frequência registrada.'}
+
+        Reserva.objects.bulk_update(alteradas, ['status_frequencia', 'frequencia_registrada_em', 'atualizado_em'])
+        # bulk_update não passa por Reserva.save(), então os contadores são ajustados aqui
+        for usuario_id, deltas_usuario in deltas.items():
+            EstatisticaUsuario.ajustar(usuario_id, deltas_usuario)
+        EventoReserva.registrar([EventoReserva.da_reserva(reserva, EventoReserva.FREQUENCIA) for reserva in alteradas])
+
+    return [
+        {
+            'reserva': reserva_id,
+            **resultado,
+            'frequencia': reservas[reserva_id].status_frequencia if reserva_id in reservas else None,
+            'registrada_em': (
+                reservas[reserva_id].frequencia_registrada_em.isoformat()
+                if reserva_id in reservas and reservas[reserva_id].frequencia_registrada_em else None
+            ),
+        }
+        for reserva_id, resultado in resultados.items()
+    ]
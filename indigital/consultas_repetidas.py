@@ -0,0 +1,95 @@
+import logging
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .perfilamento import origem_consulta
+
+
+logger = logging.getLogger('indigital.consultas_repetidas')
+
+# Literais de texto, números e placeholders viram "?"; listas de "?" viram "(...)"
+re_literais = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+re_listas = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+
+
+class ConsultasRepetidasError(Exception):
+    """Requisição com consultas repetidas acima do limite (modo "erro", usado nos testes)."""
+
+
+def normalizar(sql):
+    """Forma da consulta: o SQL sem os valores, para agrupar as execuções de um mesmo N+1."""
+    sql = re_literais.sub('?', ' '.join(sql.split()))
+    return re_listas.sub('(...)', sql)
+
+
+def origem_template():
+    """Template e linha em renderização quando a consulta foi disparada, se houver."""
+    quadro = sys._getframe(1)
+    while quadro is not None:
+        if quadro.f_code.co_name == 'render_annotated':
+            no = quadro.f_locals.get('self')
+            origem = getattr(no, 'origin', None)
+            token = getattr(no, 'token', None)
+            if origem is not None and token is not None:
+                return f'{origem.template_name}:{token.lineno}'
+        quadro = quadro.f_back
+    return ''
+
+
+class DetectorConsultas:
+    """execute_wrapper que conta as consultas SELECT de cada forma durante a requisição."""
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.contagem = Counter()
+        self.origens = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:6].upper() == 'SELECT':
+            forma = normalizar(sql)
+            self.contagem[forma] += 1
+            # A origem é calculada só na execução que ultrapassa o limite, já dentro do laço
+            if self.contagem[forma] == self.limite + 1:
+                self.origens[forma] = (origem_consulta(), origem_template())
+        return execute(sql, params, many, context)
+
+    def repetidas(self):
+        return [
+            (forma, total, *self.origens[forma])
+            for forma, total in self.contagem.most_common()
+            if total > self.limite
+        ]
+
+
+def verificar_consultas(request, get_response, modo):
+    """
+    Executa a requisição contando as consultas por forma e avisa sobre as repetidas mais
+    de CONSULTAS_REPETIDAS_LIMITE vezes: no log (modo "log") ou com ConsultasRepetidasError
+    (modo "erro").
+    """
+    detector = DetectorConsultas(settings.CONSULTAS_REPETIDAS_LIMITE)
+    with ExitStack() as pilha:
+        for conexao in connections.all():
+            pilha.enter_context(conexao.execute_wrapper(detector))
+        resposta = get_response(request)
+
+    rota = request.resolver_match.view_name if request.resolver_match else request.path
+    if rota in settings.CONSULTAS_REPETIDAS_IGNORADAS:
+        return resposta
+    repetidas = detector.repetidas()
+    if repetidas:
+        linhas = [
+            f'{total}x {forma}\n    código: {origem or "?"}'
+            + (f'\n    template: {template}' if template else '')
+            for forma, total, origem, template in repetidas
+        ]
+        mensagem = f'Consultas repetidas em {rota} ({request.method} {request.path}):\n' + '\n'.join(linhas)
+        if modo == 'erro':
+            raise ConsultasRepetidasError(mensagem)
+        logger.warning(mensagem)
+    return resposta
@@ -0,0 +1,60 @@
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Disponibilidade, EstatisticaUsuario, EventoReserva, FilaEspera, Reserva
+from .utilizacao import registrar_pico_fila
+
+
+def disponibilidades_terminadas(agora=None):
+    """Disponibilidades ainda abertas cujo horário de fim já passou."""
+    return Disponibilidade.objects.filter(encerrada=False, fim_em__lte=agora or timezone.now())
+
+
+def encerrar_lote(tamanho, agora=None):
+    """
+    Encerra um lote de disponibilidades terminadas, tudo em uma transação:
+    remove as entradas da fila de espera, marca como 'N' a frequência das reservas
+    aprovadas que ficaram sem registro e marca a disponibilidade como encerrada.
+
+    Retorna um dicionário com o total de disponibilidades, filas e reservas afetadas.
+    """
+    with transaction.atomic():
+        ids = list(
+            disponibilidades_terminadas(agora)
+            .select_for_update(skip_locked=True)
+            .order_by('fim_em')
+            .values_list('id', flat=True)[:tamanho]
+        )
+        if not ids:
+            return {'disponibilidades': 0, 'filas': 0, 'reservas': 0}
+
+        # Registra o pico da fila de espera desses horários antes de remover as filas; o
+        # resto do resumo de utilização é atualizado pelo comando, fora da transação
+        registrar_pico_fila(ids)
+
+        filas, _ = FilaEspera.objects.filter(disponibilidade_id__in=ids).delete()
+        sem_registro = list(
+            Reserva.objects.select_for_update()
+            .filter(disponibilidade_id__in=ids, status_aprovacao='A', status_frequencia='')
+            .only('id', 'usuario_id', 'disponibilidade_id', 'status_aprovacao')
+        )
+        reservas = Reserva.objects.filter(id__in=[reserva.id for reserva in sem_registro]).update(
+            status_frequencia='N', atualizado_em=timezone.now()
+        )
+        # update() não passa por Reserva.save(), então os eventos de frequência são registrados aqui
+        for reserva in sem_registro:
+            reserva.status_frequencia = 'N'
+        EventoReserva.registrar([EventoReserva.da_reserva(reserva, EventoReserva.FREQUENCIA) for reserva in sem_registro])
+        Disponibilidade.objects.filter(id__in=ids).update(encerrada=True, atualizado_em=timezone.now())
+
+        # As reservas sem frequência desses horários deixam de estar "a realizar". Depois
+        # de encerrar: se o usuário ainda não tem contadores, ajustar() os recalcula do
+        # zero, e eles já devem ver esses horários como encerrados
+        for item in (
+            Reserva.objects.filter(disponibilidade_id__in=ids, status_frequencia__in=['', 'N'])
+            .values('usuario_id').annotate(total=Count('id')).order_by()
+        ):
+            EstatisticaUsuario.ajustar(item['usuario_id'], {'a_realizar': -item['total']})
+
+    return {'disponibilidades': len(ids), 'filas': filas, 'reservas': reservas}
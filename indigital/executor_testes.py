@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class ExecutorTestes(DiscoverRunner):
+    """
+    Executor de testes do projeto: liga o detector de consultas repetidas no modo
+    "erro", para que um N+1 novo faça o teste que passa pela view falhar.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.CONSULTAS_REPETIDAS_MODO = 'erro'
@@ -0,0 +1,82 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Disponibilidade, EventoReserva, FilaEspera, Reserva
+from .notificacoes import notificar_reserva
+
+
+def ocupar_vaga(disponibilidade_id):
+    """
+    Decrementa uma vaga direto no banco, só se ainda houver vaga.
+
+    Retorna False quando outra transação ocupou a última vaga antes.
+    """
+    return Disponibilidade.objects.filter(id=disponibilidade_id, vagas__gt=0).update(
+        vagas=F('vagas') - 1, atualizado_em=timezone.now()
+    ) > 0
+
+
+def travar_pendente(reserva_id):
+    """
+    Relê a reserva com a linha travada (SELECT ... FOR UPDATE), só se ainda estiver
+    pendente. Deve rodar dentro da transação que aprova ou rejeita a reserva: outra
+    aprovação simultânea (manual ou a automática, que trava as pendentes que avalia)
+    espera esta transação e depois não encontra mais a reserva como pendente.
+
+    Retorna None quando a reserva já foi aprovada ou rejeitada por outra transação.
+    """
+    return Reserva.objects.select_for_update().filter(id=reserva_id, status_aprovacao='P').first()
+
+
+def promover_fila_espera(disponibilidade):
+    """
+    Promove os primeiros da fila de espera da disponibilidade enquanto houver vagas.
+
+    As entradas da fila são travadas com SELECT ... FOR UPDATE SKIP LOCKED, então vários
+    workers podem promover ao mesmo tempo sem pegar a mesma entrada, e cada vaga é
+    ocupada com um decremento condicional, sem ultrapassar o total. Quem não pode
+    receber a reserva (por exemplo, por conflito de horário) continua na fila.
+    Retorna a lista de reservas criadas.
+    """
+    if disponibilidade.is_passada():
+        return []
+
+    promovidas = []
+    ignoradas = []
+    # Os eventos das promoções são gravados juntos, no fim da transação
+    with transaction.atomic(), EventoReserva.agrupar():
+        while True:
+            vagas = Disponibilidade.objects.filter(id=disponibilidade.id).values_list('vagas', flat=True).first()
+            if not vagas or vagas <= 0:
+                break
+
+            # Pega de uma vez tantas entradas do início da fila quantas forem as vagas
+            candidatos = list(
+                FilaEspera.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('usuario', 'disponibilidade__laboratorio')
+                .filter(disponibilidade_id=disponibilidade.id)
+                .exclude(id__in=ignoradas)
+                .order_by('data_solicitacao', 'id')[:vagas]
+            )
+            if not candidatos:
+                break
+
+            for fila in candidatos:
+                reserva = Reserva(usuario=fila.usuario, disponibilidade=fila.disponibilidade, status_aprovacao='A')
+                try:
+                    reserva.clean()
+                except ValidationError:
+                    ignoradas.append(fila.id)
+                    continue
+
+                if not ocupar_vaga(disponibilidade.id):
+                    break
+
+                reserva.save()
+                fila.delete()
+                notificar_reserva(reserva, 'promovida')
+                promovidas.append(reserva)
+
+    return promovidas
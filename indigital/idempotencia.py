@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+
+# Tempo que o resultado de uma chave fica guardado para ser repetido
+TTL_RESULTADO = 600
+# Tempo máximo que uma chave fica marcada como "em andamento" se o processo morrer no meio
+TTL_ANDAMENTO = 30
+# Quanto uma repetição espera a primeira requisição terminar antes de desistir
+ESPERA_MAXIMA = 5
+INTERVALO_ESPERA = 0.1
+
+EM_ANDAMENTO = 'em_andamento'
+CABECALHO = 'Idempotency-Key'
+CAMPO = 'idempotency_key'
+# Cabeçalhos da resposta original que são repetidos junto com o corpo
+CABECALHOS_GUARDADOS = ('Content-Type', 'Location')
+
+
+def chave_cache(request, usuario, chave):
+    # A chave vale só para o mesmo usuário e o mesmo endpoint
+    bruta = f'{usuario.pk}:{request.path}:{chave}'
+    return 'idempotencia:' + hashlib.sha256(bruta.encode()).hexdigest()
+
+
+def guardar(resposta):
+    return {
+        'status': resposta.status_code,
+        'conteudo': resposta.content,
+        'cabecalhos': {nome: resposta[nome] for nome in CABECALHOS_GUARDADOS if resposta.has_header(nome)},
+    }
+
+
+def repetir(guardada):
+    resposta = HttpResponse(guardada['conteudo'], status=guardada['status'])
+    for nome, valor in guardada['cabecalhos'].items():
+        resposta[nome] = valor
+    resposta['Idempotent-Replayed'] = 'true'
+    return resposta
+
+
+def em_processamento(request):
+    mensagem = 'Esta solicitação ainda está sendo processada. Aguarde alguns instantes.'
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({'success': False, 'error': mensagem}, status=409)
+    return HttpResponse(mensagem, status=409, content_type='text/plain; charset=utf-8')
+
+
+def idempotente(view_func):
+    """
+    Decorator para views que alteram dados via POST.
+
+    Quando a requisição traz uma chave de idempotência (cabeçalho Idempotency-Key ou
+    campo idempotency_key do formulário), a primeira execução é marcada no cache e
+    sua resposta fica guardada por TTL_RESULTADO segundos. Repetições com a mesma
+    chave (duplo clique, reenvio do navegador, nova tentativa após erro de rede)
+    recebem a resposta guardada sem executar a view nem consultar o banco; se a
+    primeira ainda estiver em andamento, a repetição espera por ela.
+    Respostas com erro 5xx não são guardadas, para que a nova tentativa seja executada.
+    Aceita views síncronas e assíncronas.
+    """
+    if iscoroutinefunction(view_func):
+        return idempotente_async(view_func)
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        chave = request.headers.get(CABECALHO) or request.POST.get(CAMPO)
+        if request.method != 'POST' or not chave:
+            return view_func(request, *args, **kwargs)
+
+        chave = chave_cache(request, request.user, chave[:100])
+        if not cache.add(chave, EM_ANDAMENTO, TTL_ANDAMENTO):
+            limite = time.monotonic() + ESPERA_MAXIMA
+            guardada = cache.get(chave)
+            while guardada == EM_ANDAMENTO and time.monotonic() < limite:
+                time.sleep(INTERVALO_ESPERA)
+                guardada = cache.get(chave)
+            if isinstance(guardada, dict):
+                return repetir(guardada)
+            if guardada == EM_ANDAMENTO:
+                return em_processamento(request)
+            # A marca expirou nesse meio tempo: executa normalmente
+            cache.add(chave, EM_ANDAMENTO, TTL_ANDAMENTO)
+
+        try:
+            resposta = view_func(request, *args, **kwargs)
+        except Exception:
+            cache.delete(chave)
+            raise
+        if resposta.status_code >= 500 or resposta.streaming:
+            cache.delete(chave)
+        else:
+            cache.set(chave, guardar(resposta), TTL_RESULTADO)
+        return resposta
+    return _wrapped_view
+
+
+def idempotente_async(view_func):
+    """Mesmo comportamento de idempotente para views assíncronas, sem bloquear o event loop."""
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        chave = request.headers.get(CABECALHO) or request.POST.get(CAMPO)
+        if request.method != 'POST' or not chave:
+            return await view_func(request, *args, **kwargs)
+
+        chave = chave_cache(request, await request.auser(), chave[:100])
+        if not await cache.aadd(chave, EM_ANDAMENTO, TTL_ANDAMENTO):
+            limite = time.monotonic() + ESPERA_MAXIMA
+            guardada = await cache.aget(chave)
+            while guardada == EM_ANDAMENTO and time.monotonic() < limite:
+                await asyncio.sleep(INTERVALO_ESPERA)
+                guardada = await cache.aget(chave)
+            if isinstance(guardada, dict):
+                return repetir(guardada)
+            if guardada == EM_ANDAMENTO:
+                return em_processamento(request)
+            await cache.aadd(chave, EM_ANDAMENTO, TTL_ANDAMENTO)
+
+        try:
+            resposta = await view_func(request, *args, **kwargs)
+        except Exception:
+            await cache.adelete(chave)
+            raise
+        if resposta.status_code >= 500 or resposta.streaming:
+            await cache.adelete(chave)
+        else:
+            await cache.aset(chave, guardar(resposta), TTL_RESULTADO)
+        return resposta
+    return _wrapped_view
@@ -0,0 +1,207 @@
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+
+from usuarios.models import User
+
+from .models import Laboratorio
+
+
+# Linhas lidas, comparadas e gravadas por vez (um bulk_create por lote)
+TAMANHO_LOTE = 500
+PERFIS = [valor for valor, _ in User._meta.get_field('perfil').choices]
+
+
+class ArquivoInvalido(Exception):
+    """Cabeçalho do CSV sem a coluna chave ou com colunas desconhecidas."""
+
+
+def ler_usuario(linha):
+    """Campos do usuário preenchidos na linha e a senha (vazia se não informada)."""
+    campos = {}
+    email = User.objects.normalize_email(linha['email'])
+    if not email:
+        raise ValidationError('e-mail obrigatório.')
+    validate_email(email)
+    campos['email'] = email
+    for campo in ('first_name', 'last_name'):
+        if linha.get(campo):
+            campos[campo] = linha[campo]
+    if linha.get('perfil'):
+        perfil = linha['perfil'].lower()
+        if perfil not in PERFIS:
+            raise ValidationError(f'perfil "{perfil}" inválido (use {", ".join(PERFIS)}).')
+        campos['perfil'] = perfil
+    senha = linha.get('senha', '')
+    if senha:
+        # Usuário não salvo com os dados da linha, para a senha não poder ser parecida com eles
+        validate_password(senha, user=User(**campos))
+    return campos, senha
+
+
+def ler_laboratorio(linha):
+    campos = {}
+    if not linha['num_laboratorio']:
+        raise ValidationError('número do laboratório obrigatório.')
+    if len(linha['num_laboratorio']) > Laboratorio._meta.get_field('num_laboratorio').max_length:
+        raise ValidationError('número do laboratório longo demais.')
+    campos['num_laboratorio'] = linha['num_laboratorio']
+    if linha.get('capacidade'):
+        try:
+            capacidade = int(linha['capacidade'])
+        except ValueError:
+            raise ValidationError('capacidade deve ser um número inteiro.')
+        if capacidade < 1:
+            raise ValidationError('capacidade deve ser no mínimo 1.')
+        campos['capacidade'] = capacidade
+    return campos, ''
+
+
+# Modelo, coluna chave do upsert, colunas aceitas e leitura de cada tipo de importação
+TIPOS = {
+    'usuarios': (User, 'email', ['email', 'first_name', 'last_name', 'perfil', 'senha'], ler_usuario),
+    'laboratorios': (Laboratorio, 'num_laboratorio', ['num_laboratorio', 'capacidade'], ler_laboratorio),
+}
+
+
+def iniciar_processo():
+    # Processos criados com spawn (em vez de fork) começam sem o Django configurado
+    django.setup()
+
+
+def lotes(linhas, tamanho):
+    while lote := list(islice(linhas, tamanho)):
+        yield lote
+
+
+def importar(arquivo, tipo, simular=False, processos=None, tamanho_lote=TAMANHO_LOTE):
+    """
+    Importa usuários ou laboratórios de um CSV (arquivo de texto aberto), lendo e
+    gravando em lotes de tamanho_lote linhas: cada lote é comparado com o banco em uma
+    consulta e gravado com um bulk_create(update_conflicts=True) pela coluna chave
+    (email ou num_laboratorio). Células vazias mantêm o valor atual; senhas são
+    validadas e o hash é calculado em um pool de processos. Com simular=True nada é
+    gravado nem calculado o hash, só comparado.
+
+    Gera, por linha, tuplas (número da linha, chave, ação, detalhe), com ação
+    'criar', 'atualizar', 'igual' ou 'erro' e detalhe com as mudanças ou o erro. Os
+    resultados de cada lote saem depois da gravação; linhas que o banco recusa viram
+    'erro' sem desfazer as demais.
+    """
+    modelo, chave, colunas, ler = TIPOS[tipo]
+    leitor = csv.DictReader(arquivo)
+    cabecalho = [coluna.strip() for coluna in leitor.fieldnames or []]
+    if chave not in cabecalho:
+        raise ArquivoInvalido(f'O cabeçalho precisa da coluna "{chave}".')
+    desconhecidas = [coluna for coluna in cabecalho if coluna not in colunas]
+    if desconhecidas:
+        raise ArquivoInvalido(
+            f'Colunas desconhecidas: {", ".join(desconhecidas)}. Aceitas: {", ".join(colunas)}.'
+        )
+    leitor.fieldnames = cabecalho
+    # Colunas sobrescritas no upsert: só as que vieram no arquivo
+    campos_atualizados = [coluna for coluna in cabecalho if coluna not in (chave, 'senha')]
+    if 'senha' in cabecalho:
+        campos_atualizados.append('password')
+
+    vistas = set()
+    with ExitStack() as pilha:
+        pool = None
+        if 'senha' in cabecalho and not simular:
+            pool = pilha.enter_context(ProcessPoolExecutor(max_workers=processos, initializer=iniciar_processo))
+
+        # A linha 1 é o cabeçalho
+        for lote in lotes(enumerate(leitor, start=2), tamanho_lote):
+            # Os resultados do lote só saem depois da gravação, que ainda pode rejeitar linhas
+            resultados = []
+            validas = []
+            for numero, linha in lote:
+                linha = {coluna: (valor or '').strip() for coluna, valor in linha.items() if coluna is not None}
+                try:
+                    campos, senha = ler(linha)
+                except ValidationError as erro:
+                    resultados.append((numero, linha.get(chave, ''), 'erro', ' '.join(erro.messages)))
+                    continue
+                if campos[chave] in vistas:
+                    resultados.append((numero, campos[chave], 'erro', f'{chave} repetido no arquivo.'))
+                    continue
+                vistas.add(campos[chave])
+                validas.append((numero, campos, senha))
+
+            existentes = modelo.objects.in_bulk([campos[chave] for _, campos, _ in validas], field_name=chave)
+            alteradas = []
+            for numero, campos, senha in validas:
+                atual = existentes.get(campos[chave])
+                if atual is None:
+                    detalhe = ', '.join(f'{campo}={valor}' for campo, valor in campos.items() if campo != chave)
+                    resultados.append((numero, campos[chave], 'criar', detalhe + (', senha' if senha else '')))
+                else:
+                    mudancas = [
+                        f'{campo}: {getattr(atual, campo)} → {valor}'
+                        for campo, valor in campos.items() if getattr(atual, campo) != valor
+                    ]
+                    if senha:
+                        mudancas.append('senha')
+                    if not mudancas:
+                        resultados.append((numero, campos[chave], 'igual', ''))
+                        continue
+                    resultados.append((numero, campos[chave], 'atualizar', ', '.join(mudancas)))
+                alteradas.append((numero, atual, campos, senha))
+
+            falhas = {}
+            if alteradas and not simular:
+                falhas = gravar(modelo, tipo, chave, campos_atualizados, alteradas, pool)
+            for numero, valor_chave, acao, detalhe in sorted(resultados):
+                if numero in falhas:
+                    yield numero, valor_chave, 'erro', falhas[numero]
+                else:
+                    yield numero, valor_chave, acao, detalhe
+
+
+def gravar(modelo, tipo, chave, campos_atualizados, alteradas, pool):
+    """
+    Grava as linhas alteradas de um lote num único bulk_create e retorna {número da linha: erro}
+    das que o banco recusou. Se o lote esbarra numa restrição (outra coluna única, por exemplo),
+    regrava linha a linha, cada uma na sua transação, para rejeitar só as linhas com problema.
+    """
+    senhas = [senha for _, _, _, senha in alteradas if senha]
+    hashes = iter(pool.map(make_password, senhas, chunksize=max(1, len(senhas) // 16)) if senhas else [])
+    objetos = []
+    for numero, atual, campos, senha in alteradas:
+        # Nos existentes, os campos atualizados que a linha deixou vazios mantêm o valor atual
+        valores = {campo: getattr(atual, campo) for campo in campos_atualizados} if atual else {}
+        valores.update(campos)
+        if tipo == 'usuarios':
+            valores.setdefault('username', campos['email'])
+            if senha:
+                valores['password'] = next(hashes)
+            elif atual is None:
+                valores['password'] = make_password(None)
+        objetos.append((numero, modelo(**valores)))
+
+    def bulk_create(lote):
+        with transaction.atomic():
+            modelo.objects.bulk_create(
+                lote, update_conflicts=bool(campos_atualizados), ignore_conflicts=not campos_atualizados,
+                unique_fields=[chave], update_fields=campos_atualizados or None,
+            )
+
+    try:
+        bulk_create([objeto for _, objeto in objetos])
+    except IntegrityError:
+        falhas = {}
+        for numero, objeto in objetos:
+            try:
+                bulk_create([objeto])
+            except IntegrityError as erro:
+                falhas[numero] = f'recusada pelo banco: {erro}'
+        return falhas
+    return {}
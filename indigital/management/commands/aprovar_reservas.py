@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from indigital.aprovacao_automatica import aprovar_pendentes
+from indigital.models import Reserva
+
+
+class Command(BaseCommand):
+    help = (
+        'Aplica as regras de aprovação automática a toda a fila de reservas pendentes, em uma '
+        'transação: aprova enquanto houver vagas e deixa para os administradores as reservas '
+        'de usuários com faltas demais ou com a cota semanal atingida.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help='Continua rodando e verificando periodicamente.')
+        parser.add_argument('--intervalo', type=int, default=60, help='Segundos entre verificações no modo contínuo.')
+
+    def handle(self, *args, **options):
+        if not settings.APROVACAO_AUTOMATICA:
+            self.stdout.write('Aprovação automática desativada (APROVACAO_AUTOMATICA).')
+            return
+
+        while True:
+            resultado = aprovar_pendentes()
+            motivos = dict(Reserva._meta.get_field('motivo_pendencia').choices)
+            if resultado['aprovadas'] or resultado['pendentes']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{len(resultado['aprovadas'])} reserva(s) aprovada(s) automaticamente."
+                ))
+                for motivo, total in resultado['pendentes'].most_common():
+                    self.stdout.write(f'{total} pendente(s) para análise: {motivos[motivo]}.')
+            elif not options['continuo']:
+                self.stdout.write('Nenhuma reserva pendente.')
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
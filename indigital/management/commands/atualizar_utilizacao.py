@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from indigital.utilizacao import atualizar_utilizacao
+
+
+class Command(BaseCommand):
+    help = (
+        'Atualiza o resumo diário de utilização dos laboratórios, recalculando apenas os '
+        'dias que mudaram desde a última execução.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='Recalcula todos os dias, não só os alterados.')
+
+    def handle(self, *args, **options):
+        dias = atualizar_utilizacao(completo=options['completo'])
+        self.stdout.write(self.style.SUCCESS(f'{dias} dia(s) recalculado(s).'))
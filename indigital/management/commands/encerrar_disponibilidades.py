@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from indigital.encerramento import encerrar_lote
+from indigital.utilizacao import atualizar_utilizacao
+
+
+class Command(BaseCommand):
+    help = (
+        'Encerra as disponibilidades que já terminaram, em lotes: remove a fila de espera, '
+        'marca como não registrada a frequência pendente e marca o horário como encerrado. '
+        'Depois atualiza o resumo de utilização dos dias alterados.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Disponibilidades encerradas por transação.')
+        parser.add_argument('--continuo', action='store_true', help='Continua rodando e verificando periodicamente.')
+        parser.add_argument('--intervalo', type=int, default=300, help='Segundos entre verificações no modo contínuo.')
+
+    def handle(self, *args, **options):
+        while True:
+            totais = {'disponibilidades': 0, 'filas': 0, 'reservas': 0}
+            # Lotes pequenos mantêm as transações curtas; para quando um lote vier incompleto
+            while True:
+                resultado = encerrar_lote(options['lote'])
+                for chave, valor in resultado.items():
+                    totais[chave] += valor
+                if resultado['disponibilidades'] < options['lote']:
+                    break
+
+            if totais['disponibilidades']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"{totais['disponibilidades']} disponibilidade(s) encerrada(s), "
+                    f"{totais['filas']} entrada(s) de fila removida(s), "
+                    f"{totais['reservas']} frequência(s) marcada(s) como não registrada(s)."
+                ))
+            elif not options['continuo']:
+                self.stdout.write('Nenhuma disponibilidade a encerrar.')
+
+            # Mantém o resumo de utilização em dia, incluindo as frequências marcadas acima
+            dias = atualizar_utilizacao()
+            if dias:
+                self.stdout.write(f'Resumo de utilização: {dias} dia(s) recalculado(s).')
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
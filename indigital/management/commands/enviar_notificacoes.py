@@ -0,0 +1,122 @@
+import time
+from datetime import timedelta
+from smtplib import SMTPException
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from indigital.models import Notificacao
+
+# Por quanto tempo um lote fica reservado para o worker que o pegou. Se o worker cair no
+# meio do envio, as notificações não enviadas voltam para a fila depois desse prazo.
+RESERVA_ENVIO = timedelta(minutes=10)
+
+# Falhas de envio que reagendam a notificação (SMTPException é subclasse de OSError;
+# OSError cobre também conexão recusada e timeout)
+ERROS_ENVIO = (SMTPException, OSError)
+
+
+class Command(BaseCommand):
+    help = (
+        'Envia as notificações pendentes em lotes, reaproveitando uma única conexão '
+        'SMTP por lote e reagendando as que falharem.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100, help='Notificações enviadas por lote.')
+        parser.add_argument('--max-tentativas', type=int, default=5, help='Tentativas antes de desistir de uma notificação.')
+        parser.add_argument('--continuo', action='store_true', help='Continua rodando e verificando a fila periodicamente.')
+        parser.add_argument('--intervalo', type=int, default=30, help='Segundos entre verificações no modo contínuo.')
+
+    def handle(self, *args, **options):
+        while True:
+            # Esvazia a fila lote a lote antes de esperar pelo próximo ciclo
+            while self.enviar_lote(options['lote'], options['max_tentativas']) == options['lote']:
+                pass
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+    def enviar_lote(self, tamanho, max_tentativas):
+        """
+        Reserva um lote de notificações pendentes, envia fora da transação e grava o
+        resultado. Devolve quantas foram processadas.
+        """
+        lote = self.reservar_lote(tamanho, max_tentativas)
+        if not lote:
+            return 0
+
+        enviadas, falhas = self.enviar(lote)
+
+        with transaction.atomic():
+            agora = timezone.now()
+            Notificacao.objects.filter(id__in=enviadas).update(enviada_em=agora, erro='')
+            for notificacao, erro in falhas:
+                notificacao.tentativas += 1
+                # Espera exponencial: 1, 2, 4, 8... minutos
+                notificacao.proxima_tentativa = agora + timedelta(minutes=2 ** (notificacao.tentativas - 1))
+                notificacao.erro = str(erro)
+                notificacao.save(update_fields=['tentativas', 'proxima_tentativa', 'erro'])
+
+        if enviadas:
+            self.stdout.write(self.style.SUCCESS(f'{len(enviadas)} notificação(ões) enviada(s).'))
+        if falhas:
+            self.stdout.write(self.style.WARNING(f'{len(falhas)} notificação(ões) com falha, reagendada(s).'))
+        return len(lote)
+
+    def reservar_lote(self, tamanho, max_tentativas):
+        """
+        Pega as notificações pendentes mais antigas e adia a próxima tentativa delas em
+        RESERVA_ENVIO, numa transação curta: os outros workers deixam de vê-las sem que
+        as linhas fiquem travadas durante o envio.
+        """
+        with transaction.atomic():
+            # skip_locked permite vários workers sem que dois peguem a mesma notificação
+            lote = list(
+                Notificacao.objects.select_for_update(skip_locked=True, of=('self',))
+                .select_related('usuario')
+                .filter(
+                    enviada_em__isnull=True,
+                    tentativas__lt=max_tentativas,
+                    proxima_tentativa__lte=timezone.now(),
+                )
+                .order_by('proxima_tentativa')[:tamanho]
+            )
+            Notificacao.objects.filter(id__in=[notificacao.id for notificacao in lote]).update(
+                proxima_tentativa=timezone.now() + RESERVA_ENVIO
+            )
+        return lote
+
+    def enviar(self, lote):
+        """Envia o lote por uma única conexão SMTP; devolve (ids enviados, [(notificação, erro)])."""
+        enviadas = []
+        falhas = []
+        conexao = get_connection()
+        try:
+            conexao.open()
+            for notificacao in lote:
+                mensagem = EmailMessage(
+                    subject=notificacao.assunto,
+                    body=notificacao.mensagem,
+                    from_email=settings.DEFAULT_FROM_EMAIL,
+                    to=[notificacao.usuario.email],
+                    connection=conexao,
+                )
+                try:
+                    mensagem.send()
+                    enviadas.append(notificacao.id)
+                except ERROS_ENVIO as e:
+                    falhas.append((notificacao, e))
+                    # A conexão pode ter caído; reabre para o restante do lote
+                    conexao.close()
+                    conexao.open()
+        except ERROS_ENVIO as e:
+            # Sem conexão com o servidor: o restante do lote fica para a próxima tentativa
+            processadas = set(enviadas) | {n.id for n, _ in falhas}
+            falhas.extend((n, e) for n in lote if n.id not in processadas)
+        finally:
+            conexao.close()
+        return enviadas, falhas
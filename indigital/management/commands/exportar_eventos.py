@@ -0,0 +1,53 @@
+import csv
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from indigital.models import EventoReserva
+
+
+# Eventos mais novos que isto ficam para a próxima leitura: pode haver ids menores ainda em
+# transações não confirmadas (o tempo máximo de uma requisição, o --timeout do gunicorn)
+MARGEM_SEGUNDOS = 60
+CAMPOS = ['id', 'criado_em', 'tipo', 'reserva_id', 'usuario_id', 'disponibilidade_id', 'status_aprovacao', 'status_frequencia']
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta em CSV, na saída padrão, os eventos de reserva com id maior que a marca '
+        'informada, em ordem de id. A última marca lida sai na saída de erro, para a '
+        'próxima execução continuar dela.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apos', type=int, default=0, help='Marca: último id já lido.')
+        parser.add_argument('--lote', type=int, default=5000, help='Eventos lidos por consulta.')
+        parser.add_argument('--sem-cabecalho', action='store_true', help='Não escreve a linha de cabeçalho.')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(seconds=MARGEM_SEGUNDOS)
+        saida = csv.writer(self.stdout, lineterminator='\n')
+        if not options['sem_cabecalho']:
+            saida.writerow(CAMPOS)
+
+        marca = options['apos']
+        total = 0
+        while True:
+            # Índice da chave primária: cada lote continua do último id, sem OFFSET
+            eventos = list(
+                EventoReserva.objects.filter(id__gt=marca).order_by('id').values_list(*CAMPOS)[:options['lote']]
+            )
+            recentes = False
+            for evento in eventos:
+                # Para no primeiro evento recente, para não pular ids ainda não confirmados antes dele
+                if evento[1] > limite:
+                    recentes = True
+                    break
+                saida.writerow([evento[0], evento[1].isoformat(), *evento[2:]])
+                marca = evento[0]
+                total += 1
+            if recentes or len(eventos) < options['lote']:
+                break
+
+        self.stderr.write(f'{total} evento(s) exportado(s). Marca: {marca}')
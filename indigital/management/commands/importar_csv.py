@@ -0,0 +1,56 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from indigital.importacao import TAMANHO_LOTE, TIPOS, ArquivoInvalido, importar
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa usuários (colunas email, first_name, last_name, perfil, senha) ou laboratórios '
+        '(num_laboratorio, capacidade) de um CSV com cabeçalho, criando ou atualizando pela chave '
+        '(email ou num_laboratorio). Células vazias mantêm o valor atual. Use --simular para ver '
+        'as mudanças sem gravar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=sorted(TIPOS), help='O que importar.')
+        parser.add_argument('arquivo', help='Caminho do CSV (UTF-8).')
+        parser.add_argument('--simular', action='store_true', help='Só mostra o que mudaria, sem gravar.')
+        parser.add_argument('--lote', type=int, default=TAMANHO_LOTE, help='Linhas gravadas por transação.')
+        parser.add_argument(
+            '--processos', type=int, default=None,
+            help='Processos para calcular o hash das senhas (padrão: um por CPU).',
+        )
+
+    def handle(self, *args, **options):
+        totais = Counter()
+        # utf-8-sig aceita o BOM das planilhas exportadas em CSV
+        try:
+            with open(options['arquivo'], newline='', encoding='utf-8-sig') as arquivo:
+                linhas = importar(
+                    arquivo, options['tipo'], simular=options['simular'],
+                    processos=options['processos'], tamanho_lote=options['lote'],
+                )
+                for numero, chave, acao, detalhe in linhas:
+                    totais[acao] += 1
+                    if acao == 'erro':
+                        self.stderr.write(f'Linha {numero} ({chave}): {detalhe}')
+                    elif acao != 'igual' and options['verbosity'] >= 1:
+                        sinal = '+' if acao == 'criar' else '~'
+                        self.stdout.write(f'{sinal} linha {numero} {chave}' + (f': {detalhe}' if detalhe else ''))
+        except OSError as erro:
+            raise CommandError(f'Não foi possível ler o arquivo: {erro}')
+        except (ArquivoInvalido, UnicodeDecodeError) as erro:
+            raise CommandError(str(erro))
+
+        resumo = (
+            f"{totais['criar']} a criar, {totais['atualizar']} a atualizar, "
+            f"{totais['igual']} sem mudança, {totais['erro']} com erro."
+        )
+        if options['simular']:
+            self.stdout.write(self.style.WARNING(f'Simulação, nada foi gravado: {resumo}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                resumo.replace('a criar', 'criado(s)').replace('a atualizar', 'atualizado(s)')
+            ))
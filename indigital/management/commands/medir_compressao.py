@@ -0,0 +1,123 @@
+import gzip
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from indigital.middleware import brotli, QUALIDADE_BROTLI, minificar_html
+from usuarios.models import User
+
+
+# Páginas principais medidas por padrão
+PAGINAS = [
+    'admin_dashboard',
+    'horarios',
+    'listar_disponibilidades',
+    'historico_reservas',
+    'historico_geral_reservas',
+    'reservas_pendentes',
+    'fila_espera',
+]
+
+MIDDLEWARES_MEDIDOS = [
+    'indigital.middleware.CompressaoMiddleware',
+    'indigital.middleware.MinificarHTMLMiddleware',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede, nas páginas principais, quantos bytes e quanto tempo de transferência '
+        'a minificação de HTML e a compressão gzip/brotli economizam.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Usuário usado nas requisições (padrão: primeiro administrador).')
+        parser.add_argument('--repeticoes', type=int, default=5, help='Repetições por medida de tempo.')
+        parser.add_argument('--mbps', type=float, default=10.0, help='Velocidade da rede para estimar o tempo de transferência.')
+        parser.add_argument('paginas', nargs='*', help='Nomes de URL a medir (padrão: páginas principais).')
+
+    def handle(self, *args, **options):
+        usuario = self.obter_usuario(options['email'])
+        repeticoes = max(options['repeticoes'], 1)
+        bytes_por_ms = options['mbps'] * 1_000_000 / 8 / 1000
+
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*',) and not h.startswith('.')), 'localhost')
+        client = Client(HTTP_HOST=host)
+        client.force_login(usuario)
+
+        sem_middlewares = [m for m in settings.MIDDLEWARE if m not in MIDDLEWARES_MEDIDOS]
+
+        self.stdout.write(
+            f"{'página':<26}{'original':>10}{'minif.':>10}{'gzip':>10}{'br':>10}"
+            f"{'minif. ms':>11}{'gzip ms':>9}{'br ms':>8}{'economia ms':>13}"
+        )
+        totais = {'original': 0, 'final': 0, 'custo': 0.0, 'economia': 0.0}
+
+        for nome in options['paginas'] or PAGINAS:
+            with override_settings(MIDDLEWARE=sem_middlewares):
+                resposta = client.get(reverse(nome))
+            if resposta.status_code != 200:
+                self.stdout.write(self.style.WARNING(f'{nome:<26}ignorada (status {resposta.status_code})'))
+                continue
+
+            original = resposta.content
+            html = original.decode(resposta.charset)
+
+            minificado, ms_minificar = self.medir(
+                lambda html=html, charset=resposta.charset: minificar_html(html).encode(charset), repeticoes
+            )
+            em_gzip, ms_gzip = self.medir(lambda minificado=minificado: gzip.compress(minificado), repeticoes)
+            if brotli is not None:
+                em_br, ms_br = self.medir(
+                    lambda minificado=minificado: brotli.compress(minificado, quality=QUALIDADE_BROTLI), repeticoes
+                )
+                final, ms_compressao = em_br, ms_br
+                coluna_br, coluna_ms_br = str(len(em_br)), f'{ms_br:.2f}'
+            else:
+                final, ms_compressao = em_gzip, ms_gzip
+                coluna_br, coluna_ms_br = '-', '-'
+
+            # Tempo de transferência economizado menos o custo de minificar e comprimir
+            custo = ms_minificar + ms_compressao
+            economia = (len(original) - len(final)) / bytes_por_ms - custo
+            totais['original'] += len(original)
+            totais['final'] += len(final)
+            totais['custo'] += custo
+            totais['economia'] += economia
+
+            self.stdout.write(
+                f'{nome:<26}{len(original):>10}{len(minificado):>10}{len(em_gzip):>10}{coluna_br:>10}'
+                f'{ms_minificar:>11.2f}{ms_gzip:>9.2f}{coluna_ms_br:>8}{economia:>13.1f}'
+            )
+
+        if totais['original']:
+            reducao = 100 * (1 - totais['final'] / totais['original'])
+            self.stdout.write(self.style.SUCCESS(
+                f"\nTotal: {totais['original']} -> {totais['final']} bytes ({reducao:.1f}% menor); "
+                f"custo no servidor {totais['custo']:.1f} ms, economia líquida estimada "
+                f"{totais['economia']:.1f} ms a {options['mbps']:g} Mbps."
+            ))
+        if brotli is None:
+            self.stdout.write(self.style.WARNING('Pacote brotli não instalado: a economia considera só o gzip.'))
+
+    def obter_usuario(self, email):
+        if email:
+            try:
+                return User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f'Usuário {email} não encontrado.')
+        usuario = User.objects.filter(Q(is_superuser=True) | Q(perfil='administrador')).order_by('id').first()
+        if usuario is None:
+            raise CommandError('Nenhum administrador cadastrado; informe --email.')
+        return usuario
+
+    def medir(self, funcao, repeticoes):
+        """Executa a função várias vezes e devolve o último resultado e o tempo médio em ms."""
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            resultado = funcao()
+        return resultado, (time.perf_counter() - inicio) * 1000 / repeticoes
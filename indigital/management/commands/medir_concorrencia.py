@@ -0,0 +1,123 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.urls import reverse
+
+from indigital.models import Laboratorio
+from usuarios.models import User
+
+
+# Endpoints medidos por padrão (views assíncronas) e como obter seus argumentos
+ROTAS = {
+    'verificar_disponibilidades': lambda: [Laboratorio.objects.order_by('id').values_list('id', flat=True).first()],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Dispara requisições simultâneas contra um ou mais servidores em execução (por exemplo o '
+        'deploy síncrono, SERVER_MODE=wsgi, e o ASGI) e compara vazão e latência.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--servidor', action='append', required=True, metavar='NOME=URL',
+            help='Servidor a medir, como sync=http://127.0.0.1:8001 (pode repetir).',
+        )
+        parser.add_argument('--email', help='Usuário usado nas requisições (padrão: primeiro administrador).')
+        parser.add_argument('--concorrencia', type=int, default=50, help='Requisições em paralelo.')
+        parser.add_argument('--requisicoes', type=int, default=500, help='Total de requisições por rota e servidor.')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Timeout de cada requisição, em segundos.')
+        parser.add_argument('rotas', nargs='*', help='Nomes de URL ou caminhos (padrão: endpoints assíncronos).')
+
+    def handle(self, *args, **options):
+        servidores = []
+        for item in options['servidor']:
+            nome, separador, url = item.partition('=')
+            if not separador or not url.startswith(('http://', 'https://')):
+                raise CommandError(f'Servidor inválido: {item} (use NOME=URL).')
+            servidores.append((nome, url.rstrip('/')))
+
+        caminhos = [self.caminho(rota) for rota in options['rotas'] or ROTAS]
+        sessao = self.criar_sessao(self.obter_usuario(options['email']))
+        cabecalhos = {
+            'Cookie': f'{settings.SESSION_COOKIE_NAME}={sessao.session_key}',
+            'X-Requested-With': 'XMLHttpRequest',
+        }
+        concorrencia = max(options['concorrencia'], 1)
+        total = max(options['requisicoes'], 1)
+
+        self.stdout.write(
+            f"{'servidor':<12}{'caminho':<36}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'máx ms':>9}{'erros':>7}"
+        )
+        try:
+            for caminho in caminhos:
+                for nome, url in servidores:
+                    tempos, erros, duracao = self.medir(
+                        url + caminho, cabecalhos, concorrencia, total, options['timeout']
+                    )
+                    if not tempos:
+                        self.stdout.write(self.style.WARNING(f'{nome:<12}{caminho:<36}todas as requisições falharam'))
+                        continue
+                    percentis = statistics.quantiles(tempos, n=20) if len(tempos) > 1 else tempos * 19
+                    self.stdout.write(
+                        f'{nome:<12}{caminho:<36}{len(tempos) / duracao:>9.1f}{statistics.median(tempos):>9.1f}'
+                        f'{percentis[18]:>9.1f}{max(tempos):>9.1f}{erros:>7}'
+                    )
+        finally:
+            sessao.delete()
+
+    def caminho(self, rota):
+        if rota.startswith('/'):
+            return rota
+        argumentos = ROTAS[rota]() if rota in ROTAS else []
+        if None in argumentos:
+            raise CommandError(f'Sem dados para montar a URL de {rota}.')
+        return reverse(rota, args=argumentos)
+
+    def obter_usuario(self, email):
+        if email:
+            try:
+                return User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f'Usuário {email} não encontrado.')
+        usuario = User.objects.filter(Q(is_superuser=True) | Q(perfil='administrador')).order_by('id').first()
+        if usuario is None:
+            raise CommandError('Nenhum administrador cadastrado; informe --email.')
+        return usuario
+
+    def criar_sessao(self, usuario):
+        """Sessão autenticada do usuário, como a criada pelo login, apagada ao final da medição."""
+        sessao = import_module(settings.SESSION_ENGINE).SessionStore()
+        sessao[SESSION_KEY] = usuario._meta.pk.value_to_string(usuario)
+        sessao[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        sessao[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+        sessao.save()
+        return sessao
+
+    def medir(self, url, cabecalhos, concorrencia, total, timeout):
+        """Tempos (ms) das requisições bem-sucedidas, número de erros e duração total (s)."""
+        def requisitar(_):
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(url, headers=cabecalhos), timeout=timeout) as resposta:
+                    resposta.read()
+                    sucesso = resposta.status == 200
+            except (urllib.error.URLError, OSError):
+                sucesso = False
+            return sucesso, (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+            resultados = list(executor.map(requisitar, range(total)))
+        duracao = time.perf_counter() - inicio
+        tempos = [ms for sucesso, ms in resultados if sucesso]
+        return tempos, len(resultados) - len(tempos), duracao
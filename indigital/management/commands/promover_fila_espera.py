@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from indigital.fila_espera import promover_fila_espera
+from indigital.models import Disponibilidade, FilaEspera
+
+
+class Command(BaseCommand):
+    help = (
+        'Promove a fila de espera de todas as disponibilidades futuras que têm vagas '
+        'livres, para recuperar vagas que ficaram sem promoção.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--disponibilidade', type=int, help='Processa apenas esta disponibilidade.')
+        parser.add_argument('--lote', type=int, default=500, help='Disponibilidades lidas do banco por vez.')
+
+    def handle(self, *args, **options):
+        disponibilidades = Disponibilidade.objects.filter(
+            inicio_em__gt=timezone.now(),
+            vagas__gt=0,
+        ).filter(
+            Exists(FilaEspera.objects.filter(disponibilidade=OuterRef('pk')))
+        ).select_related('laboratorio').order_by('inicio_em')
+
+        if options['disponibilidade']:
+            disponibilidades = disponibilidades.filter(id=options['disponibilidade'])
+
+        total = 0
+        for disponibilidade in disponibilidades.iterator(chunk_size=options['lote']):
+            promovidas = promover_fila_espera(disponibilidade)
+            if promovidas:
+                total += len(promovidas)
+                self.stdout.write(
+                    f'{disponibilidade.laboratorio.num_laboratorio} {disponibilidade.data:%d/%m/%Y} '
+                    f'{disponibilidade.horario_inicio:%H:%M}: {len(promovidas)} promovido(s)'
+                )
+
+        self.stdout.write(self.style.SUCCESS(f'{total} usuário(s) promovido(s) da fila de espera.'))
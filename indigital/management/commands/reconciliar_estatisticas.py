@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from indigital.models import EstatisticaUsuario
+from usuarios.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula do zero os contadores de reservas de cada usuário (EstatisticaUsuario) '
+        'a partir da tabela de reservas e informa quantos estavam divergentes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=500, help='Usuários recalculados por transação.')
+
+    def handle(self, *args, **options):
+        ids = list(User.objects.order_by('id').values_list('id', flat=True))
+        divergentes = 0
+        for inicio in range(0, len(ids), options['lote']):
+            lote = ids[inicio:inicio + options['lote']]
+            with transaction.atomic():
+                # Trava as linhas atuais para que nenhuma mudança de reserva se perca no meio do cálculo
+                atuais = {
+                    e.usuario_id: e
+                    for e in EstatisticaUsuario.objects.select_for_update().filter(usuario_id__in=lote)
+                }
+                for novo in EstatisticaUsuario.recalcular(lote):
+                    atual = atuais.get(novo.usuario_id)
+                    if atual is None or any(
+                        getattr(atual, campo) != getattr(novo, campo) for campo in EstatisticaUsuario.CONTADORES
+                    ):
+                        divergentes += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(ids)} usuário(s) recalculado(s), {divergentes} com contadores divergentes corrigidos.'
+        ))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from indigital.models import Disponibilidade
+from indigital.vagas import divergencias, excedidas, reconciliar
+
+
+# Divergências listadas uma a uma na saída; acima disso, só o total
+MAXIMO_LISTADAS = 50
+
+
+class Command(BaseCommand):
+    help = (
+        'Recalcula as vagas restantes de cada horário (vagas ofertadas menos reservas aprovadas) '
+        'com uma consulta agrupada, informa os contadores divergentes e os corrige em lote. '
+        'Com --verificar só informa e termina com erro se houver divergência (verificação pós-deploy).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verificar', action='store_true', help='Só verifica, sem corrigir.')
+        parser.add_argument('--abertas', action='store_true', help='Só os horários ainda não encerrados.')
+
+    def handle(self, *args, **options):
+        disponibilidades = Disponibilidade.objects.all()
+        if options['abertas']:
+            disponibilidades = disponibilidades.filter(encerrada=False)
+
+        if options['verificar']:
+            encontradas = divergencias(disponibilidades)
+        else:
+            encontradas = reconciliar(disponibilidades)
+
+        for item in encontradas[:MAXIMO_LISTADAS]:
+            self.stdout.write(
+                f"Horário {item['id']}: {item['vagas']} vaga(s) no contador, {item['vagas_calculadas']} "
+                f"calculada(s) ({item['total_vagas']} ofertada(s), {item['aprovadas']} aprovada(s))."
+            )
+        if len(encontradas) > MAXIMO_LISTADAS:
+            self.stdout.write(f'... e mais {len(encontradas) - MAXIMO_LISTADAS} horário(s).')
+
+        total_excedidas = excedidas(disponibilidades)
+        if total_excedidas:
+            self.stdout.write(self.style.WARNING(
+                f'{total_excedidas} horário(s) com mais reservas aprovadas que vagas ofertadas.'
+            ))
+
+        if not encontradas:
+            self.stdout.write(self.style.SUCCESS('Nenhum contador de vagas divergente.'))
+        elif options['verificar']:
+            raise CommandError(
+                f'{len(encontradas)} horário(s) com contador de vagas divergente. '
+                'Rode "python manage.py reconciliar_vagas" para corrigir.'
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(f'{len(encontradas)} contador(es) de vagas corrigido(s).'))
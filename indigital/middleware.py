@@ -0,0 +1,368 @@
+import logging
+import math
+import re
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.template.loader import render_to_string
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+from .consultas_repetidas import verificar_consultas
+from .perfilamento import CABECALHO, PARAMETRO, perfilar, token_valido
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele as respostas saem só em gzip
+    brotli = None
+
+
+re_aceita_brotli = re.compile(r'\bbr\b')
+
+# Blocos cujo conteúdo não pode ter o espaço em branco alterado
+re_blocos_protegidos = re.compile(
+    r'(<(pre|textarea|script|style)\b[^>]*>.*?</\2\s*>)', re.IGNORECASE | re.DOTALL
+)
+re_recuo = re.compile(r'\n[ \t\r\n\f]+')
+re_espaco_final = re.compile(r'[ \t]+\n')
+
+# Qualidade do brotli para respostas dinâmicas: próxima do gzip em tempo, menor em bytes
+QUALIDADE_BROTLI = 5
+
+logger = logging.getLogger('indigital.middleware')
+
+
+def caminho_ignorado(request, nome_configuracao):
+    """Indica se o path da requisição começa por algum prefixo listado na configuração."""
+    prefixos = getattr(settings, nome_configuracao, [])
+    return any(request.path.startswith(prefixo) for prefixo in prefixos)
+
+
+def minificar_html(html):
+    """
+    Remove recuos, linhas em branco e espaços no fim das linhas do HTML.
+
+    Todo trecho de espaço que contém quebra de linha vira uma única quebra de linha,
+    o que não muda a renderização. O conteúdo de <pre>, <textarea> e <script> fica
+    intacto; em <style> só o recuo das linhas é removido.
+    """
+    partes = re_blocos_protegidos.split(html)
+    resultado = []
+    # split com dois grupos devolve: texto, bloco, nome da tag, texto, bloco, nome...
+    for i in range(0, len(partes), 3):
+        texto = re_espaco_final.sub('\n', partes[i])
+        resultado.append(re_recuo.sub('\n', texto))
+        if i + 1 < len(partes):
+            bloco, tag = partes[i + 1], partes[i + 2].lower()
+            if tag == 'style':
+                bloco = re_recuo.sub('\n', bloco)
+            resultado.append(bloco)
+    return ''.join(resultado)
+
+
+def comprimir_sequencia_brotli(sequencia):
+    compressor = brotli.Compressor(quality=QUALIDADE_BROTLI)
+    for item in sequencia:
+        dados = compressor.process(item) + compressor.flush()
+        if dados:
+            yield dados
+    yield compressor.finish()
+
+
+async def comprimir_sequencia_brotli_async(sequencia):
+    compressor = brotli.Compressor(quality=QUALIDADE_BROTLI)
+    async for item in sequencia:
+        dados = compressor.process(item) + compressor.flush()
+        if dados:
+            yield dados
+    yield compressor.finish()
+
+
+class CompressaoMiddleware(GZipMiddleware):
+    """
+    Comprime as respostas em brotli quando o navegador aceita (e o pacote está
+    instalado) ou em gzip, inclusive respostas em streaming.
+
+    Respostas que usaram o token CSRF saem sempre em gzip: o GZipMiddleware acrescenta
+    bytes aleatórios ao cabeçalho contra o BREACH, o que o brotli não tem.
+
+    Paths com prefixo em COMPRESSAO_PATHS_IGNORADOS não são comprimidos.
+    """
+
+    def process_response(self, request, response):
+        if caminho_ignorado(request, 'COMPRESSAO_PATHS_IGNORADOS'):
+            return response
+
+        aceita = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        # get_token() marca CSRF_COOKIE_NEEDS_UPDATE: o token pode estar no corpo da resposta
+        usou_csrf = request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        if brotli is None or usou_csrf or not re_aceita_brotli.search(aceita):
+            return super().process_response(request, response)
+
+        # Mesmos critérios do GZipMiddleware
+        if not response.streaming and len(response.content) < 200:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = comprimir_sequencia_brotli_async(
+                    response.streaming_content
+                )
+            else:
+                response.streaming_content = comprimir_sequencia_brotli(
+                    response.streaming_content
+                )
+            del response.headers['Content-Length']
+        else:
+            comprimido = brotli.compress(response.content, quality=QUALIDADE_BROTLI)
+            if len(comprimido) >= len(response.content):
+                return response
+            response.content = comprimido
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+
+        return response
+
+
+class MinificarHTMLMiddleware(MiddlewareMixin):
+    """
+    Aplica minificar_html às respostas HTML completas (não as em streaming).
+
+    Paths com prefixo em MINIFICAR_HTML_PATHS_IGNORADOS são entregues como estão.
+    """
+
+    def process_response(self, request, response):
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('text/html')
+            or caminho_ignorado(request, 'MINIFICAR_HTML_PATHS_IGNORADOS')
+        ):
+            return response
+
+        html = response.content.decode(response.charset)
+        response.content = minificar_html(html).encode(response.charset)
+        if response.has_header('Content-Length'):
+            response.headers['Content-Length'] = str(len(response.content))
+        return response
+
+
+def consumir_ficha(chave, capacidade, reposicao):
+    """
+    Balde de fichas guardado no cache: cada requisição consome uma ficha e o balde
+    é reabastecido com `reposicao` fichas por segundo, até `capacidade`.
+
+    Retorna 0 se havia ficha, ou quantos segundos faltam para a próxima. A leitura e
+    a gravação não são atômicas: com muitos workers simultâneos o limite pode ser
+    ultrapassado por poucas requisições, o que é aceitável aqui.
+    """
+    agora = time.time()
+    fichas, ultima = cache.get(chave, (capacidade, agora))
+    fichas = min(capacidade, fichas + (agora - ultima) * reposicao)
+    if fichas < 1:
+        return (1 - fichas) / reposicao
+    cache.set(chave, (fichas - 1, agora), math.ceil(capacidade / reposicao) + 1)
+    return 0
+
+
+def cache_compartilhado():
+    """
+    Indica se o cache padrão é visto por todos os workers. LocMemCache é por processo
+    (só serve no ambiente local, com um processo do runserver) e DummyCache não guarda nada.
+    """
+    if settings.BUILD_ENV == 'local':
+        return True
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def ip_cliente(request):
+    """
+    IP do cliente informado pelo proxy em CABECALHO_IP_CLIENTE. Atrás do socket unix do
+    gunicorn o REMOTE_ADDR vem vazio; o cabeçalho é confiável porque só o nginx alcança o socket.
+    """
+    return request.META.get(settings.CABECALHO_IP_CLIENTE) or request.META.get('REMOTE_ADDR', '')
+
+
+class LimiteRequisicoesMiddleware(MiddlewareMixin):
+    """
+    Protege as rotas de reserva durante a abertura das inscrições.
+
+    - Limite por usuário e rota: as rotas de LIMITE_REQUISICOES têm um balde de fichas
+      por usuário autenticado (o id gravado na sessão, que só existe em sessão válida)
+      ou, sem login, pelo IP do cliente; quem esgota o balde recebe 429 com Retry-After.
+    - Sala de espera: no máximo SALA_ESPERA_MAXIMO requisições simultâneas nas rotas de
+      SALA_ESPERA_ROTAS. As demais recebem uma página mínima (503) com a espera estimada,
+      que se recarrega sozinha.
+
+    Precisa vir depois do AuthenticationMiddleware. Os baldes e as vagas da sala de espera
+    ficam no cache: sem um cache compartilhado entre os workers (Redis, REDIS_URL), fora do
+    ambiente local, o middleware se desliga e avisa no log, em vez de aplicar limites por processo.
+    """
+
+    def __init__(self, get_response):
+        if not cache_compartilhado():
+            logger.warning(
+                'Limite de requisições e sala de espera desligados: o cache não é compartilhado '
+                'entre os workers (configure REDIS_URL).'
+            )
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        try:
+            rota = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+
+        limite = getattr(settings, 'LIMITE_REQUISICOES', {}).get(rota)
+        if limite:
+            # O id do usuário na sessão carregada do banco: um cookie inventado não tem sessão
+            usuario_id = request.session.get(SESSION_KEY)
+            identificacao = f'usuario:{usuario_id}' if usuario_id else f'ip:{ip_cliente(request)}'
+            # Sem login e sem IP conhecido não há como separar os clientes: só a sala de espera vale
+            espera = 0
+            if identificacao != 'ip:':
+                espera = consumir_ficha(f'limite:{rota}:{identificacao}', *limite)
+            if espera:
+                return self.recusar(
+                    request, 429, espera,
+                    'Muitas solicitações em pouco tempo. Aguarde alguns segundos e tente novamente.',
+                )
+
+        maximo = getattr(settings, 'SALA_ESPERA_MAXIMO', 0)
+        if maximo and rota in getattr(settings, 'SALA_ESPERA_ROTAS', []):
+            # Cada vaga é uma chave no cache; a expiração devolve vagas de workers que morreram
+            for numero in range(maximo):
+                chave = f'sala_espera:vaga:{numero}'
+                if cache.add(chave, 1, settings.SALA_ESPERA_TIMEOUT):
+                    request.vaga_sala_espera = (chave, time.monotonic())
+                    return None
+            return self.recusar(
+                request, 503, self.espera_estimada(maximo),
+                'Muitos acessos aos horários neste momento. Você está na sala de espera e '
+                'a página será recarregada automaticamente.',
+            )
+        return None
+
+    def process_response(self, request, response):
+        vaga = getattr(request, 'vaga_sala_espera', None)
+        if vaga:
+            chave, inicio = vaga
+            cache.delete(chave)
+            # Média móvel da duração das requisições, usada na estimativa de espera
+            media = cache.get('sala_espera:duracao', 1.0)
+            cache.set('sala_espera:duracao', media * 0.8 + (time.monotonic() - inicio) * 0.2, None)
+        return response
+
+    def espera_estimada(self, maximo):
+        # Quantos foram recusados nos últimos segundos, divididos entre as vagas
+        if cache.add('sala_espera:esperando', 1, 10):
+            esperando = 1
+        else:
+            try:
+                esperando = cache.incr('sala_espera:esperando')
+            except ValueError:
+                esperando = 1
+        return max(1, esperando / maximo * cache.get('sala_espera:duracao', 1.0))
+
+    def recusar(self, request, status, espera, mensagem):
+        espera = math.ceil(espera)
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            resposta = JsonResponse({'success': False, 'error': mensagem, 'espera': espera}, status=status)
+        else:
+            # Renderizada sem request: sem context processors, sem sessão e sem banco
+            resposta = HttpResponse(render_to_string('sala_espera.html', {
+                'mensagem': mensagem,
+                'espera': espera,
+                'recarregar': request.method == 'GET',
+            }), status=status)
+        resposta['Retry-After'] = str(espera)
+        resposta['Cache-Control'] = 'no-store'
+        return resposta
+
+
+class PerfilamentoMiddleware:
+    """
+    Perfila a requisição quando ela traz o token de perfilamento (parâmetro
+    ?perfilar= ou cabeçalho X-Perfilar) e o usuário é superusuário.
+
+    O perfil do cProfile e as consultas SQL com a linha do código que as originou
+    ficam em PERFILAMENTO_DIR e são listados na página de perfis de requisições.
+    Precisa vir depois do AuthenticationMiddleware.
+
+    Sob ASGI, a requisição perfilada roda em thread, com a view chamada de volta no
+    event loop: as consultas do ORM assíncrono caem nessa mesma thread e são capturadas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = request.GET.get(PARAMETRO) or request.headers.get(CABECALHO)
+        if token and request.user.is_superuser and token_valido(token, request.user):
+            return perfilar(request, self.get_response)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        token = request.GET.get(PARAMETRO) or request.headers.get(CABECALHO)
+        if token:
+            usuario = await request.auser()
+            if usuario.is_superuser and token_valido(token, usuario):
+                return await sync_to_async(perfilar)(request, async_to_sync(self.get_response))
+        return await self.get_response(request)
+
+
+class ConsultasRepetidasMiddleware:
+    """
+    Detector de N+1: agrupa as consultas SELECT da requisição pela forma do SQL e
+    aponta as repetidas mais de CONSULTAS_REPETIDAS_LIMITE vezes, com a view, a linha
+    do código e o template de origem.
+
+    CONSULTAS_REPETIDAS_MODO: "log" registra um aviso (desenvolvimento), "erro" levanta
+    ConsultasRepetidasError (executor de testes) e None desliga.
+    Sob ASGI, a contagem é feita como em PerfilamentoMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        modo = getattr(settings, 'CONSULTAS_REPETIDAS_MODO', None)
+        if not modo:
+            return self.get_response(request)
+        return verificar_consultas(request, self.get_response, modo)
+
+    async def __acall__(self, request):
+        modo = getattr(settings, 'CONSULTAS_REPETIDAS_MODO', None)
+        if not modo:
+            return await self.get_response(request)
+        return await sync_to_async(verificar_consultas)(request, async_to_sync(self.get_response), modo)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0024_alter_reserva_status_aprovacao'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reserva',
+            name='status_aprovacao',
+            field=models.CharField(choices=[('P', 'Pendente'), ('A', 'Aprovada'), ('R', 'Rejeitada'), ('C', 'Cancelada')], default='', max_length=1),
+        ),
+    ]
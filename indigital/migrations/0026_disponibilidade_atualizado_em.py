@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0025_alter_reserva_status_aprovacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disponibilidade',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0027_notificacao'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disponibilidade',
+            name='encerrada',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
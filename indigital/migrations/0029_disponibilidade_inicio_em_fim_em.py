@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from django.db import migrations, models, transaction
+from django.utils import timezone
+
+
+LOTE = 1000
+
+
+def preencher_inicio_fim(apps, schema_editor):
+    """Preenche inicio_em/fim_em das disponibilidades existentes, em lotes por id."""
+    Disponibilidade = apps.get_model('indigital', 'Disponibilidade')
+    fuso = timezone.get_default_timezone()
+    ultimo_id = 0
+    while True:
+        # Cada lote em sua própria transação, para não travar a tabela inteira
+        with transaction.atomic():
+            lote = list(
+                Disponibilidade.objects.filter(id__gt=ultimo_id)
+                .order_by('id')
+                .only('id', 'data', 'horario_inicio', 'horario_fim')[:LOTE]
+            )
+            if not lote:
+                break
+            for disponibilidade in lote:
+                disponibilidade.inicio_em = timezone.make_aware(
+                    datetime.combine(disponibilidade.data, disponibilidade.horario_inicio), fuso
+                )
+                disponibilidade.fim_em = timezone.make_aware(
+                    datetime.combine(disponibilidade.data, disponibilidade.horario_fim), fuso
+                )
+            Disponibilidade.objects.bulk_update(lote, ['inicio_em', 'fim_em'])
+        ultimo_id = lote[-1].id
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('indigital', '0028_disponibilidade_encerrada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disponibilidade',
+            name='inicio_em',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='disponibilidade',
+            name='fim_em',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(preencher_inicio_fim, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0029_disponibilidade_inicio_em_fim_em'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='disponibilidade',
+            name='inicio_em',
+            field=models.DateTimeField(db_index=True, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='disponibilidade',
+            name='fim_em',
+            field=models.DateTimeField(db_index=True, editable=False),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0030_alter_disponibilidade_inicio_em_fim_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='UtilizacaoDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField()),
+                ('dia_semana', models.PositiveSmallIntegerField()),
+                ('hora', models.PositiveSmallIntegerField()),
+                ('horarios_ofertados', models.PositiveIntegerField(default=0)),
+                ('vagas_ofertadas', models.PositiveIntegerField(default=0)),
+                ('aprovadas', models.PositiveIntegerField(default=0)),
+                ('presentes', models.PositiveIntegerField(default=0)),
+                ('faltas', models.PositiveIntegerField(default=0)),
+                ('canceladas', models.PositiveIntegerField(default=0)),
+                ('pico_fila_espera', models.PositiveIntegerField(default=0)),
+                ('calculado_em', models.DateTimeField()),
+                ('laboratorio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utilizacoes', to='indigital.laboratorio')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['data'], name='indigital_u_data_a29ffe_idx'), models.Index(fields=['calculado_em'], name='indigital_u_calcula_7e7301_idx')],
+                'unique_together': {('laboratorio', 'data', 'hora')},
+            },
+        ),
+    ]
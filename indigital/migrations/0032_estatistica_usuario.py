@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0031_utilizacao_diaria'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstatisticaUsuario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_reservas', models.IntegerField(default=0)),
+                ('aprovadas', models.IntegerField(default=0)),
+                ('pendentes', models.IntegerField(default=0)),
+                ('presentes', models.IntegerField(default=0)),
+                ('faltas', models.IntegerField(default=0)),
+                ('a_realizar', models.IntegerField(default=0)),
+                ('usuario', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='estatistica', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
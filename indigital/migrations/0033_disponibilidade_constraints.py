@@ -0,0 +1,73 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:32
+
+from django.db import migrations, models
+
+
+TABELA = 'indigital_disponibilidade'
+
+POSTGRESQL = [
+    # btree_gist permite usar "=" no laboratorio_id dentro do índice GiST da exclusão
+    'CREATE EXTENSION IF NOT EXISTS btree_gist',
+    f'ALTER TABLE {TABELA} ADD CONSTRAINT disponibilidade_vagas_nao_negativas CHECK (vagas >= 0)',
+    f'ALTER TABLE {TABELA} ADD CONSTRAINT disponibilidade_inicio_antes_do_fim CHECK (horario_inicio < horario_fim)',
+    f"""
+    ALTER TABLE {TABELA} ADD CONSTRAINT disponibilidade_sem_sobreposicao
+    EXCLUDE USING gist (laboratorio_id WITH =, tstzrange(inicio_em, fim_em, '[)') WITH &&)
+    """,
+]
+
+POSTGRESQL_REVERSO = [
+    f'ALTER TABLE {TABELA} DROP CONSTRAINT IF EXISTS disponibilidade_sem_sobreposicao',
+    f'ALTER TABLE {TABELA} DROP CONSTRAINT IF EXISTS disponibilidade_inicio_antes_do_fim',
+    f'ALTER TABLE {TABELA} DROP CONSTRAINT IF EXISTS disponibilidade_vagas_nao_negativas',
+]
+
+
+def verificar_dados(schema_editor):
+    """Falha com uma mensagem clara se já existirem horários que violam as novas regras."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT a.id, b.id FROM {TABELA} a
+            JOIN {TABELA} b ON a.laboratorio_id = b.laboratorio_id AND a.id < b.id
+            WHERE a.inicio_em < b.fim_em AND a.fim_em > b.inicio_em
+        """)
+        sobrepostas = cursor.fetchall()
+        cursor.execute(f'SELECT id FROM {TABELA} WHERE vagas < 0 OR horario_inicio >= horario_fim')
+        invalidas = [linha[0] for linha in cursor.fetchall()]
+    if sobrepostas or invalidas:
+        raise RuntimeError(
+            'Corrija as disponibilidades antes de aplicar a migração. '
+            f'Sobrepostas (pares de ids): {sobrepostas}. Vagas ou horários inválidos (ids): {invalidas}.'
+        )
+
+
+def criar_constraints(apps, schema_editor):
+    # No SQLite as mesmas regras são triggers, criados após o migrate (indigital.signals)
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    verificar_dados(schema_editor)
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRESQL:
+            schema_editor.execute(sql)
+
+
+def remover_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in POSTGRESQL_REVERSO:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0032_estatistica_usuario'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='disponibilidade',
+            name='encerrada',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.RunPython(criar_constraints, remover_constraints),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0033_disponibilidade_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='frequencia_registrada_em',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-19 16:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0034_reserva_frequencia_registrada_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='motivo_pendencia',
+            field=models.CharField(blank=True, choices=[('sem_vagas', 'Sem vagas'), ('faltas', 'Muitas faltas'), ('cota_semanal', 'Cota semanal atingida')], default='', editable=False, max_length=20),
+        ),
+    ]
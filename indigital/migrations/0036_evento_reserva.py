@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-19 17:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0035_reserva_motivo_pendencia'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoReserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('criado_em', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('tipo', models.PositiveSmallIntegerField(choices=[(1, 'Criada'), (2, 'Aprovada'), (3, 'Rejeitada'), (4, 'Cancelada'), (5, 'Promovida da fila'), (6, 'Frequência registrada'), (7, 'Entrou na fila de espera')])),
+                ('status_aprovacao', models.CharField(blank=True, max_length=1)),
+                ('status_frequencia', models.CharField(blank=True, max_length=1)),
+                ('disponibilidade', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='indigital.disponibilidade')),
+                ('reserva', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='indigital.reserva')),
+                ('usuario', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
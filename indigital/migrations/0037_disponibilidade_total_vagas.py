@@ -0,0 +1,40 @@
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def preencher_total_vagas(apps, schema_editor):
+    # Até aqui vagas guardava só as restantes: o total ofertado é vagas + aprovadas
+    Disponibilidade = apps.get_model('indigital', 'Disponibilidade')
+    disponibilidades = list(
+        Disponibilidade.objects.annotate(aprovadas=Count('reserva', filter=Q(reserva__status_aprovacao='A')))
+        .only('id', 'vagas')
+    )
+    for disponibilidade in disponibilidades:
+        disponibilidade.total_vagas = max(disponibilidade.vagas, 0) + disponibilidade.aprovadas
+    Disponibilidade.objects.bulk_update(disponibilidades, ['total_vagas'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indigital', '0036_evento_reserva'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='disponibilidade',
+            name='total_vagas',
+            field=models.PositiveIntegerField(null=True, verbose_name='Vagas'),
+        ),
+        migrations.RunPython(preencher_total_vagas, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='disponibilidade',
+            name='total_vagas',
+            field=models.PositiveIntegerField(verbose_name='Vagas'),
+        ),
+        migrations.AlterField(
+            model_name='disponibilidade',
+            name='vagas',
+            field=models.IntegerField(editable=False),
+        ),
+    ]
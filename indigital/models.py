@@ -1,9 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, Q
 from usuarios.models import User
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime
 
+# Eventos de reserva acumulados por EventoReserva.agrupar() no contexto atual
+eventos_agrupados = ContextVar('eventos_agrupados', default=None)
+
 class Laboratorio(models.Model):
     num_laboratorio = models.CharField(max_length=10, unique=True)
     capacidade = models.IntegerField(default=30)
@@ -16,27 +22,52 @@ class Disponibilidade(models.Model):
     horario_inicio = models.TimeField()
     horario_fim = models.TimeField()
     data = models.DateField()
-    vagas = models.IntegerField()
+    # Vagas ofertadas no horário (até a capacidade do laboratório)
+    total_vagas = models.PositiveIntegerField(verbose_name='Vagas')
+    # Vagas restantes: total_vagas menos as reservas aprovadas. Contador decrementado e
+    # incrementado pelas aprovações e cancelamentos; o comando reconciliar_vagas o
+    # recalcula a partir das reservas (indigital.vagas)
+    vagas = models.IntegerField(editable=False)
     monitor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='monitor_disponibilidade', null=True, blank=True)
+    # Versão da linha: usada nas chaves de cache dos fragmentos de template
+    atualizado_em = models.DateTimeField(auto_now=True)
+    # Marcada pelo comando encerrar_disponibilidades depois que o horário termina
+    encerrada = models.BooleanField(default=False, db_index=True, editable=False)
+    # Início e fim já combinados (aware), mantidos pelo save(): permitem filtrar e
+    # ordenar por "já começou"/"já terminou" direto no banco
+    inicio_em = models.DateTimeField(db_index=True, editable=False)
+    fim_em = models.DateTimeField(db_index=True, editable=False)
 
+    # Além do unique_together, o banco garante vagas >= 0, início antes do fim e que
+    # horários do mesmo laboratório não se sobreponham: constraints no PostgreSQL
+    # (migração 0033) e triggers no SQLite (indigital.signals). As views tratam a
+    # violação como IntegrityError em vez de consultar antes de salvar.
     class Meta:
         unique_together = ('laboratorio', 'data', 'horario_inicio', 'horario_fim')
 
+    @staticmethod
+    def combinar(data, horario):
+        """Combina data e horário em um datetime aware no timezone padrão."""
+        dt = datetime.combine(data, horario)
+        return timezone.make_aware(dt, timezone.get_default_timezone())
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.vagas is None:
+            self.vagas = self.total_vagas
+        self.inicio_em = self.combinar(self.data, self.horario_inicio)
+        self.fim_em = self.combinar(self.data, self.horario_fim)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'data', 'horario_inicio', 'horario_fim'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'inicio_em', 'fim_em'}
+        super().save(*args, **kwargs)
+
     def start_datetime(self):
         """Retorna o datetime (aware) do início da disponibilidade usando o timezone atual."""
-        dt = datetime.combine(self.data, self.horario_inicio)
-        if timezone.is_naive(dt):
-            tz = timezone.get_current_timezone()
-            dt = timezone.make_aware(dt, tz)
-        return timezone.localtime(dt)
+        return timezone.localtime(self.inicio_em)
 
     def end_datetime(self):
         """Retorna o datetime (aware) do fim da disponibilidade usando o timezone atual."""
-        dt = datetime.combine(self.data, self.horario_fim)
-        if timezone.is_naive(dt):
-            tz = timezone.get_current_timezone()
-            dt = timezone.make_aware(dt, tz)
-        return timezone.localtime(dt)
+        return timezone.localtime(self.fim_em)
 
     def is_passada(self):
         """Retorna True se a disponibilidade já começou (horário de início menor que agora).
@@ -44,16 +75,14 @@ class Disponibilidade(models.Model):
         Observação: consideramos que, se o horário de início for anterior ao tempo atual, a
         disponibilidade já passou e não deve mais aceitar reservas.
         """
-        agora = timezone.localtime(timezone.now())
-        inicio = self.start_datetime()
-        return agora > inicio
+        return timezone.now() > self.inicio_em
 
     def clean(self):
         super().clean()
-        if self.vagas < 1:
+        if self.total_vagas < 1:
             raise ValidationError("O número de vagas deve ser no mínimo 1.")
 
-        if self.vagas > self.laboratorio.capacidade:
+        if self.total_vagas > self.laboratorio.capacidade:
             raise ValidationError("O número de vagas não pode ser maior que a capacidade do laboratório.")
 
     def __str__(self):
@@ -66,6 +95,17 @@ class Reserva(models.Model):
     data_solicitacao = models.DateTimeField(auto_now_add=True)
 
     status_frequencia = models.CharField(max_length=1, choices=[('P', 'Presente'), ('F', 'Faltou'), ('N', 'Não registrado')], default='', blank=True)
+    # Momento em que a frequência foi marcada (no aparelho do monitor, na chamada offline):
+    # na sincronização vale a marcação mais recente de cada reserva
+    frequencia_registrada_em = models.DateTimeField(null=True, blank=True, editable=False)
+    # Usado para achar os dias que mudaram ao atualizar UtilizacaoDiaria
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+    # Regra que impediu a aprovação automática (indigital.aprovacao_automatica) de uma
+    # reserva pendente, mostrada aos administradores
+    motivo_pendencia = models.CharField(
+        max_length=20, blank=True, default='', editable=False,
+        choices=[('sem_vagas', 'Sem vagas'), ('faltas', 'Muitas faltas'), ('cota_semanal', 'Cota semanal atingida')],
+    )
 
     def clean(self):
         super().clean()
@@ -86,7 +126,7 @@ class Reserva(models.Model):
             usuario=self.usuario,
             disponibilidade__data=self.disponibilidade.data,
             status_aprovacao__in=['P', 'A'] 
-        ).exclude(id=self.id)
+        ).exclude(id=self.id).select_related('disponibilidade')
         
         for reserva in reservas_conflitantes:
             inicio_atual = self.disponibilidade.horario_inicio
@@ -100,6 +140,29 @@ class Reserva(models.Model):
                     f"Você já possui uma reserva {status_texto} que se sobrepõe a este horário na mesma data."
                 )
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        reserva = super().from_db(db, field_names, values)
+        # Estado carregado do banco, para calcular a diferença nos contadores ao salvar
+        reserva._estado_original = (reserva.__dict__.get('status_aprovacao'), reserva.__dict__.get('status_frequencia'))
+        return reserva
+
+    def save(self, *args, **kwargs):
+        nova = self._state.adding
+        anterior = getattr(self, '_estado_original', (None, None))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            atual = (self.status_aprovacao, self.status_frequencia)
+            if nova or atual != anterior:
+                encerrada = self.disponibilidade.encerrada
+                deltas = EstatisticaUsuario.contagens(*atual, encerrada)
+                if not nova:
+                    for campo, valor in EstatisticaUsuario.contagens(*anterior, encerrada).items():
+                        deltas[campo] -= valor
+                EstatisticaUsuario.ajustar(self.usuario_id, deltas)
+                EventoReserva.registrar(EventoReserva.das_transicoes(self, None if nova else anterior))
+        self._estado_original = atual
+
     def __str__(self):
         return self.usuario.username
     
@@ -110,4 +173,260 @@ class FilaEspera(models.Model):
 
     class Meta:
         unique_together = ('usuario', 'disponibilidade')
-        ordering = ['data_solicitacao']
\ No newline at end of file
+        ordering = ['data_solicitacao']
+
+    def save(self, *args, **kwargs):
+        nova = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if nova:
+                EventoReserva.registrar([EventoReserva.da_fila(self)])
+
+class EventoReserva(models.Model):
+    """
+    Log append-only das transições das reservas (e das entradas na fila de espera),
+    para medir tempos (solicitação até aprovação, antecedência do cancelamento,
+    espera na fila) sem reconstruir o histórico a partir de Reserva.
+
+    Cada evento é gravado na mesma transação da mudança: Reserva.save() e
+    FilaEspera.save() registram os seus, e quem altera em lote (bulk_create,
+    bulk_update, update) chama EventoReserva.registrar(). As chaves não têm
+    constraint nem cascata, para que o log sobreviva à remoção dos horários. Leitores
+    incrementais (exportar_eventos) guardam o último id lido como marca.
+    """
+    CRIADA = 1
+    APROVADA = 2
+    REJEITADA = 3
+    CANCELADA = 4
+    PROMOVIDA = 5
+    FREQUENCIA = 6
+    FILA = 7
+    TIPOS = [
+        (CRIADA, 'Criada'),
+        (APROVADA, 'Aprovada'),
+        (REJEITADA, 'Rejeitada'),
+        (CANCELADA, 'Cancelada'),
+        (PROMOVIDA, 'Promovida da fila'),
+        (FREQUENCIA, 'Frequência registrada'),
+        (FILA, 'Entrou na fila de espera'),
+    ]
+    # Evento gerado por cada novo status_aprovacao
+    EVENTOS_APROVACAO = {'P': CRIADA, 'A': APROVADA, 'R': REJEITADA, 'C': CANCELADA}
+
+    criado_em = models.DateTimeField(default=timezone.now, db_index=True)
+    tipo = models.PositiveSmallIntegerField(choices=TIPOS)
+    # Vazia nos eventos de fila de espera
+    reserva = models.ForeignKey(
+        Reserva, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    usuario = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    disponibilidade = models.ForeignKey(
+        Disponibilidade, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    # Status da reserva depois do evento
+    status_aprovacao = models.CharField(max_length=1, blank=True)
+    status_frequencia = models.CharField(max_length=1, blank=True)
+
+    @classmethod
+    def da_reserva(cls, reserva, tipo):
+        return cls(
+            tipo=tipo,
+            reserva_id=reserva.id,
+            usuario_id=reserva.usuario_id,
+            disponibilidade_id=reserva.disponibilidade_id,
+            status_aprovacao=reserva.status_aprovacao,
+            status_frequencia=reserva.status_frequencia,
+        )
+
+    @classmethod
+    def da_fila(cls, fila):
+        return cls(tipo=cls.FILA, usuario_id=fila.usuario_id, disponibilidade_id=fila.disponibilidade_id)
+
+    @classmethod
+    def das_transicoes(cls, reserva, anterior=None):
+        """
+        Eventos da mudança de anterior, o par (status_aprovacao, status_frequencia)
+        carregado do banco, para o estado atual da reserva; anterior None é uma
+        reserva nova, que só nasce aprovada quando promovida da fila de espera.
+        """
+        if anterior is None:
+            return [cls.da_reserva(reserva, cls.PROMOVIDA if reserva.status_aprovacao == 'A' else cls.CRIADA)]
+        eventos = []
+        if reserva.status_aprovacao != anterior[0] and reserva.status_aprovacao in cls.EVENTOS_APROVACAO:
+            eventos.append(cls.da_reserva(reserva, cls.EVENTOS_APROVACAO[reserva.status_aprovacao]))
+        if reserva.status_frequencia != anterior[1]:
+            eventos.append(cls.da_reserva(reserva, cls.FREQUENCIA))
+        return eventos
+
+    @classmethod
+    def registrar(cls, eventos):
+        """Grava os eventos com um bulk_create, ou os guarda se houver um agrupar() ativo."""
+        pendentes = eventos_agrupados.get()
+        if pendentes is not None:
+            pendentes.extend(eventos)
+        elif eventos:
+            cls.objects.bulk_create(eventos)
+
+    @classmethod
+    @contextmanager
+    def agrupar(cls):
+        """
+        Junta os eventos registrados no bloco em um único bulk_create no fim dele.
+        Deve ficar dentro da transação das mudanças (with transaction.atomic(), agrupar()),
+        em blocos sem savepoints desfeitos no meio; aninhado, não faz nada.
+        """
+        if eventos_agrupados.get() is not None:
+            yield
+            return
+        pendentes = []
+        token = eventos_agrupados.set(pendentes)
+        try:
+            yield
+        finally:
+            eventos_agrupados.reset(token)
+        if pendentes:
+            cls.objects.bulk_create(pendentes)
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.criado_em:%d/%m/%Y %H:%M}"
+
+class Notificacao(models.Model):
+    """
+    Saída de e-mails para os usuários. Cada registro é gravado na mesma transação da
+    mudança de status que o originou e enviado depois pelo comando enviar_notificacoes,
+    para que o tempo do SMTP nunca entre na requisição.
+    """
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notificacoes')
+    assunto = models.CharField(max_length=200)
+    mensagem = models.TextField()
+    criada_em = models.DateTimeField(auto_now_add=True)
+    enviada_em = models.DateTimeField(null=True, blank=True)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    erro = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['criada_em']
+        indexes = [
+            # Só as pendentes interessam ao envio; o índice parcial não cresce com o histórico
+            models.Index(
+                fields=['proxima_tentativa'],
+                condition=models.Q(enviada_em__isnull=True),
+                name='notificacao_pendente_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario.email}: {self.assunto}"
+
+class EstatisticaUsuario(models.Model):
+    """
+    Contadores de reservas de cada usuário, lidos pelos dashboards e pelo perfil.
+
+    Reserva.save() ajusta os contadores com F() na mesma transação da mudança de
+    status ou frequência; o comando encerrar_disponibilidades desconta as reservas a
+    realizar dos horários encerrados. O comando reconciliar_estatisticas recalcula
+    tudo a partir das reservas.
+    """
+    usuario = models.OneToOneField(User, on_delete=models.CASCADE, related_name='estatistica')
+    total_reservas = models.IntegerField(default=0)
+    aprovadas = models.IntegerField(default=0)
+    pendentes = models.IntegerField(default=0)
+    presentes = models.IntegerField(default=0)
+    faltas = models.IntegerField(default=0)
+    # Reservas de horários ainda não encerrados sem frequência registrada
+    a_realizar = models.IntegerField(default=0)
+
+    CONTADORES = ['total_reservas', 'aprovadas', 'pendentes', 'presentes', 'faltas', 'a_realizar']
+
+    @staticmethod
+    def contagens(status_aprovacao, status_frequencia, encerrada):
+        """Quanto uma reserva nesse estado soma em cada contador."""
+        return {
+            'total_reservas': 1,
+            'aprovadas': int(status_aprovacao == 'A'),
+            'pendentes': int(status_aprovacao == 'P'),
+            'presentes': int(status_frequencia == 'P'),
+            'faltas': int(status_frequencia == 'F'),
+            'a_realizar': int(not encerrada and status_frequencia in ('', 'N')),
+        }
+
+    @classmethod
+    def agregacoes(cls):
+        """Contadores calculados direto de Reserva, agrupando por usuário."""
+        return {
+            'total_reservas': Count('id'),
+            'aprovadas': Count('id', filter=Q(status_aprovacao='A')),
+            'pendentes': Count('id', filter=Q(status_aprovacao='P')),
+            'presentes': Count('id', filter=Q(status_frequencia='P')),
+            'faltas': Count('id', filter=Q(status_frequencia='F')),
+            'a_realizar': Count('id', filter=Q(disponibilidade__encerrada=False, status_frequencia__in=['', 'N'])),
+        }
+
+    @classmethod
+    def ajustar(cls, usuario_id, deltas):
+        """Soma os deltas aos contadores do usuário; cria a linha recalculando se ainda não existir."""
+        deltas = {campo: F(campo) + valor for campo, valor in deltas.items() if valor}
+        if not deltas:
+            return
+        if not cls.objects.filter(usuario_id=usuario_id).update(**deltas):
+            cls.recalcular([usuario_id])
+
+    @classmethod
+    def recalcular(cls, usuario_ids):
+        """Recalcula do zero os contadores dos usuários informados."""
+        valores = {
+            item['usuario_id']: item
+            for item in Reserva.objects.filter(usuario_id__in=usuario_ids)
+            .values('usuario_id').annotate(**cls.agregacoes()).order_by()
+        }
+        objetos = [
+            cls(usuario_id=usuario_id, **{campo: valores.get(usuario_id, {}).get(campo, 0) for campo in cls.CONTADORES})
+            for usuario_id in usuario_ids
+        ]
+        cls.objects.bulk_create(
+            objetos, update_conflicts=True, unique_fields=['usuario'], update_fields=cls.CONTADORES
+        )
+        return objetos
+
+    @classmethod
+    def do_usuario(cls, usuario):
+        """Linha de contadores do usuário, criada na primeira leitura."""
+        estatistica = cls.objects.filter(usuario=usuario).first()
+        if estatistica is None:
+            estatistica = cls.recalcular([usuario.id])[0]
+        return estatistica
+
+    def __str__(self):
+        return f"Estatísticas de {self.usuario.email}"
+
+class UtilizacaoDiaria(models.Model):
+    """
+    Resumo de uso por laboratório, dia e hora de início, mantido pelo comando
+    atualizar_utilizacao. O relatório de utilização lê só esta tabela, sem varrer
+    Reserva e FilaEspera.
+    """
+    laboratorio = models.ForeignKey(Laboratorio, on_delete=models.CASCADE, related_name='utilizacoes')
+    data = models.DateField()
+    # 0 = segunda-feira, como em date.weekday()
+    dia_semana = models.PositiveSmallIntegerField()
+    hora = models.PositiveSmallIntegerField()
+    horarios_ofertados = models.PositiveIntegerField(default=0)
+    vagas_ofertadas = models.PositiveIntegerField(default=0)
+    aprovadas = models.PositiveIntegerField(default=0)
+    presentes = models.PositiveIntegerField(default=0)
+    faltas = models.PositiveIntegerField(default=0)
+    canceladas = models.PositiveIntegerField(default=0)
+    # Maior tamanho de fila de espera observado nas atualizações do dia
+    pico_fila_espera = models.PositiveIntegerField(default=0)
+    calculado_em = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('laboratorio', 'data', 'hora')
+        indexes = [
+            models.Index(fields=['data']),
+            models.Index(fields=['calculado_em']),
+        ]
+
+    def __str__(self):
+        return f"{self.laboratorio.num_laboratorio} {self.data:%d/%m/%Y} {self.hora}h"
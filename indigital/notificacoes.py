@@ -0,0 +1,62 @@
+from django.template.loader import render_to_string
+
+from .models import Notificacao
+
+
+# Assunto e texto de cada evento que muda a reserva do aluno
+EVENTOS_RESERVA = {
+    'aprovada': (
+        'Reserva aprovada',
+        'Sua reserva foi aprovada. Compareça ao laboratório no horário abaixo.',
+    ),
+    'rejeitada': (
+        'Reserva rejeitada',
+        'Sua solicitação de reserva foi rejeitada pela administração.',
+    ),
+    'promovida': (
+        'Você saiu da fila de espera',
+        'Uma vaga foi liberada e você foi promovido da fila de espera: sua reserva está aprovada.',
+    ),
+    'cancelada': (
+        'Reserva cancelada',
+        'Sua reserva foi cancelada.',
+    ),
+}
+
+
+def montar_notificacao(reserva, evento):
+    """Notificação (ainda não salva) do evento para o aluno, ou None se ele não tiver e-mail."""
+    usuario = reserva.usuario
+    if not usuario.email:
+        return None
+
+    assunto, texto = EVENTOS_RESERVA[evento]
+    mensagem = render_to_string('email_notificacao_reserva.txt', {
+        'usuario': usuario,
+        'disponibilidade': reserva.disponibilidade,
+        'texto': texto,
+    })
+    return Notificacao(
+        usuario=usuario,
+        assunto=f"InDigital | {assunto}",
+        mensagem=mensagem,
+    )
+
+
+def notificar_reserva(reserva, evento):
+    """
+    Enfileira o e-mail avisando o aluno da mudança na reserva.
+
+    Deve ser chamada dentro da mesma transação que altera o status, para que a
+    notificação só exista se a mudança for gravada.
+    """
+    notificacao = montar_notificacao(reserva, evento)
+    if notificacao is not None:
+        notificacao.save()
+    return notificacao
+
+
+def notificar_reservas(reservas, evento):
+    """Como notificar_reserva, para várias reservas, com um único bulk_create."""
+    notificacoes = [montar_notificacao(reserva, evento) for reserva in reservas]
+    return Notificacao.objects.bulk_create([n for n in notificacoes if n is not None])
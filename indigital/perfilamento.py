@@ -0,0 +1,165 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import time
+import traceback
+import uuid
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.utils import timezone
+
+
+SALT_TOKEN = 'indigital.perfilamento'
+# Validade do token de perfilamento, em segundos
+VALIDADE_TOKEN = 24 * 60 * 60
+PARAMETRO = 'perfilar'
+CABECALHO = 'X-Perfilar'
+# Funções listadas no resumo do cProfile salvo junto com o perfil
+FUNCOES_RESUMO = 40
+
+re_nome_perfil = re.compile(r'^\d{14}-[0-9a-f]{8}$')
+# Quadros destes arquivos não contam como origem de uma consulta
+ARQUIVOS_IGNORADOS = (__file__, *(str(Path(__file__).with_name(nome)) for nome in ('middleware.py', 'consultas_repetidas.py')))
+
+
+def token_perfilamento(usuario):
+    """Token assinado que liga o perfilamento ao usuário, válido por VALIDADE_TOKEN."""
+    return signing.TimestampSigner(salt=SALT_TOKEN).sign(str(usuario.pk))
+
+
+def token_valido(token, usuario):
+    try:
+        pk = signing.TimestampSigner(salt=SALT_TOKEN).unsign(token, max_age=VALIDADE_TOKEN)
+    except signing.BadSignature:
+        return False
+    return pk == str(usuario.pk)
+
+
+def diretorio():
+    caminho = Path(settings.PERFILAMENTO_DIR)
+    caminho.mkdir(parents=True, exist_ok=True)
+    return caminho
+
+
+def origem_consulta():
+    """Arquivo, linha e função do código do projeto que disparou a consulta."""
+    base = str(settings.BASE_DIR)
+    for quadro in reversed(traceback.extract_stack()):
+        if (
+            quadro.filename.startswith(base)
+            and 'site-packages' not in quadro.filename
+            and quadro.filename not in ARQUIVOS_IGNORADOS
+        ):
+            return f'{os.path.relpath(quadro.filename, base)}:{quadro.lineno} em {quadro.name}'
+    return ''
+
+
+class ColetorConsultas:
+    """execute_wrapper que guarda SQL, duração e origem de cada consulta."""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({
+                'sql': sql,
+                'duracao_ms': round((time.perf_counter() - inicio) * 1000, 3),
+                'origem': origem_consulta(),
+                'banco': context['connection'].alias,
+            })
+
+
+def perfilar(request, get_response):
+    """Executa a requisição sob cProfile, com as consultas capturadas, e salva o perfil."""
+    coletor = ColetorConsultas()
+    perfil = cProfile.Profile()
+    with ExitStack() as pilha:
+        for conexao in connections.all():
+            pilha.enter_context(conexao.execute_wrapper(coletor))
+        inicio = time.perf_counter()
+        perfil.enable()
+        try:
+            resposta = get_response(request)
+        finally:
+            perfil.disable()
+        duracao = time.perf_counter() - inicio
+    salvar(request, resposta, perfil, coletor.consultas, duracao)
+    return resposta
+
+
+def caminho_sem_token(request):
+    parametros = [(chave, valor) for chave, valor in request.GET.items() if chave != PARAMETRO]
+    return request.path + (f'?{urlencode(parametros)}' if parametros else '')
+
+
+def salvar(request, resposta, perfil, consultas, duracao):
+    pasta = diretorio()
+    agora = timezone.now()
+    nome = f'{agora:%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}'
+
+    perfil.dump_stats(pasta / f'{nome}.prof')
+    resumo = io.StringIO()
+    pstats.Stats(perfil, stream=resumo).sort_stats('cumulative').print_stats(FUNCOES_RESUMO)
+
+    dados = {
+        'nome': nome,
+        'criado_em': agora.isoformat(),
+        'metodo': request.method,
+        'caminho': caminho_sem_token(request),
+        'status': resposta.status_code,
+        'usuario': request.user.email,
+        'duracao_ms': round(duracao * 1000, 1),
+        'total_consultas': len(consultas),
+        'tempo_consultas_ms': round(sum(c['duracao_ms'] for c in consultas), 1),
+        'consultas': consultas,
+        'resumo': resumo.getvalue(),
+    }
+    with open(pasta / f'{nome}.json', 'w', encoding='utf-8') as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False)
+    aplicar_retencao(pasta)
+    return nome
+
+
+def aplicar_retencao(pasta):
+    """Mantém só os PERFILAMENTO_MAXIMO perfis mais recentes."""
+    nomes = sorted(caminho.stem for caminho in pasta.glob('*.json'))
+    for nome in nomes[:-settings.PERFILAMENTO_MAXIMO]:
+        for extensao in ('json', 'prof'):
+            (pasta / f'{nome}.{extensao}').unlink(missing_ok=True)
+
+
+def listar_perfis():
+    """Perfis salvos, do mais lento para o mais rápido, sem o resumo do cProfile."""
+    perfis = []
+    for caminho in diretorio().glob('*.json'):
+        try:
+            with open(caminho, encoding='utf-8') as arquivo:
+                dados = json.load(arquivo)
+        except (OSError, ValueError):
+            continue
+        dados.pop('resumo', None)
+        dados['criado_em'] = datetime.fromisoformat(dados['criado_em'])
+        dados['consultas_lentas'] = sorted(dados.pop('consultas'), key=lambda c: c['duracao_ms'], reverse=True)[:5]
+        perfis.append(dados)
+    return sorted(perfis, key=lambda p: p['duracao_ms'], reverse=True)
+
+
+def arquivo_perfil(nome, extensao):
+    """Caminho do arquivo salvo, ou None se o nome for inválido ou o arquivo não existir."""
+    if not re_nome_perfil.match(nome) or extensao not in ('prof', 'json'):
+        return None
+    caminho = diretorio() / f'{nome}.{extensao}'
+    return caminho if caminho.exists() else None
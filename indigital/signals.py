@@ -0,0 +1,78 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate
+from django.dispatch import receiver
+
+from usuarios.models import User
+
+from .models import EstatisticaUsuario, Reserva
+
+
+TABELA = 'indigital_disponibilidade'
+
+# O SQLite não aceita ADD CONSTRAINT nem constraints de exclusão; estes triggers fazem
+# o papel das constraints criadas no PostgreSQL pela migração 0033 e abortam a escrita
+# com erro de constraint, que chega ao Django como IntegrityError
+VALIDACAO_DISPONIBILIDADE = f"""
+    WHEN NEW.vagas < 0
+    THEN RAISE(ABORT, 'disponibilidade_vagas_nao_negativas')
+    WHEN NEW.horario_inicio >= NEW.horario_fim
+    THEN RAISE(ABORT, 'disponibilidade_inicio_antes_do_fim')
+    WHEN EXISTS (
+        SELECT 1 FROM {TABELA} d
+        WHERE d.laboratorio_id = NEW.laboratorio_id
+          AND d.id IS NOT NEW.id
+          AND d.inicio_em < NEW.fim_em
+          AND d.fim_em > NEW.inicio_em
+    )
+    THEN RAISE(ABORT, 'disponibilidade_sem_sobreposicao')
+"""
+
+TRIGGERS_SQLITE = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS disponibilidade_constraints_insert
+    BEFORE INSERT ON {TABELA}
+    BEGIN
+        SELECT CASE {VALIDACAO_DISPONIBILIDADE} END;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS disponibilidade_constraints_update
+    BEFORE UPDATE OF laboratorio_id, vagas, horario_inicio, horario_fim, inicio_em, fim_em ON {TABELA}
+    BEGIN
+        SELECT CASE {VALIDACAO_DISPONIBILIDADE} END;
+    END
+    """,
+]
+
+
+@receiver(post_migrate)
+def criar_triggers_sqlite(sender, using, **kwargs):
+    """
+    Recria os triggers após cada migrate: no SQLite, migrações que alteram a tabela a
+    reconstroem do zero e os triggers antigos se perdem.
+    """
+    if sender.name != 'indigital':
+        return
+    conexao = connections[using]
+    if conexao.vendor != 'sqlite' or TABELA not in conexao.introspection.table_names():
+        return
+    with conexao.cursor() as cursor:
+        for sql in TRIGGERS_SQLITE:
+            cursor.execute(sql)
+
+
+@receiver(post_delete, sender=Reserva)
+def descartar_estatistica(sender, instance, using, **kwargs):
+    """
+    Reservas excluídas (inclusive em cascata, ao excluir um horário, laboratório ou
+    usuário) não passam por Reserva.save(): os contadores do usuário são descartados na
+    mesma transação e recalculados depois do commit, se o usuário ainda existir.
+    """
+    usuario_id = instance.usuario_id
+    EstatisticaUsuario.objects.using(using).filter(usuario_id=usuario_id).delete()
+
+    def recalcular():
+        # Uma exclusão em cascata agenda isto uma vez por reserva: só o primeiro recalcula
+        if User.objects.using(using).filter(id=usuario_id, estatistica__isnull=True).exists():
+            EstatisticaUsuario.recalcular([usuario_id])
+    transaction.on_commit(recalcular, using=using)
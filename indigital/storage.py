@@ -0,0 +1,49 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só as cópias .gz são geradas
+    brotli = None
+
+
+class ManifestComprimidoStorage(ManifestStaticFilesStorage):
+    """
+    Storage usado pelo collectstatic fora do ambiente local.
+
+    Além dos nomes com hash do manifest (que permitem cache de longo prazo), grava ao
+    lado de cada arquivo com hash uma cópia .gz e, se o pacote brotli estiver
+    instalado, uma .br, para o servidor web entregar sem comprimir a cada requisição.
+    """
+
+    extensoes_comprimiveis = ('.css', '.js', '.svg', '.ttf', '.woff', '.ico', '.json', '.txt')
+
+    def post_process(self, paths, dry_run=False, **options):
+        processados = set()
+        for nome, nome_hash, processado in super().post_process(paths, dry_run, **options):
+            if nome_hash and not isinstance(processado, Exception):
+                processados.add(nome_hash)
+            yield nome, nome_hash, processado
+
+        if dry_run:
+            return
+
+        for nome_hash in processados:
+            if nome_hash.endswith(self.extensoes_comprimiveis):
+                self.comprimir(nome_hash)
+
+    def comprimir(self, nome):
+        with self.open(nome) as arquivo:
+            conteudo = arquivo.read()
+
+        variantes = [('.gz', gzip.compress(conteudo, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variantes.append(('.br', brotli.compress(conteudo, quality=11)))
+
+        caminho = self.path(nome)
+        for sufixo, comprimido in variantes:
+            # Só vale a pena servir a cópia se ela for de fato menor
+            if len(comprimido) < len(conteudo):
+                with open(caminho + sufixo, 'wb') as destino:
+                    destino.write(comprimido)
@@ -0,0 +1,48 @@
+{% load static %}// Service worker da chamada offline: guarda a página, a lista de chamada do dia e o CSS
+// para que o monitor registre frequências sem rede. As marcações ficam na fila local
+// da página (chamada_offline.html) e são enviadas em lote quando a rede volta.
+const CACHE = 'chamada-v1';
+const PAGINA = '{% url "chamada_offline" %}';
+const LISTA = '{% url "lista_chamada" %}';
+const ESTATICOS = ['{% static "vendor/css/bootstrap.min.css" %}'];
+
+self.addEventListener('install', (evento) => {
+    evento.waitUntil(
+        caches.open(CACHE).then((cache) => Promise.all(
+            // Falha em um item (sem rede, sessão expirada) não impede a instalação
+            [PAGINA, LISTA, ...ESTATICOS].map((url) => cache.add(url).catch(() => null))
+        )).then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (evento) => {
+    evento.waitUntil(
+        caches.keys().then((nomes) => Promise.all(
+            nomes.filter((nome) => nome.startsWith('chamada-') && nome !== CACHE).map((nome) => caches.delete(nome))
+        )).then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (evento) => {
+    const url = new URL(evento.request.url);
+    if (evento.request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (url.pathname === PAGINA || url.pathname === LISTA) {
+        // Rede primeiro (a lista é revalidada pelo ETag); sem rede, a última cópia guardada
+        evento.respondWith(
+            fetch(evento.request).then((resposta) => {
+                // Redirecionamento para o login não substitui a cópia boa
+                if (resposta.ok && !resposta.redirected) {
+                    const copia = resposta.clone();
+                    caches.open(CACHE).then((cache) => cache.put(url.pathname, copia));
+                }
+                return resposta;
+            }).catch(() => caches.match(url.pathname).then((guardada) => guardada || Response.error()))
+        );
+    } else if (ESTATICOS.includes(url.pathname)) {
+        // Arquivos estáticos têm o hash no nome: a cópia guardada nunca fica desatualizada
+        evento.respondWith(caches.match(url.pathname).then((guardada) => guardada || fetch(evento.request)));
+    }
+});
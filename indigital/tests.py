@@ -1,3 +1,997 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import time, timedelta
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.http import HttpResponse, JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from usuarios.models import User
+
+from .aprovacao_automatica import aprovar_pendentes, inicio_semana
+from .calendario import token_calendario
+from .carrinho import reservar_varios
+from .chamada import sincronizar
+from .encerramento import encerrar_lote
+from .fila_espera import promover_fila_espera, travar_pendente
+from .middleware import CompressaoMiddleware, MinificarHTMLMiddleware, cache_compartilhado, minificar_html
+from .models import (
+    Disponibilidade, EstatisticaUsuario, EventoReserva, FilaEspera, Laboratorio, Notificacao, Reserva,
+    UtilizacaoDiaria,
+)
+from .utilizacao import atualizar_utilizacao
+from .vagas import divergencias, reconciliar
+
+
+# Quantidades de linhas comparadas: o número de consultas de cada view deve ser o mesmo
+POUCAS_LINHAS = 10
+MUITAS_LINHAS = 1000
+
+# Em ordem tal que já as POUCAS_LINHAS primeiras linhas tenham reserva aprovada hoje
+# (linha 3), para que nenhuma listagem fique vazia com poucos dados
+STATUS_APROVACAO = ['R', 'C', 'P', 'A']
+# Horário tardio para que os horários de hoje ainda não tenham começado durante o teste
+INICIO = time(23, 0)
+FIM = time(23, 59)
+
+
+def povoar(inicio, fim, aluno, monitor, concorrida):
+    """
+    Cria as linhas de índice inicio até fim - 1: um laboratório com um horário cada
+    (entre 3 dias atrás e 3 dias à frente), uma reserva e uma entrada na fila de espera
+    do aluno principal nesse horário e um usuário extra (aluno ou monitor) com reserva no
+    horário concorrido. Usa bulk_create, então inicio_em/fim_em e os contadores de
+    EstatisticaUsuario são preenchidos aqui.
+    """
+    hoje = timezone.localdate()
+    laboratorios = Laboratorio.objects.bulk_create(
+        Laboratorio(num_laboratorio=f'Q{i}', capacidade=30) for i in range(inicio, fim)
+    )
+    disponibilidades = []
+    for i, laboratorio in zip(range(inicio, fim), laboratorios):
+        data = hoje + timedelta(days=i % 7 - 3)
+        disponibilidades.append(Disponibilidade(
+            laboratorio=laboratorio, data=data, horario_inicio=INICIO, horario_fim=FIM,
+            inicio_em=Disponibilidade.combinar(data, INICIO), fim_em=Disponibilidade.combinar(data, FIM),
+            total_vagas=3, vagas=i % 3, monitor=monitor,
+        ))
+    disponibilidades = Disponibilidade.objects.bulk_create(disponibilidades)
+    usuarios = User.objects.bulk_create(
+        User(email=f'q{i}@x.com', perfil='monitor' if i % 2 else 'aluno') for i in range(inicio, fim)
+    )
+
+    Reserva.objects.bulk_create(
+        [
+            Reserva(usuario=aluno, disponibilidade=disponibilidade, status_aprovacao=STATUS_APROVACAO[i % 4],
+                    status_frequencia='P' if i % 4 == 3 and i % 7 < 3 else '')
+            for i, disponibilidade in zip(range(inicio, fim), disponibilidades)
+        ] + [
+            Reserva(usuario=usuario, disponibilidade=concorrida, status_aprovacao=STATUS_APROVACAO[i % 2])
+            for i, usuario in zip(range(inicio, fim), usuarios)
+        ]
+    )
+    FilaEspera.objects.bulk_create(
+        FilaEspera(usuario=aluno, disponibilidade=disponibilidade) for disponibilidade in disponibilidades
+    )
+    EstatisticaUsuario.recalcular([aluno.id, *(usuario.id for usuario in usuarios)])
+
+
+class OrcamentoConsultas:
+    """
+    Renderiza as views de VIEWS com POUCAS_LINHAS e com MUITAS_LINHAS e exige o mesmo
+    número de consultas nas duas vezes, dentro do orçamento de cada view. Uma consulta
+    por linha (N+1) aparece como diferença entre as duas contagens.
+
+    Mixin usado junto com TestCase aqui e em usuarios.tests.
+    """
+
+    # (nome da url, usuário, argumentos, parâmetros GET, máximo de consultas)
+    VIEWS = []
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuarios = {
+            'admin': User.objects.create_user(email='admin@x.com', password='x', perfil='administrador'),
+            'monitor': User.objects.create_user(email='monitor@x.com', password='x', perfil='monitor'),
+            'aluno': User.objects.create_user(email='aluno@x.com', password='x', perfil='aluno'),
+        }
+        data = timezone.localdate() + timedelta(days=1)
+        cls.concorrida = Disponibilidade.objects.create(
+            laboratorio=Laboratorio.objects.create(num_laboratorio='Q', capacidade=30),
+            data=data, horario_inicio=time(14), horario_fim=time(15), total_vagas=5, monitor=cls.usuarios['monitor'],
+        )
+        # Contadores criados antes, para que a primeira leitura não conte consultas a mais
+        EstatisticaUsuario.recalcular([usuario.id for usuario in cls.usuarios.values()])
+
+    def argumentos(self, usuario, args):
+        valores = {
+            'aluno': self.usuarios['aluno'].id,
+            'concorrida': self.concorrida.id,
+            'token': token_calendario(usuario),
+        }
+        return [valores.get(arg, arg) for arg in args]
+
+    def contar_consultas(self):
+        """Número de consultas de cada view, com cache vazio (sem fragmentos guardados)."""
+        contagens = {}
+        for nome, perfil, args, parametros, _ in self.VIEWS:
+            usuario = self.usuarios[perfil]
+            url = reverse(nome, args=self.argumentos(usuario, args))
+            cache.clear()
+            self.client.force_login(usuario)
+            with CaptureQueriesContext(connection) as consultas:
+                resposta = self.client.get(url, parametros)
+            self.assertEqual(resposta.status_code, 200, f'{nome} {parametros}')
+            contagens[nome, str(parametros)] = len(consultas)
+        return contagens
+
+    def test_consultas_nao_crescem_com_os_dados(self):
+        aluno, monitor = self.usuarios['aluno'], self.usuarios['monitor']
+        povoar(0, POUCAS_LINHAS, aluno, monitor, self.concorrida)
+        poucas = self.contar_consultas()
+        povoar(POUCAS_LINHAS, MUITAS_LINHAS, aluno, monitor, self.concorrida)
+        muitas = self.contar_consultas()
+
+        for nome, _, _, parametros, maximo in self.VIEWS:
+            chave = (nome, str(parametros))
+            with self.subTest(view=nome, parametros=parametros):
+                self.assertEqual(
+                    poucas[chave], muitas[chave],
+                    f'{POUCAS_LINHAS} linhas: {poucas[chave]} consultas, {MUITAS_LINHAS} linhas: {muitas[chave]}',
+                )
+                self.assertLessEqual(muitas[chave], maximo)
+
+
+class OrcamentoConsultasTests(OrcamentoConsultas, TestCase):
+    VIEWS = [
+        ('index', 'aluno', [], {}, 3),
+        ('horarios', 'aluno', [], {}, 7),
+        ('horarios', 'aluno', [], {'tab': 'hoje'}, 7),
+        ('horarios', 'aluno', [], {'tab': 'futuro'}, 7),
+        ('horarios_aba', 'aluno', ['futuro'], {}, 6),
+        ('minha_fila_espera', 'aluno', [], {}, 5),
+        ('historico_reservas', 'aluno', [], {}, 5),
+        ('historico_reservas', 'aluno', [], {'tab': 'canceladas'}, 5),
+        ('historico_reservas_aba', 'aluno', ['passadas'], {}, 4),
+        ('calendario_reservas', 'aluno', ['token'], {}, 2),
+        ('monitor_dashboard', 'monitor', [], {}, 5),
+        ('listar_disponibilidades_monitor', 'monitor', [], {}, 5),
+        ('listar_disponibilidades_monitor_aba', 'monitor', ['futuras'], {}, 4),
+        ('usuarios_da_reserva', 'monitor', ['concorrida'], {}, 7),
+        ('registrar_frequencias', 'monitor', ['concorrida'], {}, 6),
+        ('calendario_monitor', 'monitor', ['token'], {}, 2),
+        ('lista_chamada', 'monitor', [], {}, 3),
+        ('reservas_do_dia', 'monitor', [], {}, 7),
+        ('admin_dashboard', 'admin', [], {}, 9),
+        ('reservas_do_dia', 'admin', [], {}, 7),
+        ('listar_disponibilidades', 'admin', [], {}, 8),
+        ('listar_disponibilidades_aba', 'admin', ['hoje'], {}, 4),
+        ('listar_laboratorios', 'admin', [], {}, 5),
+        ('fila_espera', 'admin', [], {}, 6),
+        ('reservas_pendentes', 'admin', [], {}, 6),
+        ('reservas_por_usuario', 'admin', ['aluno'], {}, 6),
+        ('historico_geral_reservas', 'admin', [], {}, 6),
+        ('historico_geral_reservas_aba', 'admin', ['passadas'], {}, 4),
+        ('relatorio_utilizacao', 'admin', [], {}, 8),
+    ]
+
+
+class CompressaoTests(SimpleTestCase):
+    def comprimir(self, **meta):
+        resposta = HttpResponse('<p>conteúdo</p>' * 50)
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br')
+        request.META.update(meta)
+        return CompressaoMiddleware(lambda request: resposta)(request)
+
+    @mock.patch('indigital.middleware.brotli')
+    def test_brotli_quando_aceito(self, brotli):
+        brotli.compress.return_value = b'br'
+        resposta = self.comprimir()
+        self.assertEqual(resposta['Content-Encoding'], 'br')
+        self.assertEqual(resposta.content, b'br')
+
+    @mock.patch('indigital.middleware.brotli')
+    def test_resposta_com_token_csrf_sai_em_gzip(self, brotli):
+        resposta = self.comprimir(CSRF_COOKIE_NEEDS_UPDATE=True)
+        self.assertEqual(resposta['Content-Encoding'], 'gzip')
+        brotli.compress.assert_not_called()
+
+
+class MinificarHTMLTests(SimpleTestCase):
+    def minificar_resposta(self, resposta, path='/'):
+        middleware = MinificarHTMLMiddleware(lambda request: resposta)
+        return middleware(RequestFactory().get(path))
+
+    def test_recuo_e_linhas_em_branco(self):
+        html = '<div>\n    <p>Olá</p>   \n\n\n    <span>a  b</span>\n</div>\n'
+        self.assertEqual(minificar_html(html), '<div>\n<p>Olá</p>\n<span>a  b</span>\n</div>\n')
+
+    def test_blocos_protegidos_ficam_intactos(self):
+        pre = '<pre>\n    linha 1\n\n        linha 2   \n</pre>'
+        textarea = '<textarea name="t">\n  texto\n\n  digitado  \n</textarea>'
+        script = '<script>\n    if (a) {\n        b();   \n    }\n</script>'
+        html = f'<body>\n    {pre}\n    {textarea}\n    {script}\n</body>'
+        self.assertEqual(minificar_html(html), f'<body>\n{pre}\n{textarea}\n{script}\n</body>')
+
+    def test_style_so_perde_o_recuo(self):
+        html = '<style>\n    .a {\n        color: red;\n    }\n</style>'
+        self.assertEqual(minificar_html(html), '<style>\n.a {\ncolor: red;\n}\n</style>')
+
+    def test_middleware_minifica_html(self):
+        resposta = self.minificar_resposta(HttpResponse('<p>\n    a\n</p>'))
+        self.assertEqual(resposta.content, b'<p>\na\n</p>')
+
+    def test_respostas_nao_html_passam_intactas(self):
+        texto = '{\n    "a": 1\n}'
+        for resposta in (
+            HttpResponse(texto, content_type='application/json'),
+            HttpResponse(texto, content_type='text/plain'),
+            JsonResponse({'texto': '\n    a'}),
+        ):
+            conteudo = resposta.content
+            with self.subTest(tipo=resposta['Content-Type']):
+                self.assertEqual(self.minificar_resposta(resposta).content, conteudo)
+
+    def test_path_ignorado(self):
+        html = '<p>\n    a\n</p>'
+        with self.settings(MINIFICAR_HTML_PATHS_IGNORADOS=['/admin/']):
+            resposta = self.minificar_resposta(HttpResponse(html), '/admin/x/')
+        self.assertEqual(resposta.content.decode(), html)
+
+
+class EnviarNotificacoesTests(TestCase):
+    def setUp(self):
+        usuario = User.objects.create_user(email='aluno@x.com', password='x')
+        self.notificacoes = [
+            Notificacao.objects.create(usuario=usuario, assunto=f'Assunto {i}', mensagem='Texto') for i in range(2)
+        ]
+
+    def enviar(self, *args):
+        call_command('enviar_notificacoes', *args, stdout=StringIO())
+
+    def test_envia_e_marca_como_enviada(self):
+        self.enviar()
+        self.assertEqual(sorted(email.subject for email in mail.outbox), ['Assunto 0', 'Assunto 1'])
+        self.assertFalse(Notificacao.objects.filter(enviada_em__isnull=True).exists())
+
+        # Já enviadas não saem de novo
+        self.enviar()
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_falha_reagenda_com_espera_exponencial(self):
+        for tentativa, minutos in ((1, 1), (2, 2), (3, 4)):
+            antes = timezone.now()
+            with mock.patch.object(EmailMessage, 'send', side_effect=SMTPException('recusado')):
+                self.enviar()
+            notificacao = Notificacao.objects.get(id=self.notificacoes[0].id)
+            self.assertEqual((notificacao.tentativas, notificacao.erro), (tentativa, 'recusado'))
+            self.assertIsNone(notificacao.enviada_em)
+            self.assertGreaterEqual(notificacao.proxima_tentativa, antes + timedelta(minutes=minutos))
+            self.assertLessEqual(notificacao.proxima_tentativa, timezone.now() + timedelta(minutes=minutos))
+
+            # Antes da próxima tentativa, nada é enviado
+            self.enviar()
+            self.assertEqual(mail.outbox, [])
+            Notificacao.objects.update(proxima_tentativa=timezone.now())
+
+        self.enviar()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(Notificacao.objects.filter(enviada_em__isnull=True).exists())
+
+    def test_desiste_depois_do_maximo_de_tentativas(self):
+        Notificacao.objects.filter(id=self.notificacoes[0].id).update(tentativas=3)
+        self.enviar('--max-tentativas', '3')
+        self.assertEqual([email.subject for email in mail.outbox], ['Assunto 1'])
+
+
+class EnviarNotificacoesTransacaoTests(TransactionTestCase):
+    def test_envia_depois_de_reservar_e_fora_da_transacao(self):
+        usuario = User.objects.create_user(email='aluno@x.com', password='x')
+        notificacao = Notificacao.objects.create(usuario=usuario, assunto='Assunto', mensagem='Texto')
+        durante_o_envio = []
+
+        def enviar(mensagem):
+            # Outra conexão já veria a reserva: a próxima tentativa foi adiada e commitada
+            durante_o_envio.append((
+                connection.in_atomic_block,
+                Notificacao.objects.get(id=notificacao.id).proxima_tentativa > timezone.now(),
+            ))
+            return 1
+
+        with mock.patch.object(EmailMessage, 'send', autospec=True, side_effect=enviar):
+            call_command('enviar_notificacoes', stdout=StringIO())
+
+        self.assertEqual(durante_o_envio, [(False, True)])
+        self.assertIsNotNone(Notificacao.objects.get(id=notificacao.id).enviada_em)
+
+
+class PromoverFilaEsperaTests(TestCase):
+    def setUp(self):
+        self.laboratorio = Laboratorio.objects.create(num_laboratorio='F', capacidade=30)
+        self.alunos = [User.objects.create_user(email=f'fila{i}@x.com', password='x') for i in range(3)]
+        self.disponibilidade = self.criar_horario(timezone.localdate() + timedelta(days=1), total_vagas=2)
+
+    def criar_horario(self, data, total_vagas=2, laboratorio=None):
+        return Disponibilidade.objects.create(
+            laboratorio=laboratorio or self.laboratorio, data=data,
+            horario_inicio=time(14), horario_fim=time(15), total_vagas=total_vagas,
+        )
+
+    def enfileirar(self, *alunos):
+        for aluno in alunos:
+            FilaEspera.objects.create(usuario=aluno, disponibilidade=self.disponibilidade)
+
+    def test_promove_quando_ha_vagas(self):
+        self.enfileirar(*self.alunos[:2])
+        promovidas = promover_fila_espera(self.disponibilidade)
+
+        self.assertEqual([reserva.usuario for reserva in promovidas], self.alunos[:2])
+        self.assertTrue(all(reserva.status_aprovacao == 'A' for reserva in promovidas))
+        self.assertFalse(FilaEspera.objects.exists())
+        self.disponibilidade.refresh_from_db()
+        self.assertEqual(self.disponibilidade.vagas, 0)
+
+    def test_nao_passa_do_total_de_vagas(self):
+        Reserva.objects.create(usuario=self.alunos[2], disponibilidade=self.disponibilidade, status_aprovacao='A')
+        Disponibilidade.objects.filter(id=self.disponibilidade.id).update(vagas=1)
+        self.enfileirar(*self.alunos[:2])
+
+        promovidas = promover_fila_espera(self.disponibilidade)
+
+        self.assertEqual([reserva.usuario for reserva in promovidas], [self.alunos[0]])
+        self.assertEqual(list(FilaEspera.objects.values_list('usuario', flat=True)), [self.alunos[1].id])
+        self.assertEqual(Reserva.objects.filter(disponibilidade=self.disponibilidade, status_aprovacao='A').count(), 2)
+        self.disponibilidade.refresh_from_db()
+        self.assertEqual(self.disponibilidade.vagas, 0)
+
+    def test_conflito_de_horario_continua_na_fila(self):
+        # O primeiro da fila já tem reserva no mesmo horário, em outro laboratório
+        outro = self.criar_horario(
+            self.disponibilidade.data, laboratorio=Laboratorio.objects.create(num_laboratorio='G', capacidade=30),
+        )
+        Reserva.objects.create(usuario=self.alunos[0], disponibilidade=outro, status_aprovacao='A')
+        Disponibilidade.objects.filter(id=self.disponibilidade.id).update(vagas=1)
+        self.enfileirar(*self.alunos[:2])
+
+        promovidas = promover_fila_espera(self.disponibilidade)
+
+        self.assertEqual([reserva.usuario for reserva in promovidas], [self.alunos[1]])
+        self.assertEqual(list(FilaEspera.objects.values_list('usuario', flat=True)), [self.alunos[0].id])
+
+    def test_horario_passado_nao_promove(self):
+        self.disponibilidade = self.criar_horario(timezone.localdate() - timedelta(days=1))
+        self.enfileirar(self.alunos[0])
+
+        self.assertEqual(promover_fila_espera(self.disponibilidade), [])
+        self.assertTrue(FilaEspera.objects.exists())
+        self.disponibilidade.refresh_from_db()
+        self.assertEqual(self.disponibilidade.vagas, 2)
+
+
+class CalendarioTests(TestCase):
+    def setUp(self):
+        self.aluno = User.objects.create_user(email='aluno@x.com', password='x')
+        self.disponibilidade = Disponibilidade.objects.create(
+            laboratorio=Laboratorio.objects.create(num_laboratorio='A1', capacidade=30),
+            data=timezone.localdate() + timedelta(days=1), horario_inicio=time(14), horario_fim=time(15),
+            total_vagas=5,
+        )
+        self.reserva = Reserva.objects.create(usuario=self.aluno, disponibilidade=self.disponibilidade, status_aprovacao='A')
+        self.url = reverse('calendario_reservas', args=[token_calendario(self.aluno)])
+
+    def test_feed_com_etag_e_last_modified(self):
+        resposta = self.client.get(self.url)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn(f'UID:reserva-{self.reserva.id}@indigital', b''.join(resposta.streaming_content).decode())
+        self.assertTrue(resposta['ETag'])
+        self.assertIn('private', resposta['Cache-Control'])
+
+        # O aplicativo de calendário pergunta de novo: nada mudou, nada é gerado
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=resposta['ETag']).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=resposta['Last-Modified']).status_code, 304)
+
+    def test_mudanca_no_horario_troca_a_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.disponibilidade.horario_fim = time(16)
+        self.disponibilidade.save()
+
+        resposta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta['ETag'], etag)
+
+    def test_token_invalido(self):
+        token = token_calendario(self.aluno)
+        for url in (
+            reverse('calendario_reservas', args=[token + 'x']),
+            reverse('calendario_monitor', args=['1:assinatura']),
+            reverse('calendario_laboratorio', args=[token[:-1], self.disponibilidade.laboratorio_id]),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+        # Usuário desativado perde o feed
+        User.objects.filter(id=self.aluno.id).update(is_active=False)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class ConstraintsDisponibilidadeTests(TestCase):
+    """Constraints do banco (PostgreSQL, migração 0033) ou triggers (SQLite, indigital.signals)."""
+
+    def setUp(self):
+        self.laboratorio = Laboratorio.objects.create(num_laboratorio='S', capacidade=30)
+        self.data = timezone.localdate() + timedelta(days=1)
+        self.horario = self.criar(time(14), time(15))
+
+    def criar(self, inicio, fim, laboratorio=None, **campos):
+        return Disponibilidade.objects.create(
+            laboratorio=laboratorio or self.laboratorio, data=self.data,
+            horario_inicio=inicio, horario_fim=fim, total_vagas=5, **campos,
+        )
+
+    def test_sobreposicao_no_mesmo_laboratorio(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.criar(time(14, 30), time(15, 30))
+
+    def test_sobreposicao_ao_alterar(self):
+        seguinte = self.criar(time(15), time(16))
+        seguinte.horario_inicio = time(14, 30)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            seguinte.save()
+
+    def test_horarios_encostados_e_outro_laboratorio(self):
+        self.criar(time(15), time(16))
+        self.criar(time(14), time(15), laboratorio=Laboratorio.objects.create(num_laboratorio='T', capacidade=30))
+        self.assertEqual(Disponibilidade.objects.count(), 3)
+
+    def test_vagas_negativas_e_inicio_depois_do_fim(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Disponibilidade.objects.filter(id=self.horario.id).update(vagas=-1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.criar(time(18), time(17))
+
+
+class CarrinhoTests(TestCase):
+    def setUp(self):
+        self.aluno = User.objects.create_user(email='aluno@x.com', password='x')
+        self.laboratorio = Laboratorio.objects.create(num_laboratorio='K', capacidade=30)
+        self.horarios = [self.criar(hora) for hora in (14, 16)]
+
+    def criar(self, hora, minuto=0, laboratorio=None, dias=1, total_vagas=1):
+        return Disponibilidade.objects.create(
+            laboratorio=laboratorio or self.laboratorio, data=timezone.localdate() + timedelta(days=dias),
+            horario_inicio=time(hora, minuto), horario_fim=time(hora + 1, minuto), total_vagas=total_vagas,
+        )
+
+    def resultados(self, horarios):
+        return [item['resultado'] for item in reservar_varios(self.aluno, [horario.id for horario in horarios])]
+
+    def test_reserva_com_vaga_e_fila_sem_vaga(self):
+        esgotado = self.criar(18, total_vagas=0)
+        passado = self.criar(14, dias=-1)
+
+        self.assertEqual(self.resultados([*self.horarios, esgotado, passado]), ['reservada', 'reservada', 'fila', 'erro'])
+        self.assertEqual(Reserva.objects.filter(usuario=self.aluno).count(), 2)
+        self.assertEqual(list(FilaEspera.objects.values_list('disponibilidade', flat=True)), [esgotado.id])
+        # Repetir o carrinho não duplica nada
+        self.assertEqual(self.resultados([*self.horarios, esgotado]), ['erro', 'erro', 'erro'])
+
+    def test_sobreposicoes(self):
+        outro_laboratorio = Laboratorio.objects.create(num_laboratorio='K2', capacidade=30)
+        # Sobreposto ao primeiro horário, dentro do carrinho: fica o que começa antes
+        sobreposto = self.criar(14, 30, laboratorio=outro_laboratorio)
+        # Sobreposto a uma reserva já aprovada
+        Reserva.objects.create(usuario=self.aluno, disponibilidade=self.criar(16, 30, laboratorio=outro_laboratorio),
+                               status_aprovacao='A')
+
+        self.assertEqual(self.resultados([sobreposto, *self.horarios]), ['erro', 'reservada', 'erro'])
+
+    def test_contadores(self):
+        self.resultados(self.horarios)
+        estatistica = EstatisticaUsuario.objects.get(usuario=self.aluno)
+        recalculada = EstatisticaUsuario.recalcular([self.aluno.id])[0]
+        for campo in EstatisticaUsuario.CONTADORES:
+            self.assertEqual(getattr(estatistica, campo), getattr(recalculada, campo), campo)
+
+    def test_entrada_criada_em_paralelo_nao_gera_evento(self):
+        Disponibilidade.objects.update(vagas=0)
+        bulk_create = FilaEspera.objects.bulk_create
+
+        def com_entrada_paralela(objetos, **kwargs):
+            # Outra requisição do mesmo usuário entra na fila do primeiro horário antes
+            FilaEspera.objects.create(usuario=self.aluno, disponibilidade=self.horarios[0])
+            return bulk_create(objetos, **kwargs)
+
+        with mock.patch.object(FilaEspera.objects, 'bulk_create', com_entrada_paralela):
+            self.assertEqual(self.resultados(self.horarios), ['erro', 'fila'])
+
+        self.assertEqual(FilaEspera.objects.count(), 2)
+        # Um evento por entrada gravada: o da requisição paralela e o do segundo horário
+        self.assertEqual(
+            sorted(EventoReserva.objects.filter(tipo=EventoReserva.FILA).values_list('disponibilidade_id', flat=True)),
+            [horario.id for horario in self.horarios],
+        )
+
+
+class IdempotenciaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user(email='admin@x.com', password='x', perfil='administrador'))
+        aluno = User.objects.create_user(email='aluno@x.com', password='x')
+        self.disponibilidade = Disponibilidade.objects.create(
+            laboratorio=Laboratorio.objects.create(num_laboratorio='I', capacidade=30),
+            data=timezone.localdate() + timedelta(days=1), horario_inicio=time(14), horario_fim=time(15),
+            total_vagas=2,
+        )
+        self.reserva = Reserva.objects.create(usuario=aluno, disponibilidade=self.disponibilidade, status_aprovacao='P')
+        self.url = reverse('aprovar_reserva', args=[self.reserva.id])
+
+    def test_so_aceita_post(self):
+        url_multiplas = reverse('aprovar_multiplas_reservas')
+        for url, dados in ((self.url, {}), (url_multiplas, {'reservas_selecionadas': self.reserva.id})):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, dados).status_code, 405)
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.reserva.status_aprovacao, 'P')
+
+    def test_repeticao_devolve_a_resposta_guardada_sem_gravar(self):
+        primeira = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='chave-1')
+        with CaptureQueriesContext(connection) as consultas:
+            repetida = self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='chave-1')
+
+        self.assertEqual((repetida.status_code, repetida.get('Location')), (primeira.status_code, primeira.get('Location')))
+        # Só a sessão e o usuário (login_required) são lidos: a view não roda de novo
+        self.assertFalse([consulta for consulta in consultas if 'indigital_' in consulta['sql']])
+        self.disponibilidade.refresh_from_db()
+        self.assertEqual(self.disponibilidade.vagas, 1)
+        self.assertEqual(Notificacao.objects.count(), 1)
+
+    def test_outra_chave_executa_a_view(self):
+        self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='chave-1')
+        # A reserva já não está pendente: a view roda de novo e não a encontra
+        self.assertEqual(self.client.post(self.url, HTTP_IDEMPOTENCY_KEY='chave-2').status_code, 404)
+
+
+class SincronizarChamadaTests(TestCase):
+    def setUp(self):
+        self.monitor = User.objects.create_user(email='monitor@x.com', password='x', perfil='monitor')
+        self.aluno = User.objects.create_user(email='aluno@x.com', password='x')
+        laboratorio = Laboratorio.objects.create(num_laboratorio='M', capacidade=30)
+        self.reserva = self.reservar(laboratorio, time(14), self.monitor)
+        outro_monitor = User.objects.create_user(email='outro@x.com', password='x', perfil='monitor')
+        self.reserva_de_outro = self.reservar(laboratorio, time(16), outro_monitor)
+        EstatisticaUsuario.recalcular([self.aluno.id])
+        self.agora = timezone.now()
+
+    def reservar(self, laboratorio, inicio, monitor):
+        disponibilidade = Disponibilidade.objects.create(
+            laboratorio=laboratorio, data=timezone.localdate() + timedelta(days=1),
+            horario_inicio=inicio, horario_fim=inicio.replace(hour=inicio.hour + 1), total_vagas=5, monitor=monitor,
+        )
+        return Reserva.objects.create(usuario=self.aluno, disponibilidade=disponibilidade, status_aprovacao='A')
+
+    def marcacao(self, frequencia, minutos_atras, reserva=None):
+        momento = self.agora - timedelta(minutes=minutos_atras)
+        return {'reserva': (reserva or self.reserva).id, 'frequencia': frequencia, 'registrada_em': momento.isoformat()}
+
+    def resultados(self, marcacoes):
+        return {item['reserva']: (item['resultado'], item['frequencia']) for item in sincronizar(self.monitor, marcacoes)}
+
+    def test_vale_a_marcacao_mais_recente(self):
+        # No mesmo lote, a mais recente da reserva
+        self.assertEqual(
+            self.resultados([self.marcacao('F', 5), self.marcacao('P', 10)])[self.reserva.id], ('aplicada', 'F')
+        )
+        # Uma marcação mais antiga que a gravada, vinda de outro aparelho, é ignorada
+        self.assertEqual(self.resultados([self.marcacao('P', 7)])[self.reserva.id], ('ignorada', 'F'))
+        self.assertEqual(self.resultados([self.marcacao('P', 1)])[self.reserva.id], ('aplicada', 'P'))
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.reserva.status_frequencia, 'P')
+
+    def test_reenviar_o_mesmo_lote_nao_muda_nada(self):
+        lote = [self.marcacao('P', 5)]
+        sincronizar(self.monitor, lote)
+        atualizado_em = Reserva.objects.get(id=self.reserva.id).atualizado_em
+
+        self.assertEqual(self.resultados(lote)[self.reserva.id], ('ignorada', 'P'))
+        self.assertEqual(Reserva.objects.get(id=self.reserva.id).atualizado_em, atualizado_em)
+
+    def test_reserva_de_outro_monitor_da_erro(self):
+        resultado = self.resultados([self.marcacao('P', 5, self.reserva_de_outro)])
+        self.assertEqual(resultado[self.reserva_de_outro.id], ('erro', None))
+        self.reserva_de_outro.refresh_from_db()
+        self.assertEqual(self.reserva_de_outro.status_frequencia, '')
+
+    def test_contadores(self):
+        sincronizar(self.monitor, [self.marcacao('F', 5)])
+        sincronizar(self.monitor, [self.marcacao('P', 1), self.marcacao('F', 2, self.reserva_de_outro)])
+
+        estatistica = EstatisticaUsuario.objects.get(usuario=self.aluno)
+        self.assertEqual((estatistica.presentes, estatistica.faltas, estatistica.a_realizar), (1, 0, 1))
+        recalculada = EstatisticaUsuario.recalcular([self.aluno.id])[0]
+        for campo in EstatisticaUsuario.CONTADORES:
+            self.assertEqual(getattr(estatistica, campo), getattr(recalculada, campo), campo)
+
+
+@override_settings(
+    APROVACAO_AUTOMATICA=True, APROVACAO_AUTOMATICA_COTA_SEMANAL=1,
+    APROVACAO_AUTOMATICA_MAXIMO_FALTAS=0.3, APROVACAO_AUTOMATICA_MINIMO_FREQUENCIAS=3,
+)
+class AprovacaoAutomaticaTests(TestCase):
+    def setUp(self):
+        self.laboratorio = Laboratorio.objects.create(num_laboratorio='P', capacidade=30)
+        # Terça e quarta da semana que vem: sempre no futuro e na mesma semana
+        segunda = inicio_semana(timezone.localdate()) + timedelta(days=7)
+        self.horario = self.criar(segunda + timedelta(days=1), total_vagas=1)
+        self.outro_dia = self.criar(segunda + timedelta(days=2), total_vagas=5)
+        self.alunos = [User.objects.create_user(email=f'p{i}@x.com', password='x') for i in range(2)]
+
+    def criar(self, data, total_vagas):
+        return Disponibilidade.objects.create(
+            laboratorio=self.laboratorio, data=data, horario_inicio=time(14), horario_fim=time(15),
+            total_vagas=total_vagas,
+        )
+
+    def pedir(self, aluno, disponibilidade):
+        return Reserva.objects.create(usuario=aluno, disponibilidade=disponibilidade, status_aprovacao='P')
+
+    def test_aprova_por_ordem_enquanto_ha_vagas(self):
+        primeira, segunda = self.pedir(self.alunos[0], self.horario), self.pedir(self.alunos[1], self.horario)
+
+        resultado = aprovar_pendentes()
+
+        self.assertEqual(resultado['aprovadas'], [primeira])
+        self.assertEqual(resultado['pendentes'], {'sem_vagas': 1})
+        segunda.refresh_from_db()
+        self.assertEqual((segunda.status_aprovacao, segunda.motivo_pendencia), ('P', 'sem_vagas'))
+        self.horario.refresh_from_db()
+        self.assertEqual(self.horario.vagas, 0)
+        for aluno in self.alunos:
+            estatistica = EstatisticaUsuario.objects.get(usuario=aluno)
+            recalculada = EstatisticaUsuario.recalcular([aluno.id])[0]
+            for campo in EstatisticaUsuario.CONTADORES:
+                self.assertEqual(getattr(estatistica, campo), getattr(recalculada, campo), campo)
+
+    def test_cota_semanal(self):
+        self.pedir(self.alunos[0], self.outro_dia)
+        self.pedir(self.alunos[0], self.horario)
+
+        resultado = aprovar_pendentes()
+
+        self.assertEqual([reserva.disponibilidade_id for reserva in resultado['aprovadas']], [self.outro_dia.id])
+        self.assertEqual(resultado['pendentes'], {'cota_semanal': 1})
+
+    def test_faltas_demais(self):
+        EstatisticaUsuario.do_usuario(self.alunos[0])
+        EstatisticaUsuario.objects.filter(usuario=self.alunos[0]).update(presentes=1, faltas=2)
+        reserva = self.pedir(self.alunos[0], self.horario)
+
+        self.assertEqual(aprovar_pendentes()['pendentes'], {'faltas': 1})
+        reserva.refresh_from_db()
+        self.assertEqual(reserva.motivo_pendencia, 'faltas')
+
+    @override_settings(APROVACAO_AUTOMATICA=False)
+    def test_desligada(self):
+        reserva = self.pedir(self.alunos[0], self.horario)
+        self.assertEqual(aprovar_pendentes()['aprovadas'], [])
+        reserva.refresh_from_db()
+        self.assertEqual(reserva.status_aprovacao, 'P')
+
+
+@override_settings(APROVACAO_AUTOMATICA=True)
+class AprovacaoConcorrenteTests(TestCase):
+    """Aprovação automática e análise manual da mesma reserva pendente ocupam uma vaga só."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(email='admin@x.com', password='x', perfil='administrador')
+        aluno = User.objects.create_user(email='aluno@x.com', password='x')
+        self.disponibilidade = Disponibilidade.objects.create(
+            laboratorio=Laboratorio.objects.create(num_laboratorio='C', capacidade=30),
+            data=timezone.localdate() + timedelta(days=1), horario_inicio=time(14), horario_fim=time(15),
+            total_vagas=2,
+        )
+        self.reserva = Reserva.objects.create(usuario=aluno, disponibilidade=self.disponibilidade, status_aprovacao='P')
+        self.client.force_login(self.admin)
+
+    def durante_a_view(self):
+        """
+        Roda a aprovação automática depois que a view leu a reserva como pendente e logo
+        antes de travá-la, como uma requisição paralela que terminou primeiro.
+        """
+        def travar_depois_da_automatica(reserva_id):
+            aprovar_pendentes()
+            return travar_pendente(reserva_id)
+        return mock.patch('indigital.views.travar_pendente', travar_depois_da_automatica)
+
+    def assertVagaOcupadaUmaVez(self, status='A'):
+        self.disponibilidade.refresh_from_db()
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.reserva.status_aprovacao, status)
+        self.assertEqual(self.disponibilidade.vagas, 1)
+        self.assertEqual(
+            EventoReserva.objects.filter(reserva_id=self.reserva.id, tipo=EventoReserva.APROVADA).count(), 1
+        )
+
+    def test_aprovacao_manual_durante_a_automatica(self):
+        with self.durante_a_view():
+            self.client.post(reverse('aprovar_reserva', args=[self.reserva.id]))
+        self.assertVagaOcupadaUmaVez()
+
+    def test_aprovacao_em_lote_durante_a_automatica(self):
+        with self.durante_a_view():
+            self.client.post(reverse('aprovar_multiplas_reservas'), {'reservas_selecionadas': [self.reserva.id]})
+        self.assertVagaOcupadaUmaVez()
+
+    def test_rejeicao_durante_a_automatica(self):
+        with self.durante_a_view():
+            self.client.post(reverse('rejeitar_reserva', args=[self.reserva.id]))
+        self.assertVagaOcupadaUmaVez()
+
+    def test_automatica_depois_da_manual(self):
+        self.client.post(reverse('aprovar_reserva', args=[self.reserva.id]))
+        self.assertEqual(aprovar_pendentes()['aprovadas'], [])
+        self.assertVagaOcupadaUmaVez()
+
+
+@override_settings(LIMITE_REQUISICOES={'horarios': (2, 0.001)}, SALA_ESPERA_MAXIMO=0)
+class LimiteRequisicoesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('horarios')
+
+    def test_cookie_de_sessao_inventado_nao_escapa_do_limite(self):
+        respostas = []
+        for numero in range(3):
+            self.client.cookies[settings.SESSION_COOKIE_NAME] = f'inventado{numero}'
+            respostas.append(self.client.get(self.url, REMOTE_ADDR='', HTTP_X_REAL_IP='10.0.0.1').status_code)
+        self.assertEqual(respostas[-1], 429)
+        # Outro cliente, identificado pelo IP repassado pelo proxy, tem o próprio balde
+        self.assertNotEqual(self.client.get(self.url, REMOTE_ADDR='', HTTP_X_REAL_IP='10.0.0.2').status_code, 429)
+
+    def test_limite_por_usuario(self):
+        self.client.force_login(User.objects.create_user(email='aluno@x.com', password='x'))
+        respostas = [self.client.get(self.url).status_code for _ in range(3)]
+        self.assertEqual(respostas, [200, 200, 429])
+
+    @override_settings(BUILD_ENV='production')
+    def test_cache_por_processo_desliga_o_limite(self):
+        self.assertFalse(cache_compartilhado())
+
+
+class ReconciliarVagasTests(TestCase):
+    def setUp(self):
+        laboratorio = Laboratorio.objects.create(num_laboratorio='V', capacidade=30)
+        self.horarios = [
+            Disponibilidade.objects.create(
+                laboratorio=laboratorio, data=timezone.localdate() + timedelta(days=1),
+                horario_inicio=time(hora), horario_fim=time(hora + 1), total_vagas=3,
+            )
+            for hora in (14, 16)
+        ]
+        for i in range(2):
+            Reserva.objects.create(
+                usuario=User.objects.create_user(email=f'v{i}@x.com', password='x'),
+                disponibilidade=self.horarios[0], status_aprovacao='A',
+            )
+        # Contadores corrompidos: deveriam ser 1 (3 - 2 aprovadas) e 3
+        Disponibilidade.objects.filter(id=self.horarios[0].id).update(vagas=3)
+        Disponibilidade.objects.filter(id=self.horarios[1].id).update(vagas=0)
+
+    def test_verificar_falha_com_divergencia_e_reconciliar_corrige(self):
+        with self.assertRaises(CommandError):
+            call_command('reconciliar_vagas', '--verificar', stdout=StringIO())
+        # --verificar não corrige
+        self.assertEqual(len(divergencias()), 2)
+
+        self.assertEqual([item['id'] for item in reconciliar()], [horario.id for horario in self.horarios])
+        vagas = dict(Disponibilidade.objects.values_list('id', 'vagas'))
+        self.assertEqual([vagas[horario.id] for horario in self.horarios], [1, 3])
+        self.assertEqual(divergencias(), [])
+        call_command('reconciliar_vagas', '--verificar', stdout=StringIO())
+
+
+class EncerramentoTests(TestCase):
+    def setUp(self):
+        self.laboratorio = Laboratorio.objects.create(num_laboratorio='E', capacidade=30)
+        self.alunos = [User.objects.create_user(email=f'e{i}@x.com', password='x') for i in range(3)]
+        self.horario = Disponibilidade.objects.create(
+            laboratorio=self.laboratorio, data=timezone.localdate() - timedelta(days=1),
+            horario_inicio=time(14), horario_fim=time(15), total_vagas=1,
+        )
+        self.reserva = Reserva.objects.create(usuario=self.alunos[0], disponibilidade=self.horario, status_aprovacao='A')
+        for aluno in self.alunos[1:]:
+            FilaEspera.objects.create(usuario=aluno, disponibilidade=self.horario)
+
+    def test_pico_da_fila_fica_registrado(self):
+        encerrar_lote(10)
+
+        self.assertFalse(FilaEspera.objects.exists())
+        self.assertEqual(UtilizacaoDiaria.objects.get().pico_fila_espera, 2)
+        # A atualização seguinte preenche o resto sem perder o pico
+        atualizar_utilizacao()
+        utilizacao = UtilizacaoDiaria.objects.get()
+        self.assertEqual((utilizacao.aprovadas, utilizacao.pico_fila_espera), (1, 2))
+
+    def test_pico_maior_que_o_registrado(self):
+        atualizar_utilizacao()
+        UtilizacaoDiaria.objects.update(pico_fila_espera=1)
+
+        encerrar_lote(10)
+        self.assertEqual(UtilizacaoDiaria.objects.get().pico_fila_espera, 2)
+
+    def test_contadores_criados_no_encerramento(self):
+        # Sem linha de contadores, ajustar() recalcula já com o horário encerrado
+        EstatisticaUsuario.objects.all().delete()
+        encerrar_lote(10)
+        self.assertEqual(EstatisticaUsuario.objects.get(usuario=self.alunos[0]).a_realizar, 0)
+
+    def test_contadores_com_linha_existente(self):
+        EstatisticaUsuario.recalcular([self.alunos[0].id])
+        encerrar_lote(10)
+        self.assertEqual(EstatisticaUsuario.objects.get(usuario=self.alunos[0]).a_realizar, 0)
+
+    def test_exclusao_em_cascata_recalcula_os_contadores(self):
+        futuro = Disponibilidade.objects.create(
+            laboratorio=self.laboratorio, data=timezone.localdate() + timedelta(days=1),
+            horario_inicio=time(14), horario_fim=time(15), total_vagas=1,
+        )
+        Reserva.objects.create(usuario=self.alunos[0], disponibilidade=futuro, status_aprovacao='A')
+        self.assertEqual(EstatisticaUsuario.do_usuario(self.alunos[0]).total_reservas, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            futuro.delete()
+        estatistica = EstatisticaUsuario.objects.get(usuario=self.alunos[0])
+        self.assertEqual((estatistica.total_reservas, estatistica.aprovadas), (1, 1))
+
+        # Excluindo o usuário, nada é recriado para ele
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alunos[0].delete()
+        self.assertFalse(EstatisticaUsuario.objects.filter(usuario_id=self.alunos[0].id).exists())
+
+
+class ImportarCsvTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.pasta = pasta.name
+
+    def importar(self, tipo, conteudo, *opcoes):
+        """Roda importar_csv com o conteúdo num arquivo temporário e devolve (stdout, stderr)."""
+        caminho = os.path.join(self.pasta, f'{tipo}.csv')
+        with open(caminho, 'w', encoding='utf-8-sig', newline='') as arquivo:
+            arquivo.write(conteudo)
+        saida, erros = StringIO(), StringIO()
+        call_command('importar_csv', tipo, caminho, *opcoes, stdout=saida, stderr=erros)
+        return saida.getvalue(), erros.getvalue()
+
+    def laboratorios(self):
+        return dict(Laboratorio.objects.values_list('num_laboratorio', 'capacidade'))
+
+    def test_simular_mostra_as_mudancas_sem_gravar(self):
+        Laboratorio.objects.create(num_laboratorio='A1', capacidade=20)
+        Laboratorio.objects.create(num_laboratorio='A3', capacidade=10)
+
+        saida, erros = self.importar('laboratorios', 'num_laboratorio,capacidade\nA1,25\nA2,30\nA3,10\n', '--simular')
+
+        self.assertIn('~ linha 2 A1: capacidade: 20 → 25', saida)
+        self.assertIn('+ linha 3 A2: capacidade=30', saida)
+        self.assertNotIn('A3', saida)
+        self.assertIn('Simulação, nada foi gravado: 1 a criar, 1 a atualizar, 1 sem mudança, 0 com erro.', saida)
+        self.assertEqual(erros, '')
+        self.assertEqual(self.laboratorios(), {'A1': 20, 'A3': 10})
+
+    def test_cria_e_atualiza_e_celula_vazia_mantem_o_valor(self):
+        Laboratorio.objects.create(num_laboratorio='A1', capacidade=20)
+        Laboratorio.objects.create(num_laboratorio='A3', capacidade=10)
+        conteudo = 'num_laboratorio,capacidade\nA1,25\nA2,30\nA3,\n'
+
+        saida, _ = self.importar('laboratorios', conteudo, '--lote', '2')
+        self.assertIn('1 criado(s), 1 atualizado(s), 1 sem mudança, 0 com erro.', saida)
+        self.assertEqual(self.laboratorios(), {'A1': 25, 'A2': 30, 'A3': 10})
+
+        # Importar de novo o mesmo arquivo não muda nada
+        saida, _ = self.importar('laboratorios', conteudo)
+        self.assertIn('0 criado(s), 0 atualizado(s), 3 sem mudança, 0 com erro.', saida)
+
+    def test_usuarios(self):
+        velho = User.objects.create_user(
+            email='velho@x.com', password='SenhaAntiga#1', perfil='administrador', first_name='Vera',
+        )
+        conteudo = 'email,first_name,perfil,senha\nnovo@x.com,Nei,monitor,SenhaForte#123\nvelho@x.com,,monitor,\n'
+
+        saida, _ = self.importar('usuarios', conteudo, '--processos', '1')
+
+        self.assertIn('1 criado(s), 1 atualizado(s)', saida)
+        novo = User.objects.get(email='novo@x.com')
+        self.assertEqual((novo.username, novo.first_name, novo.perfil), ('novo@x.com', 'Nei', 'monitor'))
+        self.assertTrue(check_password('SenhaForte#123', novo.password))
+        velho.refresh_from_db()
+        # Nome e senha vazios na linha: ficam os atuais
+        self.assertEqual((velho.first_name, velho.perfil), ('Vera', 'monitor'))
+        self.assertTrue(check_password('SenhaAntiga#1', velho.password))
+
+    def test_erros_por_linha_e_chave_repetida(self):
+        conteudo = (
+            'email,perfil,senha\n'
+            'bom@x.com,aluno,\n'
+            'sem-arroba,,\n'
+            'chefe@x.com,chefe,\n'
+            'fraca@x.com,,123\n'
+            'bom@x.com,monitor,\n'
+        )
+
+        saida, erros = self.importar('usuarios', conteudo)
+
+        linhas = erros.splitlines()
+        self.assertEqual(len(linhas), 4)
+        self.assertTrue(linhas[0].startswith('Linha 3 (sem-arroba): '))
+        self.assertTrue(linhas[1].startswith('Linha 4 (chefe@x.com): perfil "chefe" inválido'))
+        self.assertTrue(linhas[2].startswith('Linha 5 (fraca@x.com): '))
+        self.assertEqual(linhas[3], 'Linha 6 (bom@x.com): email repetido no arquivo.')
+        self.assertIn('1 criado(s), 0 atualizado(s), 0 sem mudança, 4 com erro.', saida)
+        self.assertEqual(list(User.objects.values_list('email', 'perfil')), [('bom@x.com', 'aluno')])
+
+    def test_linha_recusada_pelo_banco_nao_derruba_o_lote(self):
+        bulk_create = Laboratorio.objects.bulk_create
+
+        def recusar_b2(objetos, **kwargs):
+            if any(objeto.num_laboratorio == 'B2' for objeto in objetos):
+                raise IntegrityError('UNIQUE constraint failed')
+            return bulk_create(objetos, **kwargs)
+
+        conteudo = 'num_laboratorio,capacidade\nB1,10\nB2,20\nB3,30\n'
+        with mock.patch.object(Laboratorio.objects, 'bulk_create', side_effect=recusar_b2):
+            saida, erros = self.importar('laboratorios', conteudo)
+
+        self.assertEqual(erros, 'Linha 3 (B2): recusada pelo banco: UNIQUE constraint failed\n')
+        self.assertIn('+ linha 2 B1', saida)
+        self.assertNotIn('B2', saida)
+        self.assertIn('2 criado(s), 0 atualizado(s), 0 sem mudança, 1 com erro.', saida)
+        self.assertEqual(self.laboratorios(), {'B1': 10, 'B3': 30})
+
+    def test_cabecalho_invalido(self):
+        for conteudo, mensagem in (
+            ('capacidade\n10\n', 'O cabeçalho precisa da coluna "num_laboratorio".'),
+            ('num_laboratorio,andar\nA1,2\n', 'Colunas desconhecidas: andar.'),
+        ):
+            with self.subTest(conteudo=conteudo), self.assertRaisesMessage(CommandError, mensagem):
+                self.importar('laboratorios', conteudo)
+        self.assertFalse(Laboratorio.objects.exists())
+
+        with self.assertRaisesMessage(CommandError, 'Não foi possível ler o arquivo'):
+            call_command('importar_csv', 'laboratorios', os.path.join(self.pasta, 'nao_existe.csv'))
+
+
+class FragmentosCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user(email='admin@x.com', password='x', perfil='administrador'))
+        self.monitor = User.objects.create_user(email='monitor@x.com', password='x', perfil='monitor', first_name='Ana')
+        self.laboratorio = Laboratorio.objects.create(num_laboratorio='L1', capacidade=30)
+        Disponibilidade.objects.create(
+            laboratorio=self.laboratorio, data=timezone.localdate() + timedelta(days=1),
+            horario_inicio=time(14), horario_fim=time(15), total_vagas=5, monitor=self.monitor,
+        )
+
+    def test_renomear_laboratorio_ou_monitor_atualiza_a_linha(self):
+        # Só as linhas da aba, sem os filtros (que também listam os laboratórios)
+        url = reverse('listar_disponibilidades_aba', args=['futuras'])
+        self.assertContains(self.client.get(url), 'L1')
+
+        Laboratorio.objects.filter(id=self.laboratorio.id).update(num_laboratorio='L2')
+        User.objects.filter(id=self.monitor.id).update(suap_nome_completo='Beatriz Souza')
+        resposta = self.client.get(url)
+        self.assertContains(resposta, 'L2')
+        self.assertContains(resposta, 'Beatriz Souza')
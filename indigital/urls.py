@@ -5,13 +5,16 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('dashboard-redirect/', views.dashboard_redirect, name='dashboard_redirect'),
     path('listar/disponibilidades/', views.listar_disponibilidades, name='listar_disponibilidades'),
+    path('listar/disponibilidades/aba/<slug:aba>/', views.listar_disponibilidades, name='listar_disponibilidades_aba'),
     path('disponibilidade/<int:reserva_id>/editar', views.editar_disponibilidade, name='editar_disponibilidade'),
     path('disponibilidade/<int:disponibilidade_id>/excluir', views.excluir_disponibilidade, name="excluir_disponibilidade"),
     path('laboratorios/', views.listar_laboratorios, name='listar_laboratorios'),
     path('laboratorio/<int:laboratorio_id>/editar', views.editar_laboratorio, name='editar_laboratorio'),
     path('laboratorio/<int:laboratorio_id>/excluir', views.excluir_laboratorio, name="excluir_laboratorio"),
     path('horarios/', views.horarios, name='horarios'),
+    path('horarios/aba/<slug:aba>/', views.horarios, name='horarios_aba'),
     path('reservar/<int:disponibilidade_id>/', views.reservar_laboratorio, name='reservar_laboratorio'),
+    path('reservar/carrinho/', views.reservar_carrinho, name='reservar_carrinho'),
     path('cancelar_reserva/<int:reserva_id>/', views.cancelar_reserva, name='cancelar_reserva'),
     path('reservas/dia/', views.reservas_do_dia, name='reservas_do_dia'),
     path('fila/espera/', views.fila_espera, name='fila_espera'),
@@ -22,20 +25,34 @@ urlpatterns = [
     path('minha/fila/espera/', views.minha_fila_espera, name='minha_fila_espera'),
     path('usuarios/reserva/<int:disponibilidade_id>/', views.usuarios_da_reserva, name='usuarios_da_reserva'),
     path('frequencias/<int:disponibilidade_id>/', views.registrar_frequencias, name='registrar_frequencias'),
+    path('chamada/', views.chamada_offline, name='chamada_offline'),
+    path('chamada/lista.json', views.lista_chamada, name='lista_chamada'),
+    path('chamada/sincronizar/', views.sincronizar_chamada, name='sincronizar_chamada'),
+    path('chamada/sw.js', views.service_worker_chamada, name='service_worker_chamada'),
     path('listar/disponibilidades/monitor/', views.listar_disponibilidades_monitor, name='listar_disponibilidades_monitor'),
+    path('listar/disponibilidades/monitor/aba/<slug:aba>/', views.listar_disponibilidades_monitor, name='listar_disponibilidades_monitor_aba'),
     path('usuario/<int:usuario_id>/reservas/', views.reservas_por_usuario, name='reservas_por_usuario'),
     path('historico/reservas/', views.historico_reservas, name='historico_reservas'),
+    path('historico/reservas/aba/<slug:aba>/', views.historico_reservas, name='historico_reservas_aba'),
     path('historico/geral/reservas/', views.historico_geral_reservas, name='historico_geral_reservas'),
+    path('historico/geral/reservas/aba/<slug:aba>/', views.historico_geral_reservas, name='historico_geral_reservas_aba'),
     path('admin/dashboard/', views.admin_dashboard, name='admin_dashboard'),
     path('monitor/dashboard/', views.monitor_dashboard, name='monitor_dashboard'),
     path('reservas/pendentes/', views.reservas_pendentes, name='reservas_pendentes'),
     path('aprovar/reserva/<int:reserva_id>/', views.aprovar_reserva, name='aprovar_reserva'),
     path('rejeitar/reserva/<int:reserva_id>/', views.rejeitar_reserva, name='rejeitar_reserva'),
     path('aprovar/multiplas/reservas/', views.aprovar_multiplas_reservas, name='aprovar_multiplas_reservas'),
+    path('reservas/pendentes/aprovacao-automatica/', views.aplicar_aprovacao_automatica, name='aplicar_aprovacao_automatica'),
     path('criar-disponibilidade/', views.criar_disponibilidade, name='criar_disponibilidade'),
     path('criar-laboratorio/', views.criar_laboratorio, name='criar_laboratorio'),
     path('editar-laboratorio/<int:laboratorio_id>/', views.editar_laboratorio, name='editar_laboratorio'),
     path('verificar-disponibilidades/<int:laboratorio_id>/', views.verificar_disponibilidades, name='verificar_disponibilidades'),
     path('historico/geral/', views.historico_geral_reservas, name='historico_geral_reservas'),
-    path('cancelar/<int:reserva_id>/', views.cancelar_reserva, name='cancelar_reserva')
+    path('cancelar/<int:reserva_id>/', views.cancelar_reserva, name='cancelar_reserva'),
+    path('relatorio/utilizacao/', views.relatorio_utilizacao, name='relatorio_utilizacao'),
+    path('perfis/', views.perfis_requisicoes, name='perfis_requisicoes'),
+    path('perfis/<slug:nome>.<slug:extensao>', views.baixar_perfil, name='baixar_perfil'),
+    path('calendario/<str:token>/reservas.ics', views.calendario_reservas, name='calendario_reservas'),
+    path('calendario/<str:token>/monitorias.ics', views.calendario_monitor, name='calendario_monitor'),
+    path('calendario/<str:token>/laboratorio/<int:laboratorio_id>.ics', views.calendario_laboratorio, name='calendario_laboratorio'),
 ]
\ No newline at end of file
@@ -0,0 +1,184 @@
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from .models import Disponibilidade, FilaEspera, Reserva, UtilizacaoDiaria
+
+
+# Dias recalculados por transação
+LOTE_DIAS = 30
+# calculado_em das linhas criadas só com o pico da fila quando ainda não há nenhum
+# resumo: bem antigo, para a próxima atualização incremental recalcular tudo
+NUNCA_CALCULADO = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def dias_alterados(desde):
+    """Datas de horários com disponibilidade, reserva ou fila alterada depois de `desde`."""
+    datas = set(Disponibilidade.objects.filter(atualizado_em__gt=desde).values_list('data', flat=True).order_by().distinct())
+    datas |= set(Reserva.objects.filter(atualizado_em__gt=desde).values_list('disponibilidade__data', flat=True).order_by().distinct())
+    datas |= set(FilaEspera.objects.filter(data_solicitacao__gt=desde).values_list('disponibilidade__data', flat=True).order_by().distinct())
+    return datas
+
+
+def atualizar_dias(datas, calculado_em=None):
+    """
+    Recalcula as linhas de UtilizacaoDiaria das datas informadas.
+
+    São três consultas agrupadas por laboratório, data e hora (horários, reservas e
+    fila de espera) por lote de dias. O pico da fila nunca diminui: é o maior valor
+    entre o já gravado e o tamanho atual, porque as entradas somem da fila quando
+    alguém é promovido ou quando o horário é encerrado.
+    """
+    calculado_em = calculado_em or timezone.now()
+    datas = sorted(datas)
+    for inicio in range(0, len(datas), LOTE_DIAS):
+        atualizar_lote_dias(datas[inicio:inicio + LOTE_DIAS], calculado_em)
+    return len(datas)
+
+
+def atualizar_lote_dias(datas, calculado_em):
+    linhas = defaultdict(lambda: defaultdict(int))
+
+    for item in (
+        Disponibilidade.objects.filter(data__in=datas)
+        .annotate(hora=ExtractHour('horario_inicio'))
+        .values('laboratorio_id', 'data', 'hora')
+        .annotate(horarios=Count('id'), vagas=Sum('total_vagas'))
+        .order_by()
+    ):
+        linha = linhas[(item['laboratorio_id'], item['data'], item['hora'])]
+        linha['horarios_ofertados'] = item['horarios']
+        linha['vagas_ofertadas'] = item['vagas'] or 0
+
+    for item in (
+        Reserva.objects.filter(disponibilidade__data__in=datas)
+        .annotate(hora=ExtractHour('disponibilidade__horario_inicio'))
+        .values('disponibilidade__laboratorio_id', 'disponibilidade__data', 'hora')
+        .annotate(
+            aprovadas=Count('id', filter=Q(status_aprovacao='A')),
+            presentes=Count('id', filter=Q(status_aprovacao='A', status_frequencia='P')),
+            faltas=Count('id', filter=Q(status_aprovacao='A', status_frequencia='F')),
+            canceladas=Count('id', filter=Q(status_aprovacao='C')),
+        )
+        .order_by()
+    ):
+        linha = linhas[(item['disponibilidade__laboratorio_id'], item['disponibilidade__data'], item['hora'])]
+        linha['aprovadas'] = item['aprovadas']
+        linha['presentes'] = item['presentes']
+        linha['faltas'] = item['faltas']
+        linha['canceladas'] = item['canceladas']
+
+    for item in (
+        FilaEspera.objects.filter(disponibilidade__data__in=datas)
+        .annotate(hora=ExtractHour('disponibilidade__horario_inicio'))
+        .values('disponibilidade__laboratorio_id', 'disponibilidade__data', 'hora')
+        .annotate(fila=Count('id'))
+        .order_by()
+    ):
+        linhas[(item['disponibilidade__laboratorio_id'], item['disponibilidade__data'], item['hora'])]['pico_fila_espera'] = item['fila']
+
+    with transaction.atomic():
+        existentes = {
+            (u.laboratorio_id, u.data, u.hora): u
+            for u in UtilizacaoDiaria.objects.select_for_update().filter(data__in=datas)
+        }
+        # Horários excluídos desde a última atualização
+        removidas = [u.id for chave, u in existentes.items() if chave not in linhas]
+        if removidas:
+            UtilizacaoDiaria.objects.filter(id__in=removidas).delete()
+
+        objetos = []
+        for (laboratorio_id, data, hora), valores in linhas.items():
+            anterior = existentes.get((laboratorio_id, data, hora))
+            pico = max(valores['pico_fila_espera'], anterior.pico_fila_espera if anterior else 0)
+            objetos.append(UtilizacaoDiaria(
+                laboratorio_id=laboratorio_id,
+                data=data,
+                dia_semana=data.weekday(),
+                hora=hora,
+                horarios_ofertados=valores['horarios_ofertados'],
+                vagas_ofertadas=valores['vagas_ofertadas'],
+                aprovadas=valores['aprovadas'],
+                presentes=valores['presentes'],
+                faltas=valores['faltas'],
+                canceladas=valores['canceladas'],
+                pico_fila_espera=pico,
+                calculado_em=calculado_em,
+            ))
+        UtilizacaoDiaria.objects.bulk_create(
+            objetos,
+            update_conflicts=True,
+            unique_fields=['laboratorio', 'data', 'hora'],
+            update_fields=[
+                'dia_semana', 'horarios_ofertados', 'vagas_ofertadas', 'aprovadas', 'presentes',
+                'faltas', 'canceladas', 'pico_fila_espera', 'calculado_em',
+            ],
+        )
+
+
+def registrar_pico_fila(disponibilidade_ids):
+    """
+    Guarda o tamanho atual da fila de espera dos horários informados como pico em
+    UtilizacaoDiaria, quando for maior que o já registrado, antes de as entradas serem
+    removidas no encerramento. Lê só as filas e as linhas desses horários.
+
+    Linhas que ainda não existem são criadas só com o pico e calculado_em na marca atual
+    (a maior já gravada), sem adiantar a atualização incremental: os outros números são
+    preenchidos pela próxima atualizar_utilizacao, que mantém o maior pico.
+    """
+    filas = {
+        (item['disponibilidade__laboratorio_id'], item['disponibilidade__data'], item['hora']): item['fila']
+        for item in FilaEspera.objects.filter(disponibilidade_id__in=disponibilidade_ids)
+        .annotate(hora=ExtractHour('disponibilidade__horario_inicio'))
+        .values('disponibilidade__laboratorio_id', 'disponibilidade__data', 'hora')
+        .annotate(fila=Count('id'))
+        .order_by()
+    }
+    if not filas:
+        return
+
+    existentes = {
+        (u.laboratorio_id, u.data, u.hora): u
+        for u in UtilizacaoDiaria.objects.filter(
+            laboratorio_id__in={chave[0] for chave in filas}, data__in={chave[1] for chave in filas}
+        )
+    }
+    maiores = []
+    novas = []
+    marca = None
+    for (laboratorio_id, data, hora), fila in filas.items():
+        linha = existentes.get((laboratorio_id, data, hora))
+        if linha is not None:
+            if fila > linha.pico_fila_espera:
+                linha.pico_fila_espera = fila
+                maiores.append(linha)
+            continue
+        if marca is None:
+            marca = UtilizacaoDiaria.objects.aggregate(ultima=Max('calculado_em'))['ultima'] or NUNCA_CALCULADO
+        novas.append(UtilizacaoDiaria(
+            laboratorio_id=laboratorio_id, data=data, dia_semana=data.weekday(), hora=hora,
+            pico_fila_espera=fila, calculado_em=marca,
+        ))
+    UtilizacaoDiaria.objects.bulk_update(maiores, ['pico_fila_espera'])
+    # Se uma atualização simultânea criou a linha antes, ela já contou a fila
+    UtilizacaoDiaria.objects.bulk_create(novas, ignore_conflicts=True)
+
+
+def atualizar_utilizacao(completo=False):
+    """
+    Atualiza UtilizacaoDiaria só para os dias alterados desde a última atualização
+    (ou para todos, com completo=True). Retorna quantos dias foram recalculados.
+    """
+    inicio = timezone.now()
+    ultima = None if completo else UtilizacaoDiaria.objects.aggregate(ultima=Max('calculado_em'))['ultima']
+    if ultima is None:
+        datas = set(Disponibilidade.objects.values_list('data', flat=True).order_by().distinct())
+    else:
+        datas = dias_alterados(ultima)
+    # A marca da próxima execução é o início desta: o que mudar durante o cálculo
+    # entra de novo na próxima vez
+    return atualizar_dias(datas, calculado_em=inicio)
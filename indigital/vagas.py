@@ -0,0 +1,65 @@
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Disponibilidade
+
+
+def com_vagas_calculadas(disponibilidades=None):
+    """
+    Disponibilidades anotadas com as aprovadas e as vagas_calculadas (total_vagas menos
+    aprovadas, nunca abaixo de 0), em uma única consulta agrupada.
+    """
+    if disponibilidades is None:
+        disponibilidades = Disponibilidade.objects.all()
+    return disponibilidades.annotate(
+        aprovadas=Count('reserva', filter=Q(reserva__status_aprovacao='A')),
+    ).annotate(vagas_calculadas=Greatest(F('total_vagas') - F('aprovadas'), 0))
+
+
+def divergencias(disponibilidades=None):
+    """
+    Horários cujo contador de vagas difere do calculado a partir das reservas, com id,
+    total_vagas, aprovadas, vagas e vagas_calculadas.
+    """
+    return list(
+        com_vagas_calculadas(disponibilidades)
+        .exclude(vagas=F('vagas_calculadas'))
+        .order_by('id')
+        .values('id', 'total_vagas', 'aprovadas', 'vagas', 'vagas_calculadas')
+    )
+
+
+def excedidas(disponibilidades=None):
+    """Quantos horários têm mais reservas aprovadas que vagas ofertadas."""
+    return com_vagas_calculadas(disponibilidades).filter(aprovadas__gt=F('total_vagas')).count()
+
+
+def reconciliar(disponibilidades=None):
+    """
+    Corrige em lote o contador de vagas dos horários divergentes e retorna as divergências
+    encontradas. Os horários divergentes são travados e recalculados antes de gravar, para
+    não sobrescrever aprovações ou cancelamentos feitos depois da primeira leitura.
+    """
+    encontradas = divergencias(disponibilidades)
+    if not encontradas:
+        return []
+
+    agora = timezone.now()
+    with transaction.atomic():
+        ids = [item['id'] for item in encontradas]
+        travadas = list(Disponibilidade.objects.select_for_update().filter(id__in=ids).order_by('id'))
+        calculadas = dict(
+            com_vagas_calculadas(Disponibilidade.objects.filter(id__in=ids)).values_list('id', 'vagas_calculadas')
+        )
+        corrigidas = []
+        for disponibilidade in travadas:
+            vagas = calculadas[disponibilidade.id]
+            if disponibilidade.vagas != vagas:
+                disponibilidade.vagas = vagas
+                # bulk_update não aplica o auto_now (chave dos fragmentos em cache)
+                disponibilidade.atualizado_em = agora
+                corrigidas.append(disponibilidade)
+        Disponibilidade.objects.bulk_update(corrigidas, ['vagas', 'atualizado_em'])
+    return encontradas
@@ -1,20 +1,33 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from functools import wraps
-from datetime import date, datetime
+import json
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from datetime import date, datetime, timedelta
 from django.core.exceptions import ValidationError
 
 from usuarios.models import User
-from .models import Laboratorio, Reserva, Disponibilidade, FilaEspera
+from .models import Laboratorio, Reserva, Disponibilidade, EstatisticaUsuario, FilaEspera, UtilizacaoDiaria
 from .forms import DisponibilidadeForm, LaboratorioForm
+from .notificacoes import notificar_reserva
+from .fila_espera import ocupar_vaga, promover_fila_espera, travar_pendente
+from .aprovacao_automatica import aprovar_pendentes
+from .carrinho import MAXIMO_ITENS, reservar_varios
+from .idempotencia import idempotente
+from .perfilamento import CABECALHO, PARAMETRO, VALIDADE_TOKEN, arquivo_perfil, listar_perfis, token_perfilamento
+from .calendario import evento, responder_calendario, usuario_do_token
+from .chamada import MAXIMO_MARCACOES, lista_do_dia, sincronizar
+from .vagas import reconciliar
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import FileResponse, Http404, JsonResponse
 from django.template.loader import render_to_string
 from django.http import HttpResponse
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncWeek
 from django.views.decorators.http import require_POST
 from django.urls import reverse
 
@@ -74,7 +87,28 @@ def monitor_required(view_func):
 def admin_required(view_func):
     """
     Decorator para verificar se o usuário é um administrador.
+    Aceita views síncronas e assíncronas.
     """
+    def negar_acesso(request, usuario):
+        if not usuario.is_authenticated:
+            return redirect('account_login')
+        if usuario.perfil == 'outro':
+            messages.error(request, "Acesso restrito a usuários autenticados via SUAP.")
+            return render(request, '403.html', status=403)
+        messages.error(request, "Acesso negado. Apenas administradores têm permissão para acessar esta página.")
+        return render(request, '403.html', status=403)
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view_async(request, *args, **kwargs):
+            usuario = await request.auser()
+            if usuario.is_authenticated and (usuario.is_superuser or usuario.perfil == 'administrador'):
+                return await view_func(request, *args, **kwargs)
+            # Mensagens e template leem a sessão de forma síncrona
+            return await sync_to_async(negar_acesso)(request, usuario)
+
+        return _wrapped_view_async
+
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
         if not request.user.is_authenticated:
@@ -91,6 +125,29 @@ def admin_required(view_func):
     
     return _wrapped_view
 
+def superusuario_required(view_func):
+    """
+    Decorator para verificar se o usuário é superusuário.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return redirect('account_login')
+        if request.user.is_superuser:
+            return view_func(request, *args, **kwargs)
+        messages.error(request, "Acesso negado. Apenas superusuários têm permissão para acessar esta página.")
+        return render(request, '403.html', status=403)
+
+    return _wrapped_view
+
+
+def obter_aba_ativa(request, abas, aba=None):
+    """
+    Retorna a aba a ser renderizada: a da URL parcial (aba) ou a do parâmetro ?tab=.
+    Valores desconhecidos caem na primeira aba da lista.
+    """
+    aba = aba or request.GET.get('tab')
+    return aba if aba in abas else abas[0]
 
 def filter_by_status(queryset, status):
     if status and status != 'todos':
@@ -151,22 +208,14 @@ def monitor_dashboard(request):
         disponibilidade__monitor=request.user,
         status_aprovacao='A'
     )
-    user = request.user
-    # Estatísticas
-    minhas_reservas = Reserva.objects.filter(usuario=user)
-
-    total_reservas = minhas_reservas.count()
-    reservas_presentes = minhas_reservas.filter(status_frequencia='P').count()
-    reservas_faltas = minhas_reservas.filter(status_frequencia='F').count()
-    reservas_pendentes = minhas_reservas.filter(
-        disponibilidade__data__gte=date.today()
-    ).filter(Q(status_frequencia='') | Q(status_frequencia='N')).count()
+    # Estatísticas (contadores mantidos a cada mudança de reserva)
+    estatistica = EstatisticaUsuario.do_usuario(request.user)
     
     context = {
-        'total_reservas': total_reservas,
-        'reservas_presentes': reservas_presentes,
-        'reservas_faltas': reservas_faltas,
-        'reservas_pendentes': reservas_pendentes,
+        'total_reservas': estatistica.total_reservas,
+        'reservas_presentes': estatistica.presentes,
+        'reservas_faltas': estatistica.faltas,
+        'reservas_pendentes': estatistica.a_realizar,
         'reservas_hoje': page_obj,
         'page_obj': page_obj,
         'today': date.today(),
@@ -182,20 +231,14 @@ def index(request):
     elif user.perfil == 'monitor':
         return redirect('monitor_dashboard')
 
-    minhas_reservas = Reserva.objects.filter(usuario=user)
-
-    total_reservas = minhas_reservas.count()
-    reservas_presentes = minhas_reservas.filter(status_frequencia='P').count()
-    reservas_faltas = minhas_reservas.filter(status_frequencia='F').count()
-    reservas_pendentes = minhas_reservas.filter(
-        disponibilidade__data__gte=date.today()
-    ).filter(Q(status_frequencia='') | Q(status_frequencia='N')).count()
+    # Estatísticas (contadores mantidos a cada mudança de reserva)
+    estatistica = EstatisticaUsuario.do_usuario(user)
 
     context = {
-        'total_reservas': total_reservas,
-        'reservas_presentes': reservas_presentes,
-        'reservas_faltas': reservas_faltas,
-        'reservas_pendentes': reservas_pendentes,
+        'total_reservas': estatistica.total_reservas,
+        'reservas_presentes': estatistica.presentes,
+        'reservas_faltas': estatistica.faltas,
+        'reservas_pendentes': estatistica.a_realizar,
     }
     return render(request, "index.html", context)
 
@@ -216,15 +259,21 @@ def editar_disponibilidade(request, reserva_id):
             disponibilidade = form.save(commit=False)
 
             # VALIDAÇÃO: Número de vagas não pode ser maior que a capacidade do laboratório
-            if disponibilidade.vagas > disponibilidade.laboratorio.capacidade:
+            # nem menor que as reservas já aprovadas
+            aprovadas = Reserva.objects.filter(disponibilidade=disponibilidade, status_aprovacao='A').count()
+            error_msg = None
+            if disponibilidade.total_vagas > disponibilidade.laboratorio.capacidade:
                 error_msg = f"O número de vagas não pode ser maior que a capacidade máxima do laboratório: {disponibilidade.laboratorio.capacidade} vagas."
-                form.add_error('vagas', error_msg)
+            elif disponibilidade.total_vagas < aprovadas:
+                error_msg = f"O número de vagas não pode ser menor que as {aprovadas} reservas já aprovadas para este horário."
+            if error_msg:
+                form.add_error('total_vagas', error_msg)
                 context["form"] = form
 
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     return JsonResponse({
                         'success': False, 
-                        'errors': {'vagas': error_msg}
+                        'errors': {'total_vagas': error_msg}
                     }, status=400)
 
                 messages.error(request, error_msg)
@@ -241,14 +290,15 @@ def editar_disponibilidade(request, reserva_id):
                 messages.error(request, "O horário de início deve ser menor que o horário de fim.")
                 return render(request, "editar_disponibilidade.html", context)
 
-            conflito = Disponibilidade.objects.filter(
-                laboratorio=disponibilidade.laboratorio,
-                data=disponibilidade.data,
-                horario_inicio__lt=disponibilidade.horario_fim,
-                horario_fim__gt=disponibilidade.horario_inicio
-            ).exclude(id=disponibilidade.id).exists()
-
-            if conflito:
+            # A sobreposição com outro horário do laboratório é barrada pelo banco
+            try:
+                with transaction.atomic():
+                    disponibilidade.save()
+                    # As vagas restantes seguem o novo total, descontadas as aprovadas
+                    reconciliar(Disponibilidade.objects.filter(id=disponibilidade.id))
+                    # Vagas a mais vão para a fila de espera
+                    transaction.on_commit(lambda: promover_fila_espera(disponibilidade), robust=True)
+            except IntegrityError:
                 form.add_error(None, "Já existe uma disponibilidade nesse horário para este laboratório.")
                 context["form"] = form
 
@@ -259,9 +309,6 @@ def editar_disponibilidade(request, reserva_id):
 
                 messages.error(request, "Já existe uma disponibilidade nesse horário para este laboratório.")
                 return render(request, "editar_disponibilidade.html", context)
-
-            
-            disponibilidade.save()
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({
@@ -288,7 +335,7 @@ def editar_disponibilidade(request, reserva_id):
 
 @login_required
 @admin_required
-def listar_disponibilidades(request):
+def listar_disponibilidades(request, aba=None):
     form = DisponibilidadeForm()
     
     disponibilidades = Disponibilidade.objects.all().select_related('laboratorio', 'monitor').order_by('-data', 'horario_inicio')
@@ -298,7 +345,6 @@ def listar_disponibilidades(request):
     data_inicio = request.GET.get('data_inicio')
     data_fim = request.GET.get('data_fim')
     monitor_id = request.GET.get('monitor_id')
-    active_tab = request.GET.get('tab', 'todas')
     
     # Aplicar filtros
     if laboratorio_id and laboratorio_id != 'todos':
@@ -324,41 +370,33 @@ def listar_disponibilidades(request):
     # Data atual para filtros
     today = date.today()
     
-    # Separar as disponibilidades por categoria
-    disponibilidades_todas = disponibilidades
-    
-    disponibilidades_futuras = disponibilidades.filter(data__gt=today)
-    
-    disponibilidades_hoje = disponibilidades.filter(data=today)
-    
-    disponibilidades_passadas = disponibilidades.filter(data__lt=today)
-    
-    # Paginação para cada categoria
-    paginator_todas = Paginator(disponibilidades_todas, 5)
-    paginator_futuras = Paginator(disponibilidades_futuras, 5)
-    paginator_hoje = Paginator(disponibilidades_hoje, 5)
-    paginator_passadas = Paginator(disponibilidades_passadas, 5)
-    
-    # Obter página para cada categoria
-    page_number = request.GET.get('page')
-    page_futuras = request.GET.get('page_futuras')
-    page_hoje = request.GET.get('page_hoje')
-    page_passadas = request.GET.get('page_passadas')
-    
-    page_obj = paginator_todas.get_page(page_number)
-    page_obj_futuras = paginator_futuras.get_page(page_futuras)
-    page_obj_hoje = paginator_hoje.get_page(page_hoje)
-    page_obj_passadas = paginator_passadas.get_page(page_passadas)
+    # Apenas a aba ativa é consultada; as demais são carregadas sob demanda
+    active_tab = obter_aba_ativa(request, ['todas', 'futuras', 'hoje', 'passadas'], aba)
+    context = {
+        'today': today,
+        'active_tab': active_tab,
+    }
+    if active_tab == 'futuras':
+        paginator = Paginator(disponibilidades.filter(data__gt=today), 5)
+        context['page_obj_futuras'] = paginator.get_page(request.GET.get('page_futuras'))
+    elif active_tab == 'hoje':
+        paginator = Paginator(disponibilidades.filter(data=today), 5)
+        context['page_obj_hoje'] = paginator.get_page(request.GET.get('page_hoje'))
+    elif active_tab == 'passadas':
+        paginator = Paginator(disponibilidades.filter(data__lt=today), 5)
+        context['page_obj_passadas'] = paginator.get_page(request.GET.get('page_passadas'))
+    else:
+        paginator = Paginator(disponibilidades, 5)
+        context['page_obj'] = paginator.get_page(request.GET.get('page'))
+
+    if aba:
+        return render(request, "listar_disponibilidades_abas.html", context)
     
     # Filtros para o template
     laboratorios = Laboratorio.objects.all().order_by('num_laboratorio')
     monitores = User.objects.filter(perfil='monitor').order_by('username')
     
-    context = {
-        'page_obj': page_obj,
-        'page_obj_futuras': page_obj_futuras,
-        'page_obj_hoje': page_obj_hoje,
-        'page_obj_passadas': page_obj_passadas,
+    context.update({
         'laboratorios': laboratorios,
         'monitores': monitores,
         'laboratorio_id': laboratorio_id,
@@ -366,9 +404,7 @@ def listar_disponibilidades(request):
         'data_fim': data_fim,
         'monitor_id': monitor_id,
         'form': form,
-        'today': today,
-        'active_tab': active_tab,
-    }
+    })
     
     return render(request, "listar_disponibilidades.html", context)
 
@@ -418,8 +454,8 @@ def criar_disponibilidade(request):
         if form.is_valid():
             disponibilidade = form.save(commit=False)
 
-            if disponibilidade.vagas <= 0:
-                form.add_error('vagas', "O número de vagas deve ser maior que zero.")
+            if disponibilidade.total_vagas <= 0:
+                form.add_error('total_vagas', "O número de vagas deve ser maior que zero.")
                 
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     form_html = render_to_string('modal_form.html', {'form': form}, request=request)
@@ -438,21 +474,17 @@ def criar_disponibilidade(request):
                 messages.error(request, "O horário de início deve ser menor que o horário de fim.")
                 return redirect('listar_disponibilidades')
 
-            conflito = Disponibilidade.objects.filter(
-                laboratorio=disponibilidade.laboratorio,
-                data=disponibilidade.data,
-                horario_inicio__lt=disponibilidade.horario_fim,
-                horario_fim__gt=disponibilidade.horario_inicio
-            ).exists()
-
-            if conflito:
+            # A sobreposição com outro horário do laboratório é barrada pelo banco
+            try:
+                with transaction.atomic():
+                    disponibilidade.save()
+            except IntegrityError:
+                form.add_error(None, "Já existe uma disponibilidade nesse horário para este laboratório.")
                 messages.error(request, "Já existe uma disponibilidade nesse horário para este laboratório.")
                 if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                     form_html = render_to_string('modal_form.html', {'form': form}, request=request)
                     return JsonResponse({'success': False, 'form_html': form_html})
                 return redirect('listar_disponibilidades')
-
-            disponibilidade.save()
             
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return JsonResponse({'success': True})
@@ -687,11 +719,12 @@ def excluir_laboratorio(request, laboratorio_id):
 
 @login_required
 @admin_required
-def verificar_disponibilidades(request, laboratorio_id):
-    laboratorio = get_object_or_404(Laboratorio, id=laboratorio_id)
+async def verificar_disponibilidades(request, laboratorio_id):
+    # View assíncrona: sob ASGI a espera pelo banco não ocupa um worker
+    laboratorio = await aget_object_or_404(Laboratorio, id=laboratorio_id)
     
     # Verificar se existem disponibilidades
-    disponibilidades_existem = Disponibilidade.objects.filter(laboratorio=laboratorio).exists()
+    disponibilidades_existem = await Disponibilidade.objects.filter(laboratorio=laboratorio).aexists()
     
     return JsonResponse({
         'disponibilidades_existem': disponibilidades_existem
@@ -700,8 +733,8 @@ def verificar_disponibilidades(request, laboratorio_id):
 # horarios e reservas
 @login_required
 @aluno_required
-def horarios(request):
-    disponibilidades = Disponibilidade.objects.all().select_related('laboratorio', 'monitor').order_by('data', 'horario_inicio')
+def horarios(request, aba=None):
+    disponibilidades = Disponibilidade.objects.all().select_related('laboratorio', 'monitor').order_by('inicio_em')
     
     # Filtros
     laboratorio_id = request.GET.get('laboratorio_id')
@@ -737,93 +770,57 @@ def horarios(request):
         disponibilidades = disponibilidades.filter(vagas__gt=0)
     
     # Remover disponibilidades cujo horário de início já passou
-    from django.utils import timezone
     agora = timezone.localtime(timezone.now())
-    
-    # Criar listas separadas para cada aba
-    disponibilidades_todos = []
-    disponibilidades_hoje = []
-    disponibilidades_futuro = []
-    
-    hoje = date.today()
-    
-    for d in disponibilidades:
-        if not d.is_passada():  
-            d.expirada = d.is_passada()
-            disponibilidades_todos.append(d)
-            
-            if d.data == hoje:
-                disponibilidades_hoje.append(d)
-            elif d.data > hoje:
-                disponibilidades_futuro.append(d)
-    
-    # Determinar aba ativa
-    active_tab = request.GET.get('tab', 'todos')
-    
-    # Paginação para cada aba
-    page = request.GET.get('page', 1)
-    page_hoje = request.GET.get('page_hoje', 1)
-    page_futuro = request.GET.get('page_futuro', 1)
-    
-    paginator_todos = Paginator(disponibilidades_todos, 5)
-    paginator_hoje = Paginator(disponibilidades_hoje, 5)
-    paginator_futuro = Paginator(disponibilidades_futuro, 5)
-    
-    try:
-        page_obj = paginator_todos.page(page)
-    except PageNotAnInteger:
-        page_obj = paginator_todos.page(1)
-    except EmptyPage:
-        page_obj = paginator_todos.page(paginator_todos.num_pages)
-        
-    try:
-        page_obj_hoje = paginator_hoje.page(page_hoje)
-    except PageNotAnInteger:
-        page_obj_hoje = paginator_hoje.page(1)
-    except EmptyPage:
-        page_obj_hoje = paginator_hoje.page(paginator_hoje.num_pages)
-        
-    try:
-        page_obj_futuro = paginator_futuro.page(page_futuro)
-    except PageNotAnInteger:
-        page_obj_futuro = paginator_futuro.page(1)
-    except EmptyPage:
-        page_obj_futuro = paginator_futuro.page(paginator_futuro.num_pages)
-    
-    # Buscar reservas e filas do usuário para verificar status
-    reservas_em_fila = FilaEspera.objects.filter(usuario=request.user).values_list('disponibilidade_id', flat=True)
-    
-    # Buscar reservas do usuário (pendentes e aprovadas)
-    minhas_reservas = Reserva.objects.filter(
-        usuario=request.user,
-        status_aprovacao__in=['P', 'A']
-    ).values_list('disponibilidade_id', flat=True)
-    
-    # Buscar reservas pendentes específicas para mostrar status
-    reservas_pendentes = Reserva.objects.filter(
-        usuario=request.user,
-        status_aprovacao='P'
-    ).values_list('disponibilidade_id', flat=True)
-    
-    
-    reservas_rejeitadas = Reserva.objects.filter(
+    hoje = agora.date()
+    disponibilidades = disponibilidades.filter(encerrada=False, inicio_em__gte=agora)
+
+    # Apenas a aba ativa é consultada; as demais são carregadas sob demanda
+    active_tab = obter_aba_ativa(request, ['todos', 'hoje', 'futuro'], aba)
+    context = {
+        'active_tab': active_tab,
+        'today': hoje,
+    }
+    if active_tab == 'hoje':
+        page_obj = Paginator(disponibilidades.filter(data=hoje), 5).get_page(request.GET.get('page_hoje'))
+        context['page_obj_hoje'] = page_obj
+    elif active_tab == 'futuro':
+        page_obj = Paginator(disponibilidades.filter(data__gt=hoje), 5).get_page(request.GET.get('page_futuro'))
+        context['page_obj_futuro'] = page_obj
+    else:
+        page_obj = Paginator(disponibilidades, 5).get_page(request.GET.get('page'))
+        context['page_obj'] = page_obj
+
+    # Situação do usuário em cada horário da página, carregada uma única vez como
+    # dicionário/conjunto para que cada linha consulte em O(1) (e componha a chave
+    # de cache do fragmento)
+    ids_pagina = [d.id for d in page_obj]
+    status_reservas = {}
+    for disponibilidade_id, status in Reserva.objects.filter(
         usuario=request.user,
-        status_aprovacao='R'
-    ).values_list('disponibilidade_id', flat=True)
-    
+        disponibilidade_id__in=ids_pagina,
+        status_aprovacao__in=['P', 'A', 'R']
+    ).values_list('disponibilidade_id', 'status_aprovacao'):
+        # Pendente tem prioridade sobre aprovada, que tem prioridade sobre rejeitada
+        atual = status_reservas.get(disponibilidade_id)
+        if atual is None or 'PAR'.index(status) < 'PAR'.index(atual):
+            status_reservas[disponibilidade_id] = status
+    reservas_em_fila = set(
+        FilaEspera.objects.filter(
+            usuario=request.user, disponibilidade_id__in=ids_pagina
+        ).values_list('disponibilidade_id', flat=True)
+    )
+    for d in page_obj:
+        d.status_reserva = status_reservas.get(d.id, '')
+        d.na_fila = d.id in reservas_em_fila
+
+    if aba:
+        return render(request, "horarios_abas.html", context)
+
     # Dados para os filtros
     laboratorios = Laboratorio.objects.all().order_by('num_laboratorio')
     monitores = User.objects.filter(perfil='monitor').order_by('username')
-    
-    context = {
-        'page_obj': page_obj,
-        'page_obj_hoje': page_obj_hoje,
-        'page_obj_futuro': page_obj_futuro,
-        'active_tab': active_tab,
-        'reservas_em_fila': reservas_em_fila,
-        'minhas_reservas': minhas_reservas,
-        'reservas_pendentes': reservas_pendentes,
-        'reservas_rejeitadas': reservas_rejeitadas,
+
+    context.update({
         'laboratorios': laboratorios,
         'monitores': monitores,
         'laboratorio_id': laboratorio_id,
@@ -832,12 +829,13 @@ def horarios(request):
         'vagas_minimas': vagas_minimas,
         'monitor_id': monitor_id,
         'apenas_com_vagas': apenas_com_vagas,
-        'today': hoje,
-        'now_time': agora.strftime('%H:%M'),
-    }
+        'maximo_carrinho': MAXIMO_ITENS,
+    })
     return render(request, "horarios.html", context)
 
 @login_required
+@require_POST
+@idempotente
 def reservar_laboratorio(request, disponibilidade_id):
     disponibilidade = get_object_or_404(Disponibilidade, id=disponibilidade_id)
     # Impedir reservas para disponibilidades que já iniciaram
@@ -859,7 +857,12 @@ def reservar_laboratorio(request, disponibilidade_id):
             reserva = Reserva(usuario=request.user, disponibilidade=disponibilidade, status_aprovacao='P')
             reserva.clean()
             reserva.save()
-            messages.success(request, "Solicitação de reserva enviada! Aguarde a aprovação do administrador.")
+            # A fila de pendentes do horário passa pelas regras de aprovação automática
+            aprovadas = aprovar_pendentes([disponibilidade.id])['aprovadas']
+            if any(aprovada.id == reserva.id for aprovada in aprovadas):
+                messages.success(request, "Reserva aprovada! Compareça ao laboratório no horário reservado.")
+            else:
+                messages.success(request, "Solicitação de reserva enviada! Aguarde a aprovação do administrador.")
         except ValidationError as e:
             if hasattr(e, 'message'):
                 error_msg = e.message
@@ -878,6 +881,43 @@ def reservar_laboratorio(request, disponibilidade_id):
             messages.info(request, "Sem vagas disponíveis, você foi adicionado à fila de espera para este horário.")
     return redirect('horarios')
 
+@login_required
+@aluno_required
+@require_POST
+@idempotente
+def reservar_carrinho(request):
+    # Vários horários do carrinho de horarios.html em uma única solicitação
+    try:
+        ids = [int(valor) for valor in request.POST.getlist('disponibilidades')]
+    except ValueError:
+        ids = None
+    erro = None
+    if not ids:
+        erro = "Selecione ao menos um horário válido."
+    elif len(ids) > MAXIMO_ITENS:
+        erro = f"Selecione no máximo {MAXIMO_ITENS} horários por vez."
+    if erro:
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return JsonResponse({'success': False, 'error': erro}, status=400)
+        messages.error(request, erro)
+        return redirect('horarios')
+
+    resultados = reservar_varios(request.user, ids)
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse({
+            'success': any(item['resultado'] != 'erro' for item in resultados),
+            'resultados': resultados,
+        })
+    for item in resultados:
+        texto = f"{item['descricao']}: {item['mensagem']}" if item['descricao'] else item['mensagem']
+        if item['resultado'] == 'reservada':
+            messages.success(request, texto)
+        elif item['resultado'] == 'fila':
+            messages.info(request, texto)
+        else:
+            messages.error(request, texto)
+    return redirect('horarios')
+
 @login_required
 @monitor_required
 def reservas_do_dia(request):
@@ -913,7 +953,7 @@ def reservas_do_dia(request):
     if monitor_id and monitor_id != 'todos' and (request.user.is_superuser or request.user.perfil == 'administrador'):
         reservas = reservas.filter(disponibilidade__monitor_id=monitor_id)
     # Paginação
-    paginator = Paginator(reservas, 5)
+    paginator = Paginator(reservas.order_by('disponibilidade__horario_inicio', 'id'), 5)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     # Dados para os filtros
@@ -926,6 +966,8 @@ def reservas_do_dia(request):
             disponibilidade__monitor=request.user
         ).distinct().order_by('num_laboratorio')
         usuarios = User.objects.filter(reserva__disponibilidade__monitor=request.user, reserva__disponibilidade__data=date.today()).distinct().order_by('username')
+        # O monitor só vê os próprios horários: sem filtro por monitor
+        monitores = User.objects.none()
     
     context = {
         'page_obj': page_obj,
@@ -985,10 +1027,10 @@ def fila_espera(request):
 
 @login_required
 @admin_required
+@idempotente
 def promover_fila(request, fila_id):
     fila = get_object_or_404(FilaEspera, id=fila_id)
     disponibilidade = fila.disponibilidade
-    agora = timezone.localtime(timezone.now())
 
     # Rejeitar métodos diferentes de POST para segurança
     is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
@@ -998,7 +1040,7 @@ def promover_fila(request, fila_id):
         return redirect('fila_espera')
 
     # Não permitir promover reservas cujo horário já passou (início já ocorreu ou término já passou)
-    if disponibilidade.is_passada() or disponibilidade.end_datetime() <= agora:
+    if disponibilidade.is_passada():
         msg = "Não é possível promover esta reserva: o horário já passou."
         if is_ajax:
             return JsonResponse({'success': False, 'error': msg}, status=400)
@@ -1017,10 +1059,12 @@ def promover_fila(request, fila_id):
         with transaction.atomic():
             reserva = Reserva(usuario=fila.usuario, disponibilidade=disponibilidade, status_aprovacao='A')
             reserva.clean()
+            # Decremento condicional no banco, sem gravar um contador lido antes
+            if not ocupar_vaga(disponibilidade.id):
+                raise ValidationError("Não há vagas disponíveis para promover o usuário da fila de espera.")
             reserva.save()
-            disponibilidade.vagas -= 1
-            disponibilidade.save()
             fila.delete()
+            notificar_reserva(reserva, 'promovida')
     except ValidationError as e:
         if hasattr(e, 'message'):
             error_msg = e.message
@@ -1046,6 +1090,7 @@ def promover_fila(request, fila_id):
 
 @login_required
 @admin_required
+@idempotente
 def remover_fila(request, fila_id):
     fila = get_object_or_404(FilaEspera, id=fila_id)
     is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
@@ -1063,6 +1108,8 @@ def remover_fila(request, fila_id):
     return redirect('fila_espera')
 
 @login_required
+@require_POST
+@idempotente
 def entrar_fila_espera(request, disponibilidade_id):
     disponibilidade = get_object_or_404(Disponibilidade, id=disponibilidade_id)
     # Impedir entrar na fila para disponibilidades que já iniciaram
@@ -1090,14 +1137,8 @@ def entrar_fila_espera(request, disponibilidade_id):
 def sair_fila_espera(request, fila_id):
     fila = get_object_or_404(FilaEspera, id=fila_id, usuario=request.user)
     # Não permitir sair da fila se o horário já passou
-    agora = timezone.localtime(timezone.now())
-    try:
-        if fila.disponibilidade.end_datetime() <= agora:
-            messages.error(request, "Não é possível sair da fila: o horário já passou.")
-            return redirect('minha_fila_espera')
-    except Exception:
-        # Se houver qualquer problema ao calcular end_datetime, prevenir a ação por segurança
-        messages.error(request, "Não é possível sair da fila neste momento.")
+    if fila.disponibilidade.fim_em <= timezone.now():
+        messages.error(request, "Não é possível sair da fila: o horário já passou.")
         return redirect('minha_fila_espera')
 
     fila.delete()
@@ -1107,7 +1148,7 @@ def sair_fila_espera(request, fila_id):
 @login_required
 @aluno_required
 def minha_fila_espera(request):
-    minhas_filas = FilaEspera.objects.filter(usuario=request.user).select_related('disponibilidade__laboratorio', 'disponibilidade__monitor').order_by('disponibilidade__data', 'disponibilidade__horario_inicio')
+    minhas_filas = FilaEspera.objects.filter(usuario=request.user).select_related('disponibilidade__laboratorio', 'disponibilidade__monitor').order_by('disponibilidade__inicio_em')
     
     # Filtros
     laboratorio_id = request.GET.get('laboratorio_id')
@@ -1133,45 +1174,35 @@ def minha_fila_espera(request):
         except ValueError:
             messages.error(request, "Data de fim inválida.")
     
-    dados_filas = []
+    # Filas de horários já encerrados pelo comando encerrar_disponibilidades são "processadas"
+    if status == 'ativo':
+        minhas_filas = minhas_filas.filter(disponibilidade__encerrada=False)
+    elif status == 'processado':
+        minhas_filas = minhas_filas.filter(disponibilidade__encerrada=True)
+
+    # Posição na fila calculada no banco: quantos entraram antes (ou junto) no mesmo horário
+    minhas_filas = minhas_filas.annotate(
+        posicao=Subquery(
+            FilaEspera.objects.filter(
+                disponibilidade=OuterRef('disponibilidade'),
+                data_solicitacao__lte=OuterRef('data_solicitacao'),
+            ).order_by().values('disponibilidade').annotate(total=Count('id')).values('total')
+        )
+    )
+
     today = date.today()
     agora = timezone.localtime(timezone.now())
-    
-    for fila in minhas_filas:
-        fila_geral = FilaEspera.objects.filter(disponibilidade=fila.disponibilidade).order_by('data_solicitacao')
-        usuarios_em_ordem = list(fila_geral.values_list('usuario_id', flat=True))
-        posicao = usuarios_em_ordem.index(request.user.id) + 1
-        
-        # Determinar o status da fila
-        if fila.disponibilidade.data < today:
-            status_fila = 'processado'
-        else:
-            status_fila = 'ativo'
-        
-        # Determinar se o usuário ainda pode sair da fila (horário não passou e status ativo)
-        try:
-            can_sair = (fila.disponibilidade.end_datetime() > agora) and (status_fila == 'ativo')
-        except Exception:
-            can_sair = False
-
-        item = {
-            'id': fila.id,
-            'disponibilidade': fila.disponibilidade,
-            'data_solicitacao': fila.data_solicitacao,
-            'posicao': posicao,
-            'status': status_fila,
-            'can_sair': can_sair,
-        }
-        
-        # Aplicar filtro de status se especificado
-        if not status or status == 'todos' or status == status_fila:
-            dados_filas.append(item)
-    
+
     # Paginação
-    paginator = Paginator(dados_filas, 5)
+    paginator = Paginator(minhas_filas, 5)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
-    
+
+    for fila in page_obj:
+        fila.status = 'processado' if fila.disponibilidade.encerrada else 'ativo'
+        # O horário pode ter terminado antes da próxima execução do comando
+        fila.can_sair = fila.status == 'ativo' and fila.disponibilidade.fim_em > agora
+
     # Dados para os filtros
     laboratorios = Laboratorio.objects.all().order_by('num_laboratorio')
     
@@ -1189,18 +1220,15 @@ def minha_fila_espera(request):
 
 @login_required
 @aluno_required
+@idempotente
 def sair_fila_espera(request, fila_id):
     if request.method == 'POST':
         try:
             fila = FilaEspera.objects.get(id=fila_id, usuario=request.user)
             
-            today = date.today()
             agora = timezone.localtime(timezone.now())
             
-            try:
-                can_sair = (fila.disponibilidade.end_datetime() > agora) and (fila.disponibilidade.data >= today)
-            except Exception:
-                can_sair = False
+            can_sair = not fila.disponibilidade.encerrada and fila.disponibilidade.fim_em > agora
             
             if can_sair:
                 laboratorio_num = fila.disponibilidade.laboratorio.num_laboratorio
@@ -1222,11 +1250,11 @@ def sair_fila_espera(request, fila_id):
 @login_required
 @monitor_required
 def usuarios_da_reserva(request, disponibilidade_id):
-    disponibilidade = get_object_or_404(Disponibilidade, id=disponibilidade_id)
+    disponibilidade = get_object_or_404(Disponibilidade.objects.select_related('laboratorio', 'monitor'), id=disponibilidade_id)
     # Verificar se o usuário tem permissão para ver esta disponibilidade
     if not (request.user.is_superuser or 
             request.user.perfil == 'administrador' or 
-            (request.user.perfil == 'monitor' and disponibilidade.monitor == request.user)):
+            (request.user.perfil == 'monitor' and disponibilidade.monitor_id == request.user.id)):
         messages.error(request, "Acesso negado. Você não tem permissão para ver esta disponibilidade.")
         return render(request, '403.html', status=403)
     # Buscar reservas e fila de espera para esta disponibilidade
@@ -1259,8 +1287,9 @@ def usuarios_da_reserva(request, disponibilidade_id):
         'disponibilidade': disponibilidade, 
         'reservas_page_obj': reservas_page_obj,
         'fila_page_obj': fila_page_obj,
-        'reservas_count': reservas.count(),
-        'fila_count': fila_espera.count(),
+        # Totais já contados pelos paginadores
+        'reservas_count': reservas_paginator.count,
+        'fila_count': fila_paginator.count,
         'usuario_id': usuario_id,
         'status_frequencia': status_frequencia,
         'usuarios': usuarios,
@@ -1269,7 +1298,7 @@ def usuarios_da_reserva(request, disponibilidade_id):
 
 @login_required
 @monitor_required
-def listar_disponibilidades_monitor(request):
+def listar_disponibilidades_monitor(request, aba=None):
     from datetime import date
 
     today = date.today()
@@ -1281,57 +1310,47 @@ def listar_disponibilidades_monitor(request):
     laboratorio_id = request.GET.get('laboratorio_id')
     data_inicio = request.GET.get('data_inicio')
     data_fim = request.GET.get('data_fim')
-    active_tab = request.GET.get('tab', 'todas')
     
     # Aplicar filtros na base
     disponibilidades_filtradas = aplicar_filtros_disponibilidades(
         disponibilidades_base, laboratorio_id, data_inicio, data_fim
     )
     
-    # Separar disponibilidades por categoria
-    disponibilidades_futuras = disponibilidades_filtradas.filter(data__gt=today)
-    disponibilidades_hoje = disponibilidades_filtradas.filter(data=today)
-    disponibilidades_passadas = disponibilidades_filtradas.filter(data__lt=today)
-    
     # Paginação
     items_per_page = 5
     
-    # Todas as disponibilidades
-    paginator_todas = Paginator(disponibilidades_filtradas, items_per_page)
-    page_number_todas = request.GET.get('page')
-    page_obj_todas = paginator_todas.get_page(page_number_todas)
-    
-    # Disponibilidades futuras
-    paginator_futuras = Paginator(disponibilidades_futuras, items_per_page)
-    page_number_futuras = request.GET.get('page_futuras')
-    page_obj_futuras = paginator_futuras.get_page(page_number_futuras)
-    
-    # Disponibilidades de hoje
-    paginator_hoje = Paginator(disponibilidades_hoje, items_per_page)
-    page_number_hoje = request.GET.get('page_hoje')
-    page_obj_hoje = paginator_hoje.get_page(page_number_hoje)
-    
-    # Disponibilidades passadas
-    paginator_passadas = Paginator(disponibilidades_passadas, items_per_page)
-    page_number_passadas = request.GET.get('page_passadas')
-    page_obj_passadas = paginator_passadas.get_page(page_number_passadas)
+    # Apenas a aba ativa é consultada; as demais são carregadas sob demanda
+    active_tab = obter_aba_ativa(request, ['todas', 'futuras', 'hoje', 'passadas'], aba)
+    context = {
+        'active_tab': active_tab,
+        'today': today,
+    }
+    if active_tab == 'futuras':
+        paginator = Paginator(disponibilidades_filtradas.filter(data__gt=today), items_per_page)
+        context['page_obj_futuras'] = paginator.get_page(request.GET.get('page_futuras'))
+    elif active_tab == 'hoje':
+        paginator = Paginator(disponibilidades_filtradas.filter(data=today), items_per_page)
+        context['page_obj_hoje'] = paginator.get_page(request.GET.get('page_hoje'))
+    elif active_tab == 'passadas':
+        paginator = Paginator(disponibilidades_filtradas.filter(data__lt=today), items_per_page)
+        context['page_obj_passadas'] = paginator.get_page(request.GET.get('page_passadas'))
+    else:
+        paginator = Paginator(disponibilidades_filtradas, items_per_page)
+        context['page_obj'] = paginator.get_page(request.GET.get('page'))
+
+    if aba:
+        return render(request, 'listar_disponibilidades_monitor_abas.html', context)
     
     laboratorios = Laboratorio.objects.filter(
         disponibilidade__monitor=request.user
     ).distinct().order_by('num_laboratorio')
     
-    context = {
-        'page_obj': page_obj_todas,
-        'page_obj_futuras': page_obj_futuras,
-        'page_obj_hoje': page_obj_hoje,
-        'page_obj_passadas': page_obj_passadas,
+    context.update({
         'laboratorios': laboratorios,
         'laboratorio_id': laboratorio_id,
         'data_inicio': data_inicio,
         'data_fim': data_fim,
-        'active_tab': active_tab,
-        'today': today,
-    }
+    })
     return render(request, 'listar_disponibilidades_monitor.html', context)
 
 def aplicar_filtros_disponibilidades(disponibilidades, laboratorio_id, data_inicio, data_fim):
@@ -1365,54 +1384,22 @@ def registrar_frequencias(request, disponibilidade_id):
     
     disponibilidade = get_object_or_404(Disponibilidade, id=disponibilidade_id)
     
-    # Verificar permissão
-    if disponibilidade.monitor != request.user:
+    # Verificar permissão (pelo id, sem buscar o monitor no banco)
+    if disponibilidade.monitor_id != request.user.id:
         messages.error(request, "Você não tem permissão para registrar frequências para esta disponibilidade.")
         return redirect('listar_disponibilidades_monitor')
     
     # Buscar todas as reservas para esta disponibilidade
-    reservas_base = Reserva.objects.filter(disponibilidade=disponibilidade).select_related('usuario')
+    reservas_base = Reserva.objects.filter(disponibilidade=disponibilidade).select_related('usuario').order_by('usuario__username', 'id')
     
     # Data atual para comparações
     today = date.today()
     
-    # Separar reservas por categoria baseada na data da disponibilidade
-    if disponibilidade.data > today:
-        # Disponibilidade futura
-        reservas_futuras = reservas_base
-        reservas_hoje = Reserva.objects.none()
-        reservas_passadas = Reserva.objects.none()
-    elif disponibilidade.data == today:
-        # Disponibilidade de hoje
-        reservas_futuras = Reserva.objects.none()
-        reservas_hoje = reservas_base
-        reservas_passadas = Reserva.objects.none()
-    else:
-        # Disponibilidade passada
-        reservas_futuras = Reserva.objects.none()
-        reservas_hoje = Reserva.objects.none()
-        reservas_passadas = reservas_base
-    
-    # Parâmetros de paginação
+    # A página lista apenas as reservas da disponibilidade; as demais "abas" (futuras,
+    # hoje, passadas) seriam a mesma lista ou vazias, então só ela é paginada
     active_tab = request.GET.get('tab', 'todas')
     items_per_page = 5
-    
-    # Paginação para cada categoria
-    paginator_todas = Paginator(reservas_base, items_per_page)
-    page_number_todas = request.GET.get('page')
-    page_obj_todas = paginator_todas.get_page(page_number_todas)
-    
-    paginator_futuras = Paginator(reservas_futuras, items_per_page)
-    page_number_futuras = request.GET.get('page_futuras')
-    page_obj_futuras = paginator_futuras.get_page(page_number_futuras)
-    
-    paginator_hoje = Paginator(reservas_hoje, items_per_page)
-    page_number_hoje = request.GET.get('page_hoje')
-    page_obj_hoje = paginator_hoje.get_page(page_number_hoje)
-    
-    paginator_passadas = Paginator(reservas_passadas, items_per_page)
-    page_number_passadas = request.GET.get('page_passadas')
-    page_obj_passadas = paginator_passadas.get_page(page_number_passadas)
+    page_number = request.GET.get('page')
     
     # Processar POST para registrar frequência
     if request.method == "POST":
@@ -1422,6 +1409,7 @@ def registrar_frequencias(request, disponibilidade_id):
         
         if status in ['P', 'F', 'N']:
             reserva.status_frequencia = status
+            reserva.frequencia_registrada_em = timezone.now()
             reserva.save()
             
             status_text = {
@@ -1432,40 +1420,76 @@ def registrar_frequencias(request, disponibilidade_id):
             
             messages.success(request, f"Frequência de {reserva.usuario.username} registrada como {status_text}.")
         
-        # Manter a aba ativa após o POST
-        active_tab = request.GET.get('tab', 'todas')
+        # Manter a aba ativa e a página após o POST
         redirect_url = f"{reverse('registrar_frequencias', args=[disponibilidade.id])}?tab={active_tab}"
-        
-        # Manter parâmetros de paginação se existirem
-        if active_tab == 'futuras' and page_number_futuras:
-            redirect_url += f"&page_futuras={page_number_futuras}"
-        elif active_tab == 'hoje' and page_number_hoje:
-            redirect_url += f"&page_hoje={page_number_hoje}"
-        elif active_tab == 'passadas' and page_number_passadas:
-            redirect_url += f"&page_passadas={page_number_passadas}"
-        elif page_number_todas:
-            redirect_url += f"&page={page_number_todas}"
+        if page_number:
+            redirect_url += f"&page={page_number}"
             
         return redirect(redirect_url)
     
+    paginator = Paginator(reservas_base, items_per_page)
+    page_obj = paginator.get_page(page_number)
+    
     context = {
         'disponibilidade': disponibilidade,
-        'page_obj': page_obj_todas,
-        'page_obj_futuras': page_obj_futuras,
-        'page_obj_hoje': page_obj_hoje,
-        'page_obj_passadas': page_obj_passadas,
+        'page_obj': page_obj,
         'active_tab': active_tab,
         'today': today,
     }
     
     return render(request, 'registrar_frequencias.html', context)
 
+# chamada offline
+@login_required
+@monitor_required
+def chamada_offline(request):
+    """Página da lista de chamada que funciona sem rede (service worker + fila local)."""
+    return render(request, 'chamada_offline.html', {'maximo_marcacoes': MAXIMO_MARCACOES})
+
+@login_required
+@monitor_required
+def lista_chamada(request):
+    """Lista de chamada do dia em JSON, versionada (ETag) para o service worker guardar."""
+    lista = lista_do_dia(request.user, timezone.localdate())
+    etag = f'"{lista["versao"]}"'
+    if etag in request.headers.get('If-None-Match', ''):
+        resposta = HttpResponse(status=304)
+    else:
+        resposta = JsonResponse(lista)
+    resposta['ETag'] = etag
+    # Pode ser guardada, mas é sempre revalidada quando há rede
+    resposta['Cache-Control'] = 'private, no-cache'
+    return resposta
+
+@login_required
+@monitor_required
+@require_POST
+@idempotente
+def sincronizar_chamada(request):
+    """Recebe em um único POST as frequências marcadas offline (ver chamada.sincronizar)."""
+    try:
+        marcacoes = json.loads(request.body)['marcacoes']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'success': False, 'error': 'Corpo da requisição inválido.'}, status=400)
+    if not isinstance(marcacoes, list) or len(marcacoes) > MAXIMO_MARCACOES:
+        return JsonResponse({
+            'success': False,
+            'error': f'Envie uma lista de até {MAXIMO_MARCACOES} marcações.'
+        }, status=400)
+    return JsonResponse({'success': True, 'resultados': sincronizar(request.user, marcacoes)})
+
+def service_worker_chamada(request):
+    # Servido em /chamada/ para que o escopo do service worker cubra a página e a lista
+    resposta = render(request, 'chamada_sw.js', content_type='application/javascript')
+    resposta['Cache-Control'] = 'no-cache'
+    return resposta
+
 # detalhes do usuario e suas reservas
 @login_required
 @admin_required
 def reservas_por_usuario(request, usuario_id):
     usuario = get_object_or_404(User, id=usuario_id)
-    reservas = Reserva.objects.filter(usuario=usuario).select_related('disponibilidade__laboratorio').order_by('-disponibilidade__data', '-disponibilidade__horario_inicio')
+    reservas = Reserva.objects.filter(usuario=usuario).select_related('disponibilidade__laboratorio', 'disponibilidade__monitor').order_by('-disponibilidade__data', '-disponibilidade__horario_inicio')
     # Filtros
     laboratorio_id = request.GET.get('laboratorio_id')
     data_inicio = request.GET.get('data_inicio')
@@ -1509,12 +1533,10 @@ def reservas_por_usuario(request, usuario_id):
 # histórico de reservas
 @login_required
 @aluno_required
-def historico_reservas(request):
-    from datetime import datetime, date
-
+def historico_reservas(request, aba=None):
     # Buscar todas as reservas do usuário logado
     reservas_base = Reserva.objects.filter(usuario=request.user).select_related(
-        'disponibilidade__laboratorio'
+        'disponibilidade__laboratorio', 'disponibilidade__monitor'
     ).order_by('-disponibilidade__data', '-disponibilidade__horario_inicio')
     
     # Filtros
@@ -1522,7 +1544,6 @@ def historico_reservas(request):
     data_fim = request.GET.get('data_fim')
     status_frequencia = request.GET.get('status_frequencia')
     laboratorio_id = request.GET.get('laboratorio_id')
-    active_tab = request.GET.get('tab', 'todas')
     
     # Aplicar filtros
     reservas = reservas_base
@@ -1545,63 +1566,80 @@ def historico_reservas(request):
     
     hoje = date.today()
 
-    reservas_canceladas = reservas.filter(status_aprovacao='C')
-
     reservas_validas = reservas.exclude(status_aprovacao='C').exclude(status_aprovacao='R')
 
-    reservas_futuras = reservas_validas.filter(disponibilidade__data__gt=hoje)
-    reservas_hoje = reservas_validas.filter(disponibilidade__data=hoje)
-    reservas_passadas = reservas_validas.filter(disponibilidade__data__lt=hoje)
-
-    # Paginação
-    paginator = Paginator(reservas_validas, 4)
-    page_obj = paginator.get_page(request.GET.get('page'))
-    
-    paginator_futuras = Paginator(reservas_futuras, 4)
-    page_obj_futuras = paginator_futuras.get_page(request.GET.get('page_futuras'))
-    
-    paginator_hoje = Paginator(reservas_hoje, 4)
-    page_obj_hoje = paginator_hoje.get_page(request.GET.get('page_hoje'))
-    
-    paginator_passadas = Paginator(reservas_passadas, 4)
-    page_obj_passadas = paginator_passadas.get_page(request.GET.get('page_passadas'))
+    # Apenas a aba ativa é consultada; as demais são carregadas sob demanda
+    active_tab = obter_aba_ativa(request, ['todas', 'futuras', 'hoje', 'passadas', 'canceladas'], aba)
+    context = {
+        'today': hoje,
+        'active_tab': active_tab,
+    }
+    if active_tab == 'futuras':
+        paginator = Paginator(reservas_validas.filter(disponibilidade__data__gt=hoje), 4)
+        context['page_obj_futuras'] = paginator.get_page(request.GET.get('page_futuras'))
+    elif active_tab == 'hoje':
+        paginator = Paginator(reservas_validas.filter(disponibilidade__data=hoje), 4)
+        context['page_obj_hoje'] = paginator.get_page(request.GET.get('page_hoje'))
+    elif active_tab == 'passadas':
+        paginator = Paginator(reservas_validas.filter(disponibilidade__data__lt=hoje), 4)
+        context['page_obj_passadas'] = paginator.get_page(request.GET.get('page_passadas'))
+    elif active_tab == 'canceladas':
+        paginator = Paginator(reservas.filter(status_aprovacao='C'), 4)
+        context['page_obj_canceladas'] = paginator.get_page(request.GET.get('page_canceladas'))
+    else:
+        paginator = Paginator(reservas_validas, 4)
+        context['page_obj'] = paginator.get_page(request.GET.get('page'))
 
-    paginator_canceladas = Paginator(reservas_canceladas, 4)
-    page_obj_canceladas = paginator_canceladas.get_page(request.GET.get('page_canceladas'))
+    if aba:
+        return render(request, 'historico_reservas_abas.html', context)
     
     laboratorios = Laboratorio.objects.all()
     
-    context = {
-        'page_obj': page_obj,
-        'page_obj_futuras': page_obj_futuras,
-        'page_obj_hoje': page_obj_hoje,
-        'page_obj_passadas': page_obj_passadas,
-        'page_obj_canceladas': page_obj_canceladas,
-
-        'reservas_canceladas': reservas_canceladas,
-
+    context.update({
         'laboratorios': laboratorios,
         'data_inicio': data_inicio,
         'data_fim': data_fim,
         'status_frequencia': status_frequencia,
         'laboratorio_id': laboratorio_id,
-        'today': hoje,
-        'active_tab': active_tab,
-    }
+    })
     
     return render(request, 'historico_reservas.html', context)
 
 
+def aplicar_filtros_reservas(reservas, usuario_id, data_inicio, data_fim, status_frequencia, laboratorio_id):
+    """Aplica filtros às reservas"""
+    if usuario_id and usuario_id != 'todos':
+        reservas = reservas.filter(usuario_id=usuario_id)
+    
+    if data_inicio:
+        try:
+            data_inicio_obj = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+            reservas = reservas.filter(disponibilidade__data__gte=data_inicio_obj)
+        except ValueError:
+            pass
+    
+    if data_fim:
+        try:
+            data_fim_obj = datetime.strptime(data_fim, '%Y-%m-%d').date()
+            reservas = reservas.filter(disponibilidade__data__lte=data_fim_obj)
+        except ValueError:
+            pass
+    
+    reservas = filter_by_status(reservas, status_frequencia)
+    
+    if laboratorio_id and laboratorio_id != 'todos':
+        reservas = reservas.filter(disponibilidade__laboratorio_id=laboratorio_id)
+    
+    return reservas
+
+
 @login_required
 @admin_required
-def historico_geral_reservas(request):
-    from datetime import date
-    from django.db.models import Q
-    
+def historico_geral_reservas(request, aba=None):
     today = date.today()
     
     reservas_base = Reserva.objects.all().select_related(
-        'usuario', 'disponibilidade__laboratorio'
+        'usuario', 'disponibilidade__laboratorio', 'disponibilidade__monitor'
     ).order_by('-disponibilidade__data', '-disponibilidade__horario_inicio')
     
     # Filtros
@@ -1610,7 +1648,6 @@ def historico_geral_reservas(request):
     data_fim = request.GET.get('data_fim')
     status_frequencia = request.GET.get('status_frequencia')
     laboratorio_id = request.GET.get('laboratorio_id')
-    active_tab = request.GET.get('tab', 'todas')
     
     # Aplicar filtros
     reservas_filtradas = aplicar_filtros_reservas(
@@ -1618,49 +1655,34 @@ def historico_geral_reservas(request):
         status_frequencia, laboratorio_id
     )
 
-    # Reservas canceladas
-    reservas_canceladas = reservas_filtradas.filter(status_aprovacao='C')
-
     reservas_validas = reservas_filtradas.exclude(status_aprovacao='C').exclude(status_aprovacao='R')
 
-    # Todas
-    reservas_todas = reservas_validas
-
-    # Futuras
-    reservas_futuras = reservas_validas.filter(disponibilidade__data__gt=today)
-
-    # Hoje
-    reservas_hoje = reservas_validas.filter(disponibilidade__data=today)
-
-    # Passadas
-    reservas_passadas = reservas_validas.filter(disponibilidade__data__lt=today)
+    # Apenas a aba ativa é consultada; as demais são carregadas sob demanda
+    active_tab = obter_aba_ativa(request, ['todas', 'futuras', 'hoje', 'passadas'], aba)
+    context = {
+        'active_tab': active_tab,
+        'today': today,
+    }
+    if active_tab == 'futuras':
+        paginator = Paginator(reservas_validas.filter(disponibilidade__data__gt=today), 5)
+        context['page_obj_futuras'] = paginator.get_page(request.GET.get('page_futuras'))
+    elif active_tab == 'hoje':
+        paginator = Paginator(reservas_validas.filter(disponibilidade__data=today), 5)
+        context['page_obj_hoje'] = paginator.get_page(request.GET.get('page_hoje'))
+    elif active_tab == 'passadas':
+        paginator = Paginator(reservas_validas.filter(disponibilidade__data__lt=today), 5)
+        context['page_obj_passadas'] = paginator.get_page(request.GET.get('page_passadas'))
+    else:
+        paginator = Paginator(reservas_validas, 5)
+        context['page_obj'] = paginator.get_page(request.GET.get('page'))
 
-    # Paginação
-    paginator_todas = Paginator(reservas_todas, 5)
-    page_obj_todas = paginator_todas.get_page(request.GET.get('page'))
-    
-    paginator_futuras = Paginator(reservas_futuras, 5)
-    page_obj_futuras = paginator_futuras.get_page(request.GET.get('page_futuras'))
-    
-    paginator_hoje = Paginator(reservas_hoje, 5)
-    page_obj_hoje = paginator_hoje.get_page(request.GET.get('page_hoje'))
-    
-    paginator_passadas = Paginator(reservas_passadas, 5)
-    page_obj_passadas = paginator_passadas.get_page(request.GET.get('page_passadas'))
-    
-    paginator_canceladas = Paginator(reservas_canceladas, 5)
-    page_obj_canceladas = paginator_canceladas.get_page(request.GET.get('page_canceladas'))
+    if aba:
+        return render(request, 'historico_geral_reservas_abas.html', context)
     
     usuarios = User.objects.all().order_by('username')
     laboratorios = Laboratorio.objects.all()
     
-    context = {
-        'page_obj': page_obj_todas,
-        'page_obj_futuras': page_obj_futuras,
-        'page_obj_hoje': page_obj_hoje,
-        'page_obj_passadas': page_obj_passadas,
-        'page_obj_canceladas': page_obj_canceladas,
-
+    context.update({
         'usuarios': usuarios,
         'laboratorios': laboratorios,
 
@@ -1669,23 +1691,24 @@ def historico_geral_reservas(request):
         'data_fim': data_fim,
         'status_frequencia': status_frequencia,
         'laboratorio_id': laboratorio_id,
-
-        'active_tab': active_tab,
-        'today': today,
-    }
+    })
     
     return render(request, 'historico_geral_reservas.html', context)
 
 
 @login_required
-def cancelar_reserva(request, reserva_id):
+@require_POST
+@idempotente
+async def cancelar_reserva(request, reserva_id):
     """Cancelar reserva — permitido para alunos, monitores, admins e superusuários"""
-    
-    reserva = get_object_or_404(Reserva, id=reserva_id)
+    # View assíncrona: as verificações usam o ORM assíncrono e só o cancelamento,
+    # que precisa de transação, roda em thread (efetivar_cancelamento)
+    usuario = await request.auser()
+    reserva = await aget_object_or_404(Reserva, id=reserva_id)
 
     # Verificar permissões
-    if request.user.perfil in ["aluno", "monitor"]:
-        if reserva.usuario != request.user:
+    if usuario.perfil in ["aluno", "monitor"]:
+        if reserva.usuario_id != usuario.id:
             return JsonResponse({'error': 'Você não tem permissão para cancelar esta reserva.'}, status=403)
 
     if reserva.status_frequencia in ['P', 'F']:
@@ -1693,17 +1716,7 @@ def cancelar_reserva(request, reserva_id):
             'error': 'Esta reserva não pode ser cancelada porque já houve registro de frequência.'
         }, status=400)
 
-    status_original = reserva.status_aprovacao
-    
-    if reserva.status_aprovacao == 'A':
-        disponibilidade = reserva.disponibilidade
-        disponibilidade.vagas += 1
-        disponibilidade.save()
-    
-    reserva.status_aprovacao = 'C'
-    reserva.save()
-
-    print(f"DEBUG: Reserva {reserva_id} cancelada. Status mudou de '{status_original}' para 'C'")
+    await sync_to_async(efetivar_cancelamento)(reserva.id, usuario)
 
     return JsonResponse({
         'success': True,
@@ -1713,6 +1726,27 @@ def cancelar_reserva(request, reserva_id):
     })
 
 
+def efetivar_cancelamento(reserva_id, usuario):
+    """Cancela a reserva em uma transação (transações ainda não funcionam no modo assíncrono)."""
+    with transaction.atomic():
+        # Relê a reserva travada para que dois cancelamentos simultâneos não devolvam a vaga duas vezes
+        reserva = Reserva.objects.select_for_update().select_related('disponibilidade').get(id=reserva_id)
+        if reserva.status_aprovacao == 'A':
+            Disponibilidade.objects.filter(id=reserva.disponibilidade_id).update(
+                vagas=F('vagas') + 1, atualizado_em=timezone.now()
+            )
+            # A vaga liberada vai para o primeiro da fila de espera, depois do commit do cancelamento
+            disponibilidade = reserva.disponibilidade
+            transaction.on_commit(lambda: promover_fila_espera(disponibilidade), robust=True)
+        
+        reserva.status_aprovacao = 'C'
+        reserva.save()
+
+        # Quem cancela a própria reserva já sabe do cancelamento
+        if reserva.usuario_id != usuario.id:
+            notificar_reserva(reserva, 'cancelada')
+
+
 # reservas pendentes
 @login_required
 @admin_required
@@ -1757,29 +1791,40 @@ def reservas_pendentes(request):
         'data_inicio': data_inicio,
         'data_fim': data_fim,
         'laboratorio_id': laboratorio_id,
+        'aprovacao_automatica': settings.APROVACAO_AUTOMATICA,
     }
     return render(request, 'reservas_pendentes.html', context)
 
 @login_required
 @admin_required
+@require_POST
+@idempotente
 def aprovar_reserva(request, reserva_id):
     reserva = get_object_or_404(Reserva, id=reserva_id, status_aprovacao='P')
     disponibilidade = reserva.disponibilidade
-    agora = timezone.localtime(timezone.now())
     
     # Não permitir aprovar reservas cujo horário já passou
-    if disponibilidade.is_passada() or disponibilidade.end_datetime() <= agora:
+    if disponibilidade.is_passada():
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({'success': False, 'error': "Não é possível aprovar esta reserva: o horário já passou."})
         messages.error(request, "Não é possível aprovar esta reserva: o horário já passou.")
         return redirect('reservas_pendentes')
     
-    if disponibilidade.vagas > 0:
-        reserva.status_aprovacao = 'A'
-        reserva.save()
-        disponibilidade.vagas -= 1
-        disponibilidade.save()
-        
+    with transaction.atomic():
+        # Relê a reserva travada: outra aprovação ou rejeição pode ter chegado antes
+        analisada = travar_pendente(reserva.id) is None
+        # Decremento condicional no banco, sem gravar um contador lido antes
+        aprovada = not analisada and ocupar_vaga(disponibilidade.id)
+        if aprovada:
+            reserva.status_aprovacao = 'A'
+            reserva.save()
+            notificar_reserva(reserva, 'aprovada')
+
+    if analisada:
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return JsonResponse({'success': False, 'error': "Esta reserva já foi aprovada ou rejeitada."})
+        messages.error(request, "Esta reserva já foi aprovada ou rejeitada.")
+    elif aprovada:
         if request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse({'success': True, 'message': f"Reserva aprovada com sucesso!"})
         messages.success(request, f"Reserva de {reserva.usuario.username} foi aprovada com sucesso!")
@@ -1796,83 +1841,231 @@ def aprovar_reserva(request, reserva_id):
 @login_required
 @admin_required
 @require_POST
+@idempotente
+def rejeitar_reserva(request, reserva_id):
+    reserva = get_object_or_404(Reserva, id=reserva_id, status_aprovacao='P')
+    with transaction.atomic():
+        # Relê a reserva travada: se já foi aprovada (por exemplo, automaticamente), a vaga é dela
+        rejeitada = travar_pendente(reserva.id) is not None
+        if rejeitada:
+            reserva.status_aprovacao = 'R'
+            reserva.save()
+            notificar_reserva(reserva, 'rejeitada')
+    if rejeitada:
+        messages.success(request, f"Reserva de {reserva.usuario.username} foi rejeitada.")
+    else:
+        messages.error(request, "Esta reserva já foi aprovada ou rejeitada.")
+    return redirect('reservas_pendentes')
+
+@login_required
+@admin_required
+@require_POST
+@idempotente
 def aprovar_multiplas_reservas(request):
-    try:
-        reservas_ids = request.POST.getlist('reservas_selecionadas[]')
-        reservas_aprovadas = 0
-        errors = []
-        
-        for reserva_id in reservas_ids:
-            try:
-                reserva = Reserva.objects.get(id=reserva_id, status_aprovacao='P')
-                disponibilidade = reserva.disponibilidade
-                agora = timezone.localtime(timezone.now())
-                
-                # Verificar se pode aprovar
-                if disponibilidade.is_passada() or disponibilidade.end_datetime() <= agora:
-                    errors.append(f"Reserva {reserva_id}: horário já passou")
-                    continue
-                
-                if disponibilidade.vagas > 0:
+    reservas_ids = request.POST.getlist('reservas_selecionadas')
+    reservas_aprovadas = 0
+    # Todas as reservas selecionadas em uma consulta; as vagas são descontadas no
+    # banco, uma a uma, enquanto houver
+    reservas = Reserva.objects.filter(
+        id__in=[reserva_id for reserva_id in reservas_ids if reserva_id.isdigit()], status_aprovacao='P'
+    ).select_related('usuario', 'disponibilidade__laboratorio').order_by('data_solicitacao')
+    
+    for reserva in reservas:
+        # Verificar se pode aprovar
+        if not reserva.disponibilidade.is_passada():
+            with transaction.atomic():
+                if travar_pendente(reserva.id) and ocupar_vaga(reserva.disponibilidade_id):
                     reserva.status_aprovacao = 'A'
                     reserva.save()
-                    disponibilidade.vagas -= 1
-                    disponibilidade.save()
+                    notificar_reserva(reserva, 'aprovada')
                     reservas_aprovadas += 1
-                else:
-                    errors.append(f"Reserva {reserva_id}: não há vagas disponíveis")
-                    
-            except Reserva.DoesNotExist:
-                errors.append(f"Reserva {reserva_id}: não encontrada ou já aprovada")
-        
-        return JsonResponse({
-            'success': True,
-            'message': f'{reservas_aprovadas} reserva(s) aprovada(s) com sucesso!',
-            'aprovadas': reservas_aprovadas,
-            'errors': errors
-        })
-        
-    except Exception as e:
-        return JsonResponse({'success': False, 'error': str(e)})
-
+    
+    if reservas_aprovadas > 0:
+        messages.success(request, f'{reservas_aprovadas} reserva(s) aprovada(s) com sucesso!')
+    else:
+        messages.error(request, 'Nenhuma reserva pôde ser aprovada.')
+    
+    return redirect('reservas_pendentes')
 
 @login_required
 @admin_required
-def rejeitar_reserva(request, reserva_id):
-    reserva = get_object_or_404(Reserva, id=reserva_id, status_aprovacao='P')
-    reserva.status_aprovacao = 'R'
-    reserva.save()
-    messages.success(request, f"Reserva de {reserva.usuario.username} foi rejeitada.")
+@require_POST
+@idempotente
+def aplicar_aprovacao_automatica(request):
+    # Reavalia toda a fila de pendentes (o mesmo que o comando aprovar_reservas)
+    if not settings.APROVACAO_AUTOMATICA:
+        messages.error(request, "A aprovação automática está desativada.")
+        return redirect('reservas_pendentes')
+    resultado = aprovar_pendentes()
+    pendentes = sum(resultado['pendentes'].values())
+    messages.success(
+        request,
+        f"{len(resultado['aprovadas'])} reserva(s) aprovada(s) automaticamente; "
+        f"{pendentes} continua(m) pendente(s) para análise.",
+    )
     return redirect('reservas_pendentes')
+# feeds de calendário (.ics): acessados por aplicativos de calendário, sem sessão,
+# autenticados pelo token assinado na URL
+def calendario_reservas(request, token):
+    usuario = usuario_do_token(token)
+    if usuario is None:
+        raise Http404
+    reservas = Reserva.objects.filter(
+        usuario=usuario, status_aprovacao='A'
+    ).select_related('disponibilidade__laboratorio', 'disponibilidade__monitor')
+
+    def formatar(reserva):
+        monitor = reserva.disponibilidade.monitor
+        return evento(
+            f'reserva-{reserva.id}@indigital',
+            reserva.disponibilidade,
+            f'Reserva no laboratório {reserva.disponibilidade.laboratorio.num_laboratorio}',
+            f'Monitor: {monitor.get_nome_completo() or monitor.email}' if monitor else '',
+        )
+
+    return responder_calendario(request, 'InDigital | Minhas reservas', reservas, 'disponibilidade', formatar)
+
+def calendario_monitor(request, token):
+    usuario = usuario_do_token(token)
+    if usuario is None:
+        raise Http404
+    disponibilidades = Disponibilidade.objects.filter(monitor=usuario).select_related('laboratorio')
+
+    def formatar(disponibilidade):
+        return evento(
+            f'monitoria-{disponibilidade.id}@indigital',
+            disponibilidade,
+            f'Monitoria no laboratório {disponibilidade.laboratorio.num_laboratorio}',
+            f'Vagas restantes: {disponibilidade.vagas}',
+        )
+
+    return responder_calendario(request, 'InDigital | Minhas monitorias', disponibilidades, None, formatar)
+
+def calendario_laboratorio(request, token, laboratorio_id):
+    if usuario_do_token(token) is None:
+        raise Http404
+    laboratorio = get_object_or_404(Laboratorio, id=laboratorio_id)
+    disponibilidades = Disponibilidade.objects.filter(laboratorio=laboratorio).select_related('laboratorio', 'monitor')
+
+    def formatar(disponibilidade):
+        monitor = disponibilidade.monitor
+        descricao = f'Vagas restantes: {disponibilidade.vagas}'
+        if monitor:
+            descricao += f'\nMonitor: {monitor.get_nome_completo() or monitor.email}'
+        return evento(
+            f'disponibilidade-{disponibilidade.id}@indigital',
+            disponibilidade,
+            f'Horário do laboratório {laboratorio.num_laboratorio}',
+            descricao,
+        )
+
+    return responder_calendario(
+        request, f'InDigital | Laboratório {laboratorio.num_laboratorio}', disponibilidades, None, formatar
+    )
+
+# relatório de utilização (lido apenas do resumo UtilizacaoDiaria)
+DIAS_SEMANA = ['Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom']
+
+def percentual(parte, total):
+    return round(100 * parte / total) if total else 0
 
 @login_required
 @admin_required
-def aprovar_multiplas_reservas(request):
-    if request.method == 'POST':
-        reservas_ids = request.POST.getlist('reservas_selecionadas')
-        reservas_aprovadas = 0
-        
-        for reserva_id in reservas_ids:
-            try:
-                reserva = Reserva.objects.get(id=reserva_id, status_aprovacao='P')
-                disponibilidade = reserva.disponibilidade
-                agora = timezone.localtime(timezone.now())
-                
-                # Verificar se pode aprovar
-                if not (disponibilidade.is_passada() or disponibilidade.end_datetime() <= agora):
-                    if disponibilidade.vagas > 0:
-                        reserva.status_aprovacao = 'A'
-                        reserva.save()
-                        disponibilidade.vagas -= 1
-                        disponibilidade.save()
-                        reservas_aprovadas += 1
-                        
-            except Reserva.DoesNotExist:
-                continue
-        
-        if reservas_aprovadas > 0:
-            messages.success(request, f'{reservas_aprovadas} reserva(s) aprovada(s) com sucesso!')
-        else:
-            messages.error(request, 'Nenhuma reserva pôde ser aprovada.')
-    
-    return redirect('reservas_pendentes')
\ No newline at end of file
+def relatorio_utilizacao(request):
+    hoje = date.today()
+    laboratorio_id = request.GET.get('laboratorio_id')
+    data_inicio = request.GET.get('data_inicio')
+    data_fim = request.GET.get('data_fim')
+
+    try:
+        inicio = datetime.strptime(data_inicio, '%Y-%m-%d').date() if data_inicio else hoje - timedelta(weeks=8)
+        fim = datetime.strptime(data_fim, '%Y-%m-%d').date() if data_fim else hoje
+    except ValueError:
+        messages.error(request, "Período inválido.")
+        inicio, fim = hoje - timedelta(weeks=8), hoje
+
+    resumo = UtilizacaoDiaria.objects.filter(data__range=(inicio, fim))
+    if laboratorio_id and laboratorio_id != 'todos':
+        resumo = resumo.filter(laboratorio_id=laboratorio_id)
+
+    somas = {
+        'horarios': Sum('horarios_ofertados'),
+        'vagas': Sum('vagas_ofertadas'),
+        'aprovadas': Sum('aprovadas'),
+        'presentes': Sum('presentes'),
+        'faltas': Sum('faltas'),
+        'canceladas': Sum('canceladas'),
+        'fila': Sum('pico_fila_espera'),
+        'pico_fila': Max('pico_fila_espera'),
+    }
+
+    def completar(item):
+        """Converte os None do aggregate em 0 e calcula as taxas."""
+        for chave in somas:
+            item[chave] = item.get(chave) or 0
+        item['ocupacao'] = percentual(item['aprovadas'], item['vagas'])
+        # Opacidade da célula no mapa de calor (texto, para não depender do separador decimal)
+        item['intensidade'] = f"{min(item['ocupacao'], 100) / 100:.2f}"
+        item['taxa_faltas'] = percentual(item['faltas'], item['presentes'] + item['faltas'])
+        # Procura: quem conseguiu vaga mais quem ficou na fila, em relação às vagas
+        item['procura'] = percentual(item['aprovadas'] + item['fila'], item['vagas'])
+        return item
+
+    totais = completar(resumo.aggregate(**somas))
+
+    # Mapa de calor: dia da semana x hora de início
+    celulas = {
+        (item['dia_semana'], item['hora']): completar(item)
+        for item in resumo.values('dia_semana', 'hora').annotate(**somas).order_by()
+    }
+    horas = sorted({hora for _, hora in celulas})
+    dias = sorted({dia for dia, _ in celulas})
+    mapa_calor = [
+        {'hora': hora, 'celulas': [celulas.get((dia, hora)) for dia in dias]}
+        for hora in horas
+    ]
+
+    por_laboratorio = [
+        completar(item)
+        for item in resumo.values('laboratorio__num_laboratorio').annotate(**somas).order_by('laboratorio__num_laboratorio')
+    ]
+    por_semana = [
+        completar(item)
+        for item in resumo.annotate(semana=TruncWeek('data')).values('semana').annotate(**somas).order_by('semana')
+    ]
+
+    context = {
+        'totais': totais,
+        'dias_semana': [DIAS_SEMANA[dia] for dia in dias],
+        'mapa_calor': mapa_calor,
+        'por_laboratorio': por_laboratorio,
+        'por_semana': por_semana,
+        'laboratorios': Laboratorio.objects.all().order_by('num_laboratorio'),
+        'laboratorio_id': laboratorio_id,
+        'data_inicio': inicio.isoformat(),
+        'data_fim': fim.isoformat(),
+        'atualizado_em': UtilizacaoDiaria.objects.aggregate(ultima=Max('calculado_em'))['ultima'],
+    }
+    return render(request, 'relatorio_utilizacao.html', context)
+
+# perfis de requisições (gerados pelo PerfilamentoMiddleware)
+@login_required
+@superusuario_required
+def perfis_requisicoes(request):
+    context = {
+        'perfis': listar_perfis(),
+        'token': token_perfilamento(request.user),
+        'parametro': PARAMETRO,
+        'cabecalho': CABECALHO,
+        'validade_horas': VALIDADE_TOKEN // 3600,
+        'maximo': settings.PERFILAMENTO_MAXIMO,
+    }
+    return render(request, 'perfis_requisicoes.html', context)
+
+@login_required
+@superusuario_required
+def baixar_perfil(request, nome, extensao):
+    caminho = arquivo_perfil(nome, extensao)
+    if caminho is None:
+        raise Http404
+    return FileResponse(open(caminho, 'rb'), as_attachment=True, filename=caminho.name)
@@ -0,0 +1,114 @@
+import json
+from collections import Counter, defaultdict
+from itertools import islice
+
+from allauth.socialaccount.models import SocialAccount
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from usuarios.models import User
+from usuarios.suap import sincronizar
+
+
+class Command(BaseCommand):
+    help = (
+        'Atualiza os dados do SUAP (campos suap_*) de todos os usuários em lote, gravando só as '
+        'colunas que mudaram. Sem arquivo, usa os dados guardados das contas SUAP; com arquivo, '
+        'lê os dados exportados do SUAP (lista JSON ou um objeto JSON por linha), encontrando o '
+        'usuário pela identificação ou pelo e-mail.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', nargs='?', help='JSON exportado do SUAP (opcional).')
+        parser.add_argument('--lote', type=int, default=500, help='Usuários lidos e gravados por vez.')
+        parser.add_argument('--simular', action='store_true', help='Só mostra o que mudaria, sem gravar.')
+
+    def handle(self, *args, **options):
+        if options['arquivo']:
+            try:
+                with open(options['arquivo'], encoding='utf-8-sig') as arquivo:
+                    registros = self.ler_arquivo(arquivo)
+                    totais = self.processar(registros, self.usuarios_do_arquivo, options)
+            except (OSError, UnicodeDecodeError, json.JSONDecodeError) as erro:
+                raise CommandError(f'Não foi possível ler o arquivo: {erro}')
+        else:
+            contas = (
+                SocialAccount.objects.filter(provider='suap').select_related('user')
+                .order_by('id').iterator(chunk_size=options['lote'])
+            )
+            registros = ((conta.user, conta.extra_data) for conta in contas)
+            totais = self.processar(registros, None, options)
+
+        resumo = (
+            f"{totais['atualizados']} usuário(s) atualizado(s), {totais['iguais']} sem mudança"
+            + (f", {totais['sem_usuario']} registro(s) sem usuário." if options['arquivo'] else '.')
+        )
+        if options['simular']:
+            self.stdout.write(self.style.WARNING(f'Simulação, nada foi gravado: {resumo}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(resumo))
+
+    def ler_arquivo(self, arquivo):
+        """Registros do arquivo: uma lista JSON inteira ou um objeto por linha (lido aos poucos)."""
+        inicio = arquivo.read(1)
+        while inicio and inicio.isspace():
+            inicio = arquivo.read(1)
+        if inicio == '[':
+            yield from json.loads(inicio + arquivo.read())
+            return
+        if inicio:
+            yield json.loads(inicio + arquivo.readline())
+        for linha in arquivo:
+            if linha.strip():
+                yield json.loads(linha)
+
+    def usuarios_do_arquivo(self, lote):
+        """Pares (usuário, dados) do lote, buscando os usuários em duas consultas."""
+        # suap_id não é único no banco: em caso de repetição, vale o usuário mais antigo
+        por_suap_id = {}
+        for user in User.objects.filter(
+            suap_id__in=[str(dados['identificacao']) for dados in lote if dados.get('identificacao')]
+        ).order_by('-id'):
+            por_suap_id[user.suap_id] = user
+        sem_suap_id = [
+            dados['email'] for dados in lote
+            if dados.get('email') and str(dados.get('identificacao')) not in por_suap_id
+        ]
+        por_email = User.objects.in_bulk(sem_suap_id, field_name='email') if sem_suap_id else {}
+        pares = []
+        for dados in lote:
+            user = por_suap_id.get(str(dados.get('identificacao'))) or por_email.get(dados.get('email'))
+            pares.append((user, dados))
+        return pares
+
+    def processar(self, registros, buscar_usuarios, options):
+        totais = Counter()
+        registros = iter(registros)
+        while lote := list(islice(registros, options['lote'])):
+            pares = buscar_usuarios(lote) if buscar_usuarios else lote
+            # O mesmo usuário pode aparecer mais de uma vez no lote: junta os campos alterados
+            alterados = defaultdict(set)
+            usuarios = {}
+            for user, dados in pares:
+                if user is None:
+                    totais['sem_usuario'] += 1
+                    continue
+                user = usuarios.setdefault(user.pk, user)
+                alterados[user.pk].update(sincronizar(user, dados, salvar=False))
+
+            # Um bulk_update por combinação de campos alterados, para não regravar colunas iguais
+            grupos = defaultdict(list)
+            for pk, user in usuarios.items():
+                if alterados[pk]:
+                    grupos[tuple(sorted(alterados[pk]))].append(user)
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f"{user.email}: {', '.join(sorted(alterados[pk]))}")
+                else:
+                    totais['iguais'] += 1
+            totais['atualizados'] += sum(len(grupo) for grupo in grupos.values())
+            if options['simular'] or not grupos:
+                continue
+            with transaction.atomic():
+                for campos, grupo in grupos.items():
+                    User.objects.bulk_update(grupo, list(campos))
+        return totais
@@ -0,0 +1,74 @@
+import logging
+
+import requests
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger('usuarios.suap')
+
+# Foto pública do aluno, usada quando o SUAP não devolve a URL da foto
+URL_FOTO_ALUNO = 'https://suap.ifrn.edu.br/media/alunos/{}.jpg'
+TIMEOUT_FOTO = 5
+
+
+def dados_suap(extra_data):
+    """Campos suap_* do usuário a partir do extra_data da conta SUAP (vazios viram None)."""
+    extra_data = extra_data or {}
+    vinculo = extra_data.get('vinculo')
+    # Na API do SUAP o vínculo pode vir como objeto; nesse caso vale o tipo_vinculo
+    if not isinstance(vinculo, str):
+        vinculo = extra_data.get('tipo_vinculo')
+    foto = extra_data.get('foto')
+    if not foto and extra_data.get('matricula'):
+        foto = URL_FOTO_ALUNO.format(extra_data['matricula'].upper())
+    nome = (
+        extra_data.get('nome_usual') or extra_data.get('nome')
+        or extra_data.get('nome_social') or extra_data.get('nome_registro')
+    )
+    identificacao = extra_data.get('identificacao')
+    return {
+        'suap_id': str(identificacao) if identificacao else None,
+        'suap_nome_completo': nome or None,
+        'suap_email': extra_data.get('email') or None,
+        'suap_vinculo': vinculo or None,
+        'suap_foto_url': foto or None,
+    }
+
+
+def sincronizar(user, extra_data, salvar=True):
+    """
+    Aplica no usuário os dados do SUAP que mudaram e retorna a lista dos campos
+    alterados. Nome e e-mail só são preenchidos quando estão vazios. Com salvar=True,
+    um usuário já gravado é salvo com update_fields só dos campos alterados; sem
+    mudanças, nada é gravado.
+    """
+    novos = dados_suap(extra_data)
+    if not user.first_name and novos['suap_nome_completo']:
+        primeiro, _, resto = novos['suap_nome_completo'].partition(' ')
+        novos['first_name'] = primeiro
+        if resto and not user.last_name:
+            novos['last_name'] = resto
+    if not user.email and novos['suap_email']:
+        novos['email'] = novos['suap_email']
+
+    alterados = [campo for campo, valor in novos.items() if getattr(user, campo) != valor]
+    for campo in alterados:
+        setattr(user, campo, novos[campo])
+    if salvar and alterados and user.pk:
+        user.save(update_fields=alterados)
+    return alterados
+
+
+def baixar_foto(user):
+    """Baixa a foto do SUAP para foto_perfil se o usuário ainda não tem foto; grava só essa coluna."""
+    if not user.suap_foto_url or user.foto_perfil:
+        return False
+    try:
+        resposta = requests.get(user.suap_foto_url, timeout=TIMEOUT_FOTO)
+    except requests.RequestException as erro:
+        logger.warning('Não foi possível baixar a foto do SUAP de %s: %s', user.pk, erro)
+        return False
+    if resposta.status_code != 200:
+        return False
+    user.foto_perfil.save(f'{user.suap_id}_foto.jpg', ContentFile(resposta.content), save=False)
+    user.save(update_fields=['foto_perfil'])
+    return True
@@ -1,3 +1,139 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from allauth.socialaccount.models import SocialAccount
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from indigital.tests import OrcamentoConsultas
+
+from .models import User
+from .suap import URL_FOTO_ALUNO, sincronizar
+
+
+class OrcamentoConsultasTests(OrcamentoConsultas, TestCase):
+    # listar_monitores fica de fora: o template listar_monitores.html não existe
+    VIEWS = [
+        ('perfil', 'aluno', [], {}, 4),
+        ('listar_usuarios', 'admin', [], {}, 4),
+    ]
+
+
+# Dados de um aluno como vêm no extra_data da conta SUAP
+DADOS_SUAP = {
+    'identificacao': '20211234',
+    'matricula': '20211234',
+    'nome_usual': 'Ana Souza',
+    'email': 'ana@escolar.ifrn.edu.br',
+    'vinculo': {'curso': 'Informática'},
+    'tipo_vinculo': 'Aluno',
+}
+
+
+class SincronizarSuapTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='ana@x.com', password='x')
+
+    def test_primeira_sincronizacao(self):
+        self.assertEqual(
+            sorted(sincronizar(self.user, DADOS_SUAP)),
+            [
+                'first_name', 'last_name', 'suap_email', 'suap_foto_url', 'suap_id', 'suap_nome_completo',
+                'suap_vinculo',
+            ],
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(
+            (self.user.suap_id, self.user.suap_vinculo, self.user.first_name, self.user.last_name),
+            ('20211234', 'Aluno', 'Ana', 'Souza'),
+        )
+        self.assertEqual(self.user.suap_foto_url, URL_FOTO_ALUNO.format('20211234'))
+        # O e-mail de login já preenchido não é trocado pelo do SUAP
+        self.assertEqual(self.user.email, 'ana@x.com')
+
+    def test_sem_mudanca_nao_grava(self):
+        sincronizar(self.user, DADOS_SUAP)
+        with self.assertNumQueries(0):
+            self.assertEqual(sincronizar(self.user, DADOS_SUAP), [])
+
+    def test_grava_so_as_colunas_alteradas(self):
+        sincronizar(self.user, DADOS_SUAP)
+        self.user.first_name = 'Outro nome local'
+
+        with CaptureQueriesContext(connection) as consultas:
+            alterados = sincronizar(self.user, dict(DADOS_SUAP, tipo_vinculo='Servidor'))
+
+        self.assertEqual(alterados, ['suap_vinculo'])
+        self.assertEqual(len(consultas), 1)
+        sql = consultas[0]['sql']
+        self.assertIn('"suap_vinculo"', sql)
+        for coluna in ('first_name', 'suap_nome_completo', 'password', 'last_login'):
+            self.assertNotIn(f'"{coluna}"', sql)
+        # O nome mudado localmente (e ainda não salvo) não foi gravado
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.suap_vinculo), ('Ana', 'Servidor'))
+
+    def test_sem_salvar(self):
+        with self.assertNumQueries(0):
+            self.assertIn('suap_id', sincronizar(self.user, DADOS_SUAP, salvar=False))
+        self.assertEqual(self.user.suap_id, '20211234')
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.suap_id)
+
+
+class SincronizarSuapComandoTests(TestCase):
+    def setUp(self):
+        pasta = tempfile.TemporaryDirectory()
+        self.addCleanup(pasta.cleanup)
+        self.arquivo = os.path.join(pasta.name, 'suap.json')
+        self.ana = User.objects.create_user(email='ana@x.com', password='x')
+        sincronizar(self.ana, DADOS_SUAP)
+        self.bia = User.objects.create_user(email='bia@x.com', password='x')
+
+    def sincronizar_arquivo(self, registros, *opcoes):
+        with open(self.arquivo, 'w', encoding='utf-8') as arquivo:
+            json.dump(registros, arquivo)
+        saida = StringIO()
+        call_command('sincronizar_suap', self.arquivo, *opcoes, stdout=saida)
+        return saida.getvalue()
+
+    def test_arquivo_com_simular_e_em_lote(self):
+        registros = [
+            # Encontrada pela identificação, com o vínculo mudado
+            dict(DADOS_SUAP, tipo_vinculo='Servidor'),
+            # Sem suap_id ainda: encontrada pelo e-mail
+            {'identificacao': 20219999, 'email': 'bia@x.com', 'nome': 'Bia Lima'},
+            {'identificacao': 1, 'email': 'ninguem@x.com'},
+        ]
+
+        saida = self.sincronizar_arquivo(registros, '--simular', '-v', '2')
+        self.assertIn('ana@x.com: suap_vinculo', saida)
+        self.assertIn('Simulação, nada foi gravado: 2 usuário(s) atualizado(s), 0 sem mudança, '
+                      '1 registro(s) sem usuário.', saida)
+        self.bia.refresh_from_db()
+        self.assertIsNone(self.bia.suap_id)
+
+        saida = self.sincronizar_arquivo(registros, '--lote', '2')
+        self.assertIn('2 usuário(s) atualizado(s), 0 sem mudança, 1 registro(s) sem usuário.', saida)
+        self.ana.refresh_from_db()
+        self.bia.refresh_from_db()
+        self.assertEqual(self.ana.suap_vinculo, 'Servidor')
+        self.assertEqual(
+            (self.bia.suap_id, self.bia.suap_nome_completo, self.bia.first_name), ('20219999', 'Bia Lima', 'Bia')
+        )
+
+        # De novo: nada muda e nada é gravado
+        saida = self.sincronizar_arquivo(registros)
+        self.assertIn('0 usuário(s) atualizado(s), 2 sem mudança, 1 registro(s) sem usuário.', saida)
 
-# Create your tests here.
+    def test_contas_suap_sem_mudanca_nao_gravam(self):
+        SocialAccount.objects.create(user=self.ana, provider='suap', uid='20211234', extra_data=DADOS_SUAP)
+        saida = StringIO()
+        # Só a leitura das contas com os usuários
+        with self.assertNumQueries(1):
+            call_command('sincronizar_suap', stdout=saida)
+        self.assertIn('0 usuário(s) atualizado(s), 1 sem mudança.', saida.getvalue())
@@ -1,6 +1,8 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from indigital.models import Reserva
+from indigital.calendario import token_calendario
+from indigital.idempotencia import idempotente
+from indigital.models import EstatisticaUsuario, Laboratorio, Reserva
 from .forms import CadastroForm, EditarPerfilForm, EditarUsuarioForm
 from django.contrib import messages
 from .models import User
@@ -10,7 +12,8 @@ from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.messages.views import SuccessMessageMixin
 from django.contrib.auth.views import PasswordChangeView as AuthPasswordChangeView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
+from django.views.decorators.http import require_POST
 
 @login_required
 def dashboard_redirect(request):
@@ -63,15 +66,26 @@ def perfil(request):
         solicitacao_pendente = Reserva.objects.filter(status_aprovacao='P').count()
         total_label = "Total de Reservas"
     else:
-        # Aluno/outro: estatísticas pessoais
-        reservas_qs = Reserva.objects.filter(usuario=usuario)
-        total_reservas = reservas_qs.count()
-        reservas_aprovadas = reservas_qs.filter(status_aprovacao='A').count()
-        solicitacao_pendente = reservas_qs.filter(status_aprovacao='P').count()
+        # Aluno/outro: estatísticas pessoais, lidas dos contadores mantidos por Reserva.save()
+        estatistica = EstatisticaUsuario.do_usuario(usuario)
+        total_reservas = estatistica.total_reservas
+        reservas_aprovadas = estatistica.aprovadas
+        solicitacao_pendente = estatistica.pendentes
         total_label = "Minhas Reservas"
         approved_label = "Minhas Reservas Aprovadas"
         pending_label = "Minhas Solicitações Pendentes"
 
+    # Endereços dos feeds .ics para assinar em aplicativos de calendário
+    token = token_calendario(usuario)
+    calendario_reservas = request.build_absolute_uri(reverse('calendario_reservas', args=[token]))
+    calendario_monitor = None
+    if usuario.perfil == 'monitor':
+        calendario_monitor = request.build_absolute_uri(reverse('calendario_monitor', args=[token]))
+    calendarios_laboratorios = [
+        (laboratorio.num_laboratorio, request.build_absolute_uri(reverse('calendario_laboratorio', args=[token, laboratorio.id])))
+        for laboratorio in Laboratorio.objects.order_by('num_laboratorio')
+    ]
+
     context = {
         'usuario': usuario,
         'total_reservas': total_reservas,
@@ -80,6 +94,9 @@ def perfil(request):
         'total_label': total_label,
         'approved_label': approved_label,
         'pending_label': pending_label,
+        'calendario_reservas': calendario_reservas,
+        'calendario_monitor': calendario_monitor,
+        'calendarios_laboratorios': calendarios_laboratorios,
     }
     return render(request, "perfil.html", context)
 
@@ -167,6 +184,8 @@ def deletar_usuario(request, usuario_id):
 
 @login_required
 @admin_required
+@require_POST
+@idempotente
 def tornar_monitor(request, usuario_id):
     usuario = get_object_or_404(User, id=usuario_id)
     usuario.perfil = 'monitor'
@@ -176,6 +195,8 @@ def tornar_monitor(request, usuario_id):
 
 @login_required
 @admin_required
+@require_POST
+@idempotente
 def remover_monitor(request, usuario_id):
     usuario = get_object_or_404(User, id=usuario_id)
     usuario.perfil = 'aluno'
@@ -215,9 +236,11 @@ class CustomPasswordChangeView(SuccessMessageMixin, AuthPasswordChangeView):
 
 @login_required
 @admin_required
+@require_POST
+@idempotente
 def ajustar_perfil(request, user_id):
     usuario = get_object_or_404(User, id=user_id)
-    novo_perfil = request.GET.get("perfil")
+    novo_perfil = request.POST.get("perfil")
 
     if novo_perfil not in ["outro", "aluno", "monitor", "administrador"]:
         messages.error(request, "Perfil inválido.")